@@ -0,0 +1,144 @@
+"""
+Compare federated search against querying sources one after another.
+
+Starts local stand-in servers for NCBI E-utilities and the Europe PMC REST
+API (with a fixed per-request latency and overlapping result sets), then
+runs the same query:
+
+- sequentially: each source searched and fetched in full, duplicates included
+- federated: sources searched concurrently, deduplicated, each article fetched once
+
+Usage:
+    python benchmarks/federated_benchmark.py [--articles N] [--overlap F] [--latency MS] [--max-results N]
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.source_handlers.europepmc_handler import EuropePMCHandler  # noqa: E402
+from core.source_handlers.federated_handler import FederatedHandler  # noqa: E402
+from core.source_handlers.ncbi_handler import NCBIHandler  # noqa: E402
+from support.rate_limiter import RateLimiter  # noqa: E402
+
+ARTICLE_XML = ('<article><front><article-meta><article-id pub-id-type="{id_type}">{pmc_id}</article-id>'
+               '</article-meta></front><body><supplementary-material><media xmlns:xlink="http://www.w3.org/1999/xlink" '
+               'xlink:href="media-{n}.pdf"/></supplementary-material></body></article>')
+
+
+def make_server(ncbi_ids, europepmc_ids, latency):
+    """Return a stand-in server answering esearch/efetch and Europe PMC search/fullTextXML"""
+    requests_seen = {"esearch": 0, "efetch": 0, "search": 0, "fullTextXML": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, body, content_type):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            endpoint = url.path.rsplit("/", 1)[-1].replace(".fcgi", "")
+            with lock:
+                requests_seen[endpoint] = requests_seen.get(endpoint, 0) + 1
+
+            if endpoint == "esearch":
+                start, count = int(params.get("retstart", 0)), int(params["retmax"])
+                result = {"count": str(len(ncbi_ids)), "idlist": [str(i) for i in ncbi_ids[start:start + count]]}
+                self.reply(json.dumps({"esearchresult": result}).encode(), "application/json")
+            elif endpoint == "efetch":
+                ids = params["id"].replace("%2C", ",").split(",")
+                articles = "".join(ARTICLE_XML.format(id_type="pmc", pmc_id=i, n=i) for i in ids)
+                self.reply(f"<pmc-articleset>{articles}</pmc-articleset>".encode(), "text/xml")
+            elif endpoint == "search":
+                start = 0 if params["cursorMark"] == "*" else int(params["cursorMark"])
+                page = europepmc_ids[start:start + int(params["pageSize"])]
+                results = [{"pmcid": f"PMC{i}", "doi": f"10.1000/{i}", "title": f"Article {i}"} for i in page]
+                body = {"hitCount": len(europepmc_ids), "nextCursorMark": str(start + len(page)),
+                        "resultList": {"result": results}}
+                self.reply(json.dumps(body).encode(), "application/json")
+            elif endpoint == "fullTextXML":
+                pmc_id = url.path.split("/")[-2]
+                body = '<?xml version="1.0"?>\n' + ARTICLE_XML.format(id_type="pmcid", pmc_id=pmc_id, n=pmc_id[3:])
+                self.reply(body.encode(), "text/xml")
+            else:
+                self.send_error(404)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, requests_seen
+
+
+def make_handlers(base_url):
+    ncbi = NCBIHandler(rate_limiter=RateLimiter(requests_per_second=1000, burst=10))
+    ncbi.base_url = f"{base_url}/eutils"
+    europepmc = EuropePMCHandler(rate_limiter=RateLimiter(requests_per_second=1000, burst=10),
+                                 base_url=f"{base_url}/europepmc")
+    return {"NCBI": ncbi, "EuropePMC": europepmc}
+
+
+def run_sequential(handlers, query, max_results):
+    links = {}
+    for handler in handlers.values():
+        article_ids = handler.search_articles(query, max_results)
+        links.update(handler.get_supplementary_materials(article_ids).items())
+    return links
+
+
+def run_federated(handlers, query, max_results):
+    federated = FederatedHandler(handlers)
+    article_ids = federated.search_articles(query, max_results)
+    return dict(federated.get_supplementary_materials(article_ids).items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark federated search against sequential sources")
+    parser.add_argument("--articles", type=int, default=600, help="Articles per source")
+    parser.add_argument("--overlap", type=float, default=0.6, help="Share of articles found by both sources")
+    parser.add_argument("--latency", type=float, default=20, help="Stand-in server latency per request (ms)")
+    parser.add_argument("--max-results", type=int, help="Unique articles wanted (default: all of them)")
+    args = parser.parse_args()
+
+    shared = int(args.articles * args.overlap)
+    ncbi_ids = list(range(1000, 1000 + args.articles))
+    europepmc_ids = ncbi_ids[:shared] + list(range(100000, 100000 + args.articles - shared))
+    max_results = args.max_results or len(set(ncbi_ids) | set(europepmc_ids))
+
+    rows = []
+    for name, run in (("sequential", run_sequential), ("federated", run_federated)):
+        server, requests_seen = make_server(ncbi_ids, europepmc_ids, args.latency / 1000)
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        started = time.perf_counter()
+        # The handlers report every batch; keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            links = run(make_handlers(base_url), "benchmark", max_results)
+        elapsed = time.perf_counter() - started
+        server.shutdown()
+        fetches = requests_seen["efetch"] + requests_seen["fullTextXML"]
+        rows.append((name, elapsed, len(links), fetches))
+
+    print(f"{args.articles} articles per source, {shared} found by both, {args.latency:.0f} ms per request, "
+          f"max_results {max_results}")
+    print(f"{'mode':<12} {'time':>8} {'articles':>9} {'fetch requests':>15}")
+    for name, elapsed, articles, fetches in rows:
+        print(f"{name:<12} {elapsed:>7.2f}s {articles:>9} {fetches:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Compare the HTTP/2 transport with the pooled HTTP/1.1 session.
+
+Starts two local stand-in servers with the same content, latency and
+connection setup cost (to model the TCP+TLS handshake of a real host): an
+HTTP/1.1 keep-alive server and an HTTP/2 server (h2c, plain TCP with prior
+knowledge). Each protocol then runs the same work through the real code:
+
+- efetch: NCBIHandler fetching the articles' XML in small batches
+- download: DataCollector downloading many small supplement files
+
+and the wall time, the connections the server accepted and the requests it
+answered are reported per protocol.
+
+Needs the optional HTTP/2 packages: pip install 'httpx[http2]'
+
+Usage:
+    python benchmarks/http2_benchmark.py [--articles N] [--files N] [--size KB] [--latency MS] [--handshake MS]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.source_handlers.ncbi_handler import NCBIHandler  # noqa: E402
+from infrastructure.data_collector import DataCollector  # noqa: E402
+from support.autotuner import ConcurrencyAutotuner  # noqa: E402
+from support.http_transport import HTTP2_AVAILABLE, HTTP2Adapter, create_session  # noqa: E402
+from support.logging_service import Logger  # noqa: E402
+from support.rate_limiter import RateLimiter  # noqa: E402
+
+ARTICLE_XML = ('<article><front><article-meta><article-id pub-id-type="pmc">{pmc_id}</article-id>'
+               '</article-meta></front><body><supplementary-material><media xmlns:xlink="http://www.w3.org/1999/xlink" '
+               'xlink:href="media-{pmc_id}.pdf"/></supplementary-material></body></article>')
+
+
+def make_app(file_size):
+    """Return a function answering a request path with (status, content type, body)"""
+    file_body = b"%PDF-1.4\n" + os.urandom(file_size)
+
+    def app(path):
+        url = urlparse(path)
+        if url.path.endswith("/efetch.fcgi"):
+            ids = parse_qs(url.query)["id"][0].replace("%2C", ",").split(",")
+            articles = "".join(ARTICLE_XML.format(pmc_id=pmc_id) for pmc_id in ids)
+            return 200, "text/xml", f"<pmc-articleset>{articles}</pmc-articleset>".encode()
+        if url.path.startswith("/files/"):
+            return 200, "application/pdf", file_body
+        return 404, "text/plain", b""
+
+    return app
+
+
+def make_http1_server(app, latency, handshake):
+    """Start a keep-alive HTTP/1.1 server; returns (server, stats)"""
+    stats = {"connections": 0, "requests": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def setup(self):
+            super().setup()
+            with lock:
+                stats["connections"] += 1
+            time.sleep(handshake)
+
+        def do_GET(self):
+            with lock:
+                stats["requests"] += 1
+            status, content_type, body = app(self.path)
+            time.sleep(latency)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def make_http2_server(app, latency, handshake):
+    """Start an h2c server (HTTP/2 with prior knowledge) in a background event loop; returns (port, stats)"""
+    from h2.config import H2Configuration
+    from h2.connection import H2Connection
+    from h2.events import ConnectionTerminated, RequestReceived, StreamReset, WindowUpdated
+    from h2.exceptions import ProtocolError, StreamClosedError
+
+    stats = {"connections": 0, "requests": 0}
+    loop = asyncio.new_event_loop()
+
+    class Protocol(asyncio.Protocol):
+        def connection_made(self, transport):
+            stats["connections"] += 1
+            self.transport = transport
+            self.ready_at = loop.time() + handshake
+            self.waiters = {}  # stream ID -> Event set when the flow control window opens
+            self.conn = H2Connection(config=H2Configuration(client_side=False, header_encoding="utf-8"))
+            self.conn.initiate_connection()
+            transport.write(self.conn.data_to_send())
+
+        def data_received(self, data):
+            try:
+                events = self.conn.receive_data(data)
+            except ProtocolError:
+                self.transport.close()
+                return
+            for event in events:
+                if isinstance(event, RequestReceived):
+                    stats["requests"] += 1
+                    path = dict(event.headers)[":path"]
+                    loop.create_task(self.respond(event.stream_id, path))
+                elif isinstance(event, (WindowUpdated, StreamReset)):
+                    for waiter in self.waiters.values():
+                        waiter.set()
+                elif isinstance(event, ConnectionTerminated):
+                    self.transport.close()
+            self.transport.write(self.conn.data_to_send())
+
+        async def respond(self, stream_id, path):
+            status, content_type, body = app(path)
+            await asyncio.sleep(max(0.0, self.ready_at - loop.time()) + latency)
+            try:
+                self.conn.send_headers(stream_id, [(":status", str(status)), ("content-type", content_type),
+                                                   ("content-length", str(len(body)))])
+                while body:
+                    window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+                    if window <= 0:
+                        waiter = self.waiters[stream_id] = asyncio.Event()
+                        self.transport.write(self.conn.data_to_send())
+                        await waiter.wait()
+                        continue
+                    self.conn.send_data(stream_id, body[:window])
+                    body = body[window:]
+                self.conn.end_stream(stream_id)
+            except StreamClosedError:
+                pass
+            finally:
+                self.waiters.pop(stream_id, None)
+            self.transport.write(self.conn.data_to_send())
+
+    server = loop.run_until_complete(loop.create_server(Protocol, "127.0.0.1", 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server.sockets[0].getsockname()[1], stats
+
+
+class _ArticlePageAdapter(requests.adapters.BaseAdapter):
+    """Answers the downloader's visit to the article page locally"""
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(b"")
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def make_session(http2):
+    session = create_session(pool_maxsize=20)
+    if http2:
+        session.mount("http://", HTTP2Adapter(max_connections=4, http1=False))
+    session.mount("https://www.ncbi.nlm.nih.gov/", _ArticlePageAdapter())
+    return session
+
+
+def run_efetch(session, base_url, articles, batch_size, concurrency):
+    handler = NCBIHandler(session=session, rate_limiter=RateLimiter(requests_per_second=10000, burst=100),
+                          autotuner=ConcurrencyAutotuner(initial=concurrency, maximum=concurrency))
+    handler.base_url = f"{base_url}/eutils"
+    handler.fetch_batch_size = batch_size
+    return len(handler.get_supplementary_materials([str(i) for i in range(1000, 1000 + articles)]))
+
+
+def run_downloads(session, base_url, files, concurrency):
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_dir = Path(output_dir)
+        for article in range(0, files, 5):
+            links = [f"{base_url}/files/s{article}_{i}.pdf" for i in range(min(5, files - article))]
+            (output_dir / f"ncbi_{article}_links.txt").write_text("\n".join(links) + "\n")
+        collector = DataCollector(session=session,
+                                  autotuner=ConcurrencyAutotuner(initial=concurrency, maximum=concurrency))
+        return collector.download_all_documents(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP/2 transport against pooled HTTP/1.1")
+    parser.add_argument("--articles", type=int, default=400, help="Articles fetched with efetch")
+    parser.add_argument("--batch-size", type=int, default=5, help="Articles per efetch request")
+    parser.add_argument("--files", type=int, default=300, help="Supplement files downloaded")
+    parser.add_argument("--size", type=int, default=16, help="Size of each file (KB)")
+    parser.add_argument("--latency", type=float, default=20, help="Server latency per request (ms)")
+    parser.add_argument("--handshake", type=float, default=30, help="Connection setup cost (ms)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight")
+    args = parser.parse_args()
+
+    if not HTTP2_AVAILABLE:
+        print("This benchmark needs the optional HTTP/2 packages: pip install 'httpx[http2]'")
+        return 1
+
+    # The downloader logs every file; keep the benchmark output readable
+    Logger.get_instance().logger.setLevel(logging.WARNING)
+    app = make_app(args.size * 1024)
+    latency, handshake = args.latency / 1000, args.handshake / 1000
+    http1_server, http1_stats = make_http1_server(app, latency, handshake)
+    http2_port, http2_stats = make_http2_server(app, latency, handshake)
+    targets = (("HTTP/1.1 pool", False, f"http://127.0.0.1:{http1_server.server_port}", http1_stats),
+               ("HTTP/2", True, f"http://127.0.0.1:{http2_port}", http2_stats))
+
+    rows = []
+    for stage in ("efetch", "download"):
+        for name, http2, base_url, stats in targets:
+            stats.update(connections=0, requests=0)
+            session = make_session(http2)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if stage == "efetch":
+                    done = run_efetch(session, base_url, args.articles, args.batch_size, args.concurrency)
+                else:
+                    done = run_downloads(session, base_url, args.files, args.concurrency)
+            elapsed = time.perf_counter() - started
+            session.close()
+            rows.append((stage, name, elapsed, done, stats["requests"], stats["connections"]))
+
+    print(f"{args.articles} articles in efetch batches of {args.batch_size}, {args.files} files of {args.size} KB, "
+          f"{args.latency:.0f} ms latency, {args.handshake:.0f} ms connection setup, "
+          f"{args.concurrency} requests in flight")
+    print(f"{'stage':<9} {'transport':<14} {'time':>8} {'done':>6} {'requests':>9} {'connections':>12}")
+    for stage, name, elapsed, done, request_count, connections in rows:
+        print(f"{stage:<9} {name:<14} {elapsed:>7.2f}s {done:>6} {request_count:>9} {connections:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
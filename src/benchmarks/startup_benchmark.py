@@ -0,0 +1,72 @@
+"""
+Measure CLI startup time.
+
+Runs short main.py invocations repeatedly in fresh interpreters and reports
+their wall time next to a bare interpreter start, plus the slowest imports of
+one invocation (from ``python -X importtime``).
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs N]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+MAIN = SRC_DIR / "main.py"
+
+INVOCATIONS = [
+    ("python -c pass", ["-c", "pass"]),
+    ("main.py --help", [str(MAIN), "--help"]),
+    ("main.py search --help", [str(MAIN), "search", "--help"]),
+    ("main.py stats", [str(MAIN), "stats"]),
+]
+
+
+def time_invocation(arguments, runs, cwd):
+    """Return the wall times (seconds) of running the interpreter with arguments"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *arguments], cwd=cwd, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def slowest_imports(arguments, cwd, count=10):
+    """Return (cumulative microseconds, module) of the slowest imports of one run"""
+    result = subprocess.run([sys.executable, "-X", "importtime", *arguments], cwd=cwd,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=False)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        imports.append((int(cumulative), module.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ResearchPaper_Peeker CLI startup time")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per invocation")
+    args = parser.parse_args()
+
+    # Run in a scratch directory so stats doesn't read (or create) real job databases
+    with tempfile.TemporaryDirectory() as cwd:
+        print(f"{'invocation':<28} {'median':>9} {'min':>9}")
+        for name, arguments in INVOCATIONS:
+            timings = time_invocation(arguments, args.runs, cwd)
+            print(f"{name:<28} {statistics.median(timings) * 1000:>7.1f}ms {min(timings) * 1000:>7.1f}ms")
+
+        print("\nSlowest imports of 'main.py stats' (cumulative):")
+        for cumulative, module in slowest_imports([str(MAIN), "stats"], cwd):
+            print(f"  {cumulative / 1000:>7.1f}ms {module}")
+
+
+if __name__ == "__main__":
+    main()
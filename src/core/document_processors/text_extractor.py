@@ -0,0 +1,296 @@
+import os
+import re
+import csv
+import time
+import zlib
+import hashlib
+import zipfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+APP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}"
+
+TEXT_EXTENSIONS = {".txt", ".md", ".fasta", ".fa", ".fastq", ".gff", ".gtf", ".bed", ".vcf", ".json", ".log"}
+TABLE_EXTENSIONS = {".csv": ",", ".tsv": "\t", ".tab": "\t"}
+MARKUP_EXTENSIONS = {".html", ".htm", ".xml"}
+
+# Files written by the downloader itself, not supplements
+SKIPPED_PREFIXES = ("error_",)
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hash a file without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _decode(data):
+    """Decode text of unknown encoding"""
+    if data[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        return data.decode("utf-16", errors="replace")
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def extract_text_file(path):
+    with open(path, "rb") as f:
+        return {"text": _decode(f.read()), "pages": None, "tables": 0}
+
+
+def extract_table_file(path, delimiter):
+    with open(path, "rb") as f:
+        text = _decode(f.read())
+    rows = list(csv.reader(text.splitlines(), delimiter=delimiter))
+    return {"text": text, "pages": None, "tables": 1, "rows": len(rows)}
+
+
+def extract_markup_file(path):
+    with open(path, "rb") as f:
+        text = _decode(f.read())
+    tables = len(re.findall(r"(?i)<table\b", text))
+    text = re.sub(r"(?is)<(script|style)\b.*?</\1>", " ", text)
+    text = re.sub(r"<[^>]+>", " ", text)
+    return {"text": re.sub(r"[ \t]+", " ", text).strip(), "pages": None, "tables": tables}
+
+
+def extract_docx(path):
+    """Extract paragraphs and table count from a .docx (Office Open XML) file"""
+    with zipfile.ZipFile(path) as archive:
+        root = ET.fromstring(archive.read("word/document.xml"))
+        pages = None
+        if "docProps/app.xml" in archive.namelist():
+            node = ET.fromstring(archive.read("docProps/app.xml")).find(f"{APP_NS}Pages")
+            if node is not None and node.text and node.text.isdigit():
+                pages = int(node.text)
+    paragraphs = ["".join(t.text or "" for t in p.iter(f"{WORD_NS}t")) for p in root.iter(f"{WORD_NS}p")]
+    return {
+        "text": "\n".join(p for p in paragraphs if p),
+        "pages": pages,
+        "tables": sum(1 for _ in root.iter(f"{WORD_NS}tbl"))
+    }
+
+
+def extract_xlsx(path):
+    """Extract cell values of every sheet of an .xlsx file; each sheet counts as a table"""
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        shared = []
+        if "xl/sharedStrings.xml" in names:
+            root = ET.fromstring(archive.read("xl/sharedStrings.xml"))
+            shared = ["".join(t.text or "" for t in si.iter(f"{SHEET_NS}t")) for si in root.iter(f"{SHEET_NS}si")]
+        sheets = sorted(n for n in names if n.startswith("xl/worksheets/sheet") and n.endswith(".xml"))
+        lines = []
+        rows = 0
+        for sheet in sheets:
+            for row in ET.fromstring(archive.read(sheet)).iter(f"{SHEET_NS}row"):
+                values = []
+                for cell in row.iter(f"{SHEET_NS}c"):
+                    value = cell.find(f"{SHEET_NS}v")
+                    if cell.get("t") == "inlineStr":
+                        values.append("".join(t.text or "" for t in cell.iter(f"{SHEET_NS}t")))
+                    elif value is not None and value.text is not None:
+                        values.append(shared[int(value.text)] if cell.get("t") == "s" else value.text)
+                lines.append("\t".join(values))
+                rows += 1
+    return {"text": "\n".join(lines), "pages": None, "tables": len(sheets), "rows": rows}
+
+
+def extract_pdf(path):
+    """
+    Extract text and page count from a PDF
+
+    Uses pypdf when it is installed; otherwise falls back to inflating the
+    content streams and collecting the strings of the text operators, which
+    is enough for the simple, text-based PDFs most supplements are.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        PdfReader = None
+
+    if PdfReader is not None:
+        reader = PdfReader(str(path))
+        return {
+            "text": "\n".join(page.extract_text() or "" for page in reader.pages),
+            "pages": len(reader.pages),
+            "tables": 0
+        }
+
+    with open(path, "rb") as f:
+        data = f.read()
+    pages = len(re.findall(rb"/Type\s*/Page\b", data))
+    fragments = []
+    for match in re.finditer(rb"stream\r?\n(.*?)\r?\nendstream", data, re.S):
+        stream = match.group(1)
+        try:
+            stream = zlib.decompress(stream)
+        except zlib.error:
+            pass
+        for block in re.findall(rb"BT(.*?)ET", stream, re.S):
+            strings = re.findall(rb"\(((?:\\.|[^\\)])*)\)", block)
+            text = b"".join(strings).decode("latin-1")
+            if text.strip():
+                fragments.append(re.sub(r"\\(.)", r"\1", text))
+    return {"text": "\n".join(fragments), "pages": pages or None, "tables": 0}
+
+
+def document_format(path):
+    """Return the format name used to pick an extractor, or None if unsupported"""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".pdf":
+        return "pdf"
+    if suffix == ".docx":
+        return "docx"
+    if suffix in (".xlsx", ".xlsm"):
+        return "xlsx"
+    if suffix in TABLE_EXTENSIONS:
+        return "table"
+    if suffix in MARKUP_EXTENSIONS:
+        return "markup"
+    if suffix in TEXT_EXTENSIONS:
+        return "text"
+    return None
+
+
+def extract_document(path):
+    """
+    Extract plain text and basic metadata from one document
+
+    Runs in a worker process, so it must stay a picklable module-level function.
+
+    Args:
+        path: Path of the document
+
+    Returns:
+        Dictionary with path, format, text, pages, tables, rows, error and
+        the CPU seconds the extraction took
+    """
+    started = time.process_time()
+    doc_format = document_format(path)
+    result = {"path": str(path), "format": doc_format, "text": "", "pages": None, "tables": 0,
+              "rows": None, "error": None}
+    try:
+        if doc_format == "pdf":
+            result.update(extract_pdf(path))
+        elif doc_format == "docx":
+            result.update(extract_docx(path))
+        elif doc_format == "xlsx":
+            result.update(extract_xlsx(path))
+        elif doc_format == "table":
+            result.update(extract_table_file(path, TABLE_EXTENSIONS[Path(path).suffix.lower()]))
+        elif doc_format == "markup":
+            result.update(extract_markup_file(path))
+        elif doc_format == "text":
+            result.update(extract_text_file(path))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.process_time() - started
+    return result
+
+
+class DocumentTextExtractor:
+    """
+    Extracts text from downloaded supplements into a TextStore.
+
+    Files are hashed first and only content not yet in the store is parsed,
+    in a process pool; results are written to the store as they complete, so
+    an interrupted run keeps everything extracted so far. Files whose size and
+    modification time are unchanged since the last run are not even rehashed.
+    Documents whose extraction failed are tried again on the next run.
+    """
+
+    def __init__(self, store, max_workers=None, similarity_index=None):
+        """
+        Args:
+            store: TextStore receiving the extracted text
+            max_workers: Number of extraction processes (optional, defaults to the CPU count)
+            similarity_index: SimilarityIndex; with skip_processing set,
+                near-duplicates of extracted documents are linked to their
+                text instead of being extracted (optional)
+        """
+        self.store = store
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.similarity_index = similarity_index
+
+    def find_documents(self, documents_dir):
+        """Find supported documents below a directory (from its manifest if it has one)"""
+        from infrastructure.document_store import DocumentStore, MANIFEST_NAME
+
+        documents_dir = Path(documents_dir)
+        if (documents_dir / MANIFEST_NAME).exists():
+            paths = (documents_dir / entry["path"] for entry in DocumentStore(documents_dir).entries())
+        else:
+            paths = (path for path in documents_dir.rglob("*") if path.is_file())
+        return sorted(
+            path for path in paths
+            if document_format(path) and not path.name.startswith(SKIPPED_PREFIXES)
+        )
+
+    def run(self, documents_dir):
+        """
+        Extract every new or changed document below a directory
+
+        Args:
+            documents_dir: Directory of downloaded supplements (searched recursively)
+
+        Returns:
+            Dictionary with the number of extracted, skipped, failed and
+            near-duplicate documents
+        """
+        stats = {"extracted": 0, "skipped": 0, "failed": 0, "duplicates": 0}
+        pending = {}  # sha256 -> (path, size, mtime) still to extract
+        for path in self.find_documents(documents_dir):
+            stat = path.stat()
+            sha256 = self.store.unchanged_file(path, stat.st_size, stat.st_mtime)
+            if sha256 is None:
+                sha256 = file_sha256(path)
+            if self.store.has_document(sha256):
+                self.store.add_file(path, sha256, stat.st_size, stat.st_mtime)
+                stats["skipped"] += 1
+            elif sha256 in pending:
+                # Same content under another name; extracted once, linked to both
+                self.store.add_file(path, sha256, stat.st_size, stat.st_mtime)
+                stats["skipped"] += 1
+            else:
+                pending[sha256] = (path, stat.st_size, stat.st_mtime)
+
+        # Near-duplicates of a document extracted before (or in this run) share its text
+        duplicates = {}  # sha256 -> (path, size, mtime, canonical sha256)
+        if self.similarity_index is not None and self.similarity_index.skip_processing:
+            for sha256, (path, size, mtime) in list(pending.items()):
+                match = self.similarity_index.check(path)
+                if match is not None and (self.store.has_document(match["sha256"]) or match["sha256"] in pending):
+                    duplicates[sha256] = pending.pop(sha256) + (match["sha256"],)
+
+        if pending:
+            print(f"Extracting text from {len(pending)} documents ({stats['skipped']} unchanged, "
+                  f"{len(duplicates)} near-duplicates)...")
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(pending))) as pool:
+                futures = {pool.submit(extract_document, path): sha256 for sha256, (path, _, _) in pending.items()}
+                for future in as_completed(futures):
+                    sha256 = futures[future]
+                    path, size, mtime = pending[sha256]
+                    result = future.result()
+                    self.store.add_document(sha256, result)
+                    self.store.add_file(path, sha256, size, mtime)
+                    if self.similarity_index is not None:
+                        self.similarity_index.record_cost(path, "text", result["seconds"])
+                    if result["error"]:
+                        stats["failed"] += 1
+                        print(f"⚠️ Could not extract {path.name}: {result['error']}")
+                    else:
+                        stats["extracted"] += 1
+
+        for path, size, mtime, canonical in duplicates.values():
+            self.store.add_file(path, canonical, size, mtime)
+            self.similarity_index.record_skip(path, "text", size)
+            stats["duplicates"] += 1
+        return stats
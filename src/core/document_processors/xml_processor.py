@@ -1 +1,139 @@
+import os
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
+from support.supplement_results import SupplementResults
+
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+PMC_BIN_URL = "https://pmc.ncbi.nlm.nih.gov/articles/instance/{pmc_id}/bin/{href}"
+# efetch marks articles of the Open Access subset with a processing instruction,
+# which ElementTree drops, so it is looked for in the raw bytes
+OPEN_ACCESS_MARKER = re.compile(rb"<\?properties\s+open_access\s*\?>")
+
+
+def parse_supplementary_links(xml_content):
+    """
+    Parse an efetch XML payload for supplementary material links.
+
+    This is a module-level function without side effects so it can be
+    shipped to worker processes of a ProcessPoolExecutor.
+
+    Args:
+        xml_content: Raw efetch response body (bytes or str)
+
+    Returns:
+        Dictionary with PMC IDs as keys and lists of links as values
+        (articles without supplementary materials are left out)
+
+    Raises:
+        ET.ParseError: If the payload is not well-formed XML
+    """
+    materials = {}
+    root = ET.fromstring(xml_content)
+
+    for article in root.findall(".//article"):
+        pmc_id = article.find(".//article-id[@pub-id-type='pmc']")
+        if pmc_id is None:
+            # Europe PMC full text uses "pmcid" with the PMC prefix
+            pmc_id = article.find(".//article-id[@pub-id-type='pmcid']")
+        if pmc_id is None or not pmc_id.text:
+            continue
+        pmc_id = pmc_id.text.strip()
+        if pmc_id.upper().startswith("PMC"):
+            pmc_id = pmc_id[3:]
+        supp_links = []
+
+        # Look for media elements with xlink:href attributes in every supplementary material node
+        for supp in article.findall(".//supplementary-material"):
+            for media in supp.findall(".//media"):
+                href = media.get(XLINK_HREF)
+                if href:
+                    supp_links.append(PMC_BIN_URL.format(pmc_id=pmc_id, href=href))
+
+        if supp_links:
+            materials[pmc_id] = supp_links
+
+    return materials
+
+
+def find_open_access(xml_content):
+    """
+    Tell which articles of an efetch payload are in PMC's Open Access subset
+
+    Args:
+        xml_content: Raw efetch response body
+
+    Returns:
+        Dictionary of PMC ID -> True if the article carries
+        <?properties open_access?>, False otherwise
+    """
+    from infrastructure.xml_archive import split_articles
+    return {pmc_id: OPEN_ACCESS_MARKER.search(article) is not None
+            for pmc_id, article in split_articles(xml_content)}
+
+
+def parse_xml_file(xml_path):
+    """
+    Parse a saved efetch XML file for supplementary material links
+
+    Args:
+        xml_path: Path to an XML file written by save_xml_responses, or a
+            compressed XmlArchive shard (.xml.gz / .xml.zst)
+
+    Returns:
+        Dictionary with PMC IDs as keys and lists of links as values
+    """
+    if str(xml_path).endswith((".xml.gz", ".xml.zst")):
+        from infrastructure.xml_archive import read_shard
+        return parse_supplementary_links(read_shard(xml_path))
+    with open(xml_path, "rb") as f:
+        return parse_supplementary_links(f.read())
+
+
+def find_xml_files(path):
+    """
+    Collect saved efetch XML files
+
+    Args:
+        path: A single XML file or a directory (searched recursively for
+            .xml files and compressed archive shards)
+
+    Returns:
+        Sorted list of XML file paths
+    """
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    return sorted(list(path.rglob("*.xml")) + list(path.rglob("shard_*.xml.gz")) + list(path.rglob("shard_*.xml.zst")))
+
+
+def replay_xml_files(xml_paths, max_workers=None):
+    """
+    Re-derive supplementary material links from saved efetch XML without network access.
+    Files are parsed in parallel in a process pool.
+
+    Args:
+        xml_paths: List of saved XML files
+        max_workers: Number of worker processes (optional, defaults to the CPU count)
+
+    Returns:
+        Tuple of (SupplementResults, list of (path, error) for files that failed to parse)
+    """
+    materials = SupplementResults()
+    failed = []
+    if not xml_paths:
+        return materials, failed
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(xml_paths))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(parse_xml_file, str(xml_path)): xml_path for xml_path in xml_paths}
+        # Merge in file order so the output is deterministic
+        for future, xml_path in futures.items():
+            try:
+                materials.update(future.result())
+            except (ET.ParseError, OSError) as e:
+                failed.append((xml_path, e))
+
+    return materials, failed
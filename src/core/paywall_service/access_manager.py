@@ -1 +1,154 @@
+import json
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
 
+# Status codes that mean the content is not accessible to us
+BLOCKED_STATUS_CODES = {401, 402, 403, 451}
+
+
+class AccessVerdict:
+    """Whether an article's files can be downloaded, and why not"""
+
+    __slots__ = ("accessible", "reason", "checked_at")
+
+    def __init__(self, accessible, reason=None, checked_at=None):
+        self.accessible = accessible
+        self.reason = reason
+        self.checked_at = checked_at if checked_at is not None else time.time()
+
+    def to_dict(self):
+        return {"accessible": self.accessible, "reason": self.reason, "checked_at": self.checked_at}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["accessible"], data.get("reason"), data.get("checked_at"))
+
+
+class AccessManager:
+    """
+    Tracks whether an article's supplementary files can be downloaded and
+    caches the verdict per article and per host for a limited time.
+
+    No separate probe is sent: the first real download of each article
+    decides. The downloader holds back an article's other files until that
+    download has finished and skips them in bulk if it was refused, instead
+    of discovering a paywall or access restriction file by file. Articles
+    known to be blocked are deferred without any request.
+    """
+
+    def __init__(self, ttl=3600, host_block_threshold=10, cache_path=None):
+        """
+        Args:
+            ttl: Seconds a cached verdict stays valid
+            host_block_threshold: Number of consecutive articles whose downloads were
+                refused after which the whole host is treated as blocked
+            cache_path: JSON file persisting verdicts between runs (optional)
+        """
+        self.ttl = ttl
+        self.host_block_threshold = host_block_threshold
+        self.cache_path = Path(cache_path) if cache_path else None
+        self._lock = threading.Lock()
+        self.article_verdicts = {}
+        self.host_verdicts = {}
+        self.host_block_counts = {}
+        self.blocked = {}  # article ID -> (url, reason) for the manual download hints
+        self._load()
+
+    def _load(self):
+        """Load persisted verdicts"""
+        if self.cache_path is None or not self.cache_path.exists():
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.article_verdicts = {k: AccessVerdict.from_dict(v) for k, v in data.get("articles", {}).items()}
+        self.host_verdicts = {k: AccessVerdict.from_dict(v) for k, v in data.get("hosts", {}).items()}
+
+    def save(self):
+        """Persist the verdicts (if a cache path was given)"""
+        if self.cache_path is None:
+            return
+        with self._lock:
+            data = {
+                "articles": {k: v.to_dict() for k, v in self.article_verdicts.items()},
+                "hosts": {k: v.to_dict() for k, v in self.host_verdicts.items()}
+            }
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.cache_path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        temp_path.replace(self.cache_path)
+
+    def _fresh(self, verdict):
+        return verdict is not None and time.time() - verdict.checked_at < self.ttl
+
+    def cached_verdict(self, article_id, url=None):
+        """
+        Return a still-valid cached verdict for the article (or its host), or None
+
+        Args:
+            article_id: Article identifier
+            url: A file URL of the article, used for the host lookup (optional)
+        """
+        with self._lock:
+            verdict = self.article_verdicts.get(str(article_id))
+            if self._fresh(verdict):
+                return verdict
+            if url:
+                host_verdict = self.host_verdicts.get(urlparse(url).netloc)
+                if self._fresh(host_verdict) and not host_verdict.accessible:
+                    return host_verdict
+        return None
+
+    def check_article(self, article_id, url):
+        """
+        Return the cached verdict of an article without sending a request
+
+        Args:
+            article_id: Article identifier
+            url: One of the article's file URLs, used for the host lookup
+
+        Returns:
+            AccessVerdict, or None if the article's first download has to decide
+        """
+        verdict = self.cached_verdict(article_id, url)
+        if verdict is not None and not verdict.accessible:
+            with self._lock:
+                self.blocked[str(article_id)] = (url, verdict.reason)
+        return verdict
+
+    def record_success(self, article_id, url):
+        """Mark an article as accessible after one of its files was downloaded"""
+        self._store(article_id, url, AccessVerdict(True))
+
+    def record_failure(self, article_id, url, reason):
+        """Mark an article as inaccessible after a real download was refused"""
+        verdict = AccessVerdict(False, reason)
+        self._store(article_id, url, verdict)
+        with self._lock:
+            self.blocked[str(article_id)] = (url, reason)
+
+    def _store(self, article_id, url, verdict):
+        """Cache an article verdict and update the host's verdict"""
+        host = urlparse(url).netloc
+        with self._lock:
+            self.article_verdicts[str(article_id)] = verdict
+            if verdict.accessible:
+                self.host_block_counts[host] = 0
+                self.host_verdicts.pop(host, None)
+            else:
+                self.host_block_counts[host] = self.host_block_counts.get(host, 0) + 1
+                if self.host_block_counts[host] >= self.host_block_threshold:
+                    self.host_verdicts[host] = AccessVerdict(False, f"{self.host_block_counts[host]} articles blocked on {host}")
+
+    def manual_download_hints(self):
+        """Return (article ID, article page URL, reason) for every blocked article"""
+        with self._lock:
+            return [
+                (article_id, f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{article_id}/", reason)
+                for article_id, (_, reason) in sorted(self.blocked.items())
+            ]
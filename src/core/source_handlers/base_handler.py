@@ -1,4 +1,19 @@
 from abc import ABC, abstractmethod
+from support.supplement_results import SupplementResults
+
+
+class IncompleteFetchError(Exception):
+    """
+    Raised by get_supplementary_materials when some batches could not be fetched or parsed
+
+    The batches that did finish are checkpointed and returned in ``results``,
+    so a resumed job only fetches the rest.
+    """
+
+    def __init__(self, message, results=None):
+        super().__init__(message)
+        self.results = results
+
 
 class BaseSourceHandler(ABC):
     @abstractmethod
@@ -12,3 +27,63 @@ class BaseSourceHandler(ABC):
     @abstractmethod
     def get_supplementary_materials(self, article_ids: list):
         pass
+    
+    def close(self):
+        """Release resources held by the handler, such as worker pools (nothing by default)"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def count_articles(self, query: str, since=None):
+        """
+        Return the number of articles matching the query, or None if the source can't tell
+
+        Incremental runs compare it with the IDs a search returned to tell
+        whether the search was cut off at max_results.
+        """
+        return None
+
+    def _known_links(self, article_ids):
+        """
+        Split off the articles whose links were parsed before (by this or another node)
+
+        The links come from the handler's cache, if it has one. While raw XML
+        is archived every article is fetched again, so the archive gets it.
+
+        Returns:
+            (SupplementResults of the known articles that have links, IDs still to fetch)
+        """
+        known = SupplementResults()
+        cache = getattr(self, "cache", None)
+        if cache is None or getattr(self, "xml_archive", None) is not None:
+            return known, article_ids
+        stored = cache.get_links(article_ids)
+        if not stored:
+            return known, article_ids
+        known.update((pmc_id, links) for pmc_id, links in stored.items() if links)
+        print(f"Reusing the supplementary links of {len(stored)} articles parsed before")
+        return known, [article_id for article_id in article_ids if str(article_id) not in stored]
+
+    def _store_links(self, batch_ids, batch_materials):
+        """Keep the links parsed for a batch in the cache; articles without supplements are stored empty"""
+        cache = getattr(self, "cache", None)
+        if cache is not None:
+            cache.set_links({pmc_id: batch_materials.get(pmc_id, []) for pmc_id in batch_ids})
+
+    def iter_search_pages(self, query: str, max_results: int = 10, since=None):
+        """
+        Yield search hits page by page, for merging with other sources
+        
+        Each hit is a dictionary with the source's "id" and, when known, the
+        article's "pmcid" (digits only) and "doi". Handlers that can page
+        through their results override this; the default runs one search.
+        """
+        if since is None:
+            article_ids = self.search_articles(query, max_results)
+        else:
+            article_ids = self.search_articles(query, max_results, since=since)
+        yield [{"id": article_id, "pmcid": article_id if str(article_id).isdigit() else None, "doi": None}
+               for article_id in article_ids]
@@ -0,0 +1,298 @@
+from .base_handler import BaseSourceHandler, IncompleteFetchError
+import datetime
+import json
+import re
+import requests
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from core.document_processors.xml_processor import parse_supplementary_links
+from infrastructure.metadata_store import MetadataStore
+from support.display_service import ProgressBoard
+from support.rate_limiter import RateLimiter
+from support.supplement_results import SupplementResults
+
+ARTICLE_START = re.compile(rb"<article[\s>]")
+
+
+class EuropePMCHandler(BaseSourceHandler):
+    """
+    Source handler for the Europe PMC REST API.
+
+    Searches are restricted to full-text articles in PMC with supplementary
+    files, so every hit has a PMC ID and its supplements resolve to the same
+    PMC links the NCBI handler finds. Supplementary links are read from the
+    article's full-text XML, one request per article.
+
+    Full text is only served for Europe PMC's open-access subset. Articles
+    without it are collected in ``missing_full_text`` so another source can
+    fetch them.
+    """
+
+    fetch_batch_size = 9
+    fetch_workers = 4  # Full-text requests sent concurrently (within the rate limit)
+
+    metadata_batch_size = 100  # PMC IDs per metadata query
+
+    def __init__(self, session=None, rate_limiter=None, cache=None, base_url=None, metadata_store=None, **_shared):
+        """
+        Args:
+            session: requests.Session whose connection pool is reused (optional)
+            rate_limiter: RateLimiter for Europe PMC requests (optional,
+                defaults to 10 requests per second); don't pass the NCBI one
+            cache: CacheManager for API responses (optional)
+            base_url: REST API root (optional, e.g. a local stand-in server)
+            metadata_store: MetadataStore receiving the identifiers and
+                bibliographic fields of every search hit (optional, kept in
+                memory without it)
+            _shared: Other shared handler resources (api_key, parse_workers), unused here
+        """
+        self.base_url = base_url or "https://www.ebi.ac.uk/europepmc/webservices/rest"
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter or RateLimiter(requests_per_second=10, burst=2)
+        self.cache = cache
+        self.xml_archive = None  # XmlArchive receiving every full-text payload (optional)
+        self.metadata_store = metadata_store if metadata_store is not None else MetadataStore(":memory:")
+        self.missing_full_text = set()  # PMC IDs whose full-text XML Europe PMC doesn't serve
+
+    def _get(self, url, params=None, timeout=30):
+        """Send a rate-limited GET request, using the cache if set"""
+        cache_key = self.cache.make_key(url, params) if self.cache is not None else None
+        # Full texts are large and not requested twice in a run; keep them out of
+        # memory, and on disk only when asked to (their parsed links are kept instead)
+        remember = not url.endswith("/fullTextXML")
+        if cache_key is not None:
+            cached = self.cache.get(cache_key, remember=remember)
+            if cached is not None:
+                return cached
+
+        self.rate_limiter.acquire()
+        response = self.session.get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+
+        if cache_key is not None:
+            # Search results change as articles are added; only keep them for this run
+            persist = not url.endswith("/search") and (remember or self.cache.store_full_text)
+            self.cache.set(cache_key, response.content, persist=persist, remember=remember)
+        return response.content
+
+    def _search_page(self, query, page_size, cursor_mark):
+        """Run one search request; returns (hits, next cursor mark)"""
+        data = json.loads(self._get(f"{self.base_url}/search", {
+            "query": query,
+            "format": "json",
+            "resultType": "lite",
+            "pageSize": page_size,
+            "cursorMark": cursor_mark
+        }))
+        return data.get("resultList", {}).get("result", []), data.get("nextCursorMark")
+
+    @staticmethod
+    def _search_query(query, since=None):
+        search_query = f'"{query}" AND IN_PMC:Y AND HAS_SUPPL:Y'
+        if since is not None:
+            if isinstance(since, datetime.datetime):
+                since = since.date()
+            search_query += f" AND FIRST_IDATE:[{since:%Y-%m-%d} TO {datetime.date.today():%Y-%m-%d}]"
+        return search_query
+
+    def iter_search_pages(self, query: str, max_results: int = 100, since=None, page_size=500):
+        """
+        Yield search hits page by page (cursor-based paging)
+
+        Returns:
+            Iterator of lists of {"id", "pmcid", "doi"} dictionaries
+        """
+        search_query = self._search_query(query, since)
+        cursor_mark = "*"
+        returned = 0
+        while returned < max_results:
+            try:
+                results, next_cursor = self._search_page(search_query, min(page_size, max_results - returned),
+                                                         cursor_mark)
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ Error fetching Europe PMC search results: {e}")
+                return
+            hits = []
+            for result in results:
+                pmcid = (result.get("pmcid") or "").upper()
+                if not pmcid.startswith("PMC"):
+                    continue
+                hits.append({"id": pmcid[3:], "pmcid": pmcid[3:], "doi": result.get("doi")})
+            self.metadata_store.upsert(self._record(result) for result in results)
+            if not results:
+                return
+            yield hits
+            returned += len(results)
+            if not next_cursor or next_cursor == cursor_mark:
+                return
+            cursor_mark = next_cursor
+
+    def search_articles(self, query: str, max_results: int = 100, since=None):
+        """
+        Search Europe PMC for articles with supplementary files
+
+        Returns:
+            List of PMC IDs (digits only, like the NCBI handler's)
+        """
+        pmc_ids = []
+        for hits in self.iter_search_pages(query, max_results, since):
+            pmc_ids.extend(hit["id"] for hit in hits)
+        return pmc_ids[:max_results]
+
+    @staticmethod
+    def _record(result):
+        """Metadata store record of a search result"""
+        return {
+            "pmcid": result.get("pmcid"),
+            "pmid": result.get("pmid"),
+            "doi": result.get("doi"),
+            "title": result.get("title"),
+            "journal": result.get("journalTitle"),
+            "pub_date": result.get("firstPublicationDate") or result.get("pubYear"),
+            "authors": [name.strip() for name in (result.get("authorString") or "").rstrip(".").split(",")
+                        if name.strip()],
+            "source": "europepmc"
+        }
+
+    def get_article_metadata(self, article_ids: list):
+        """
+        Look up titles and identifiers, from the metadata store where possible
+
+        Returns:
+            Dictionary of PMC ID -> {"title", "links", "pmid", "doi", "journal", "pub_date", "authors"}
+        """
+        missing = self.metadata_store.missing(article_ids)
+        for i in range(0, len(missing), self.metadata_batch_size):
+            batch = missing[i:i + self.metadata_batch_size]
+            try:
+                query = " OR ".join(f"PMCID:PMC{pmc_id}" for pmc_id in batch)
+                results, _ = self._search_page(query, len(batch), "*")
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ Error fetching Europe PMC metadata: {e}")
+                continue
+            self.metadata_store.upsert(self._record(result) for result in results)
+
+        records = self.metadata_store.get_many(article_ids)
+        article_info = {}
+        for pmc_id in article_ids:
+            record = records.get(pmc_id, {})
+            article_info[pmc_id] = {
+                "title": record.get("title") or "Title Not Available",
+                "links": [],
+                **{field: record.get(field) for field in ("pmid", "doi", "journal", "pub_date", "authors")}
+            }
+        return article_info
+
+    def _fetch_full_text(self, pmc_id):
+        """
+        Return the full-text XML of an article, or None if Europe PMC has none
+
+        Raises:
+            requests.exceptions.RequestException: The request failed for
+                another reason than a missing full text
+        """
+        board = ProgressBoard.get_instance()
+        stage = board.stage("full text", "articles")
+        stage.begin()
+        try:
+            payload = self._get(f"{self.base_url}/PMC{pmc_id}/fullTextXML")
+        except requests.exceptions.HTTPError as e:
+            stage.finish(failed=True)
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            raise
+        except requests.exceptions.RequestException:
+            stage.finish(failed=True)
+            raise
+        stage.finish(len(payload))
+        return payload
+
+    def _try_full_text(self, pmc_id):
+        """Return (payload, error) of an article's full-text request"""
+        try:
+            return self._fetch_full_text(pmc_id), None
+        except requests.exceptions.RequestException as e:
+            return None, e
+
+    def get_supplementary_materials(self, article_ids: list, checkpoint=None):
+        """
+        Fetch each article's full-text XML and collect supplementary material links
+
+        Args:
+            article_ids: List of PMC IDs
+            checkpoint: JobCheckpoint used to skip batches completed by an
+                earlier run and to record each finished batch (optional)
+
+        Returns:
+            SupplementResults mapping PMC IDs to lists of links
+
+        Raises:
+            IncompleteFetchError: A full-text request failed or a batch could
+                not be parsed; the other batches are checkpointed and attached
+
+        Articles without full text are added to ``missing_full_text``; the
+        batches holding them are not checkpointed, so a resumed job finds
+        them again.
+        """
+        all_materials = SupplementResults()
+        failure = None
+        if checkpoint is not None:
+            all_materials.update(checkpoint.get_results())
+
+        print(f"\nScanning {len(article_ids)} articles for supplementary materials (Europe PMC)...")
+        known, article_ids = self._known_links(article_ids)
+        all_materials.update(known)
+        board = ProgressBoard.get_instance()
+        batch_size = self.fetch_batch_size
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as pool:
+            for i in range(0, len(article_ids), batch_size):
+                batch_ids = article_ids[i:i + batch_size]
+                if checkpoint is not None and checkpoint.is_batch_done(batch_ids):
+                    if not board.live:
+                        print(f"Skipping batch {i//batch_size + 1} (already completed)")
+                    continue
+                board.stage("full text", "articles").add_total(len(batch_ids))
+
+                # Drop each payload's prolog (XML declaration, DOCTYPE) so the
+                # articles can share one wrapper document, like an efetch batch
+                articles = []
+                fetched = []
+                missing = []
+                errors = []
+                for pmc_id, (payload, error) in zip(batch_ids, pool.map(self._try_full_text, batch_ids)):
+                    match = ARTICLE_START.search(payload) if payload else None
+                    if match:
+                        articles.append(payload[match.start():])
+                        fetched.append(pmc_id)
+                    elif error is not None:
+                        errors.append(f"PMC{pmc_id}: {error}")
+                    else:
+                        missing.append(pmc_id)
+                self.missing_full_text.update(missing)
+                if missing and not board.live:
+                    print(f"⚠️ No Europe PMC full text for {len(missing)} articles: "
+                          f"{', '.join(f'PMC{pmc_id}' for pmc_id in missing)}")
+                if errors:
+                    print(f"❌ Error fetching Europe PMC full text: {'; '.join(errors)}")
+                    failure = f"Error fetching Europe PMC full text: {errors[0]}"
+                if not articles:
+                    continue
+                xml_content = b"<pmc-articleset>" + b"".join(articles) + b"</pmc-articleset>"
+                if self.xml_archive is not None:
+                    self.xml_archive.add_batch(xml_content)
+                try:
+                    batch_materials = parse_supplementary_links(xml_content)
+                except ET.ParseError as e:
+                    print(f"Error parsing XML: {e}")
+                    failure = f"Error parsing XML: {e}"
+                    continue
+                if not board.live:
+                    for pmc_id, supp_links in batch_materials.items():
+                        print(f"  Article PMC{pmc_id}: Found {len(supp_links)} supplementary materials")
+                all_materials.update(batch_materials)
+                self._store_links(fetched, batch_materials)
+                if checkpoint is not None and not errors and not missing:
+                    checkpoint.complete_batch(batch_ids, batch_materials)
+        if failure is not None:
+            raise IncompleteFetchError(failure, all_materials)
+        return all_materials
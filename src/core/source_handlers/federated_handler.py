@@ -0,0 +1,211 @@
+from .base_handler import BaseSourceHandler, IncompleteFetchError
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from support.supplement_results import SupplementResults
+
+
+class FederatedHandler(BaseSourceHandler):
+    """
+    Source handler searching several sources at once.
+
+    Every source is searched concurrently and its hits are merged as they
+    arrive, page by page. Hits are deduplicated across sources by PMC ID and
+    DOI before anything else is fetched, and the search stops as soon as
+    max_results unique articles were found. Each article is then fetched
+    only from the source that found it first; articles that source has no
+    full text for (``missing_full_text``, e.g. outside Europe PMC's
+    open-access subset) are fetched from the other sources in order.
+
+    The rest of the pipeline works on PMC IDs, so hits without one are
+    counted but left out. Articles whose source isn't known (e.g. IDs loaded
+    from a resumed job) are fetched from the first source.
+    """
+
+    fetch_batch_size = 9
+
+    def __init__(self, handlers=None, session=None, rate_limiter=None, cache=None, api_key=None, parse_workers=0,
+                 autotuner=None, metadata_store=None):
+        """
+        Args:
+            handlers: Dictionary of source name -> handler, in order of
+                preference (optional, defaults to NCBI PMC and Europe PMC)
+            session, rate_limiter, cache, api_key, parse_workers, autotuner,
+                metadata_store: Shared resources of the default handlers; the
+                rate limiter and autotuner are NCBI's, Europe PMC gets its own
+                rate limiter
+        """
+        if handlers is None:
+            from .ncbi_handler import NCBIHandler
+            from .europepmc_handler import EuropePMCHandler
+            handlers = {
+                "NCBI": NCBIHandler(session=session, rate_limiter=rate_limiter, cache=cache, api_key=api_key,
+                                    parse_workers=parse_workers, autotuner=autotuner, metadata_store=metadata_store),
+                "EuropePMC": EuropePMCHandler(session=session, cache=cache, metadata_store=metadata_store)
+            }
+        self.handlers = dict(handlers)
+        self.autotuner = autotuner
+        # NCBI's rate limiter, for the other NCBI requests of a run (e.g. OA service lookups)
+        self.rate_limiter = getattr(self.handlers.get("NCBI"), "rate_limiter", None)
+        # Metadata service of the first source that has one (NCBI's by default)
+        self.metadata = next((handler.metadata for handler in self.handlers.values()
+                              if getattr(handler, "metadata", None) is not None), None)
+        self.owners = {}        # article ID -> name of the source that found it first
+        self.search_stats = {}  # source name -> hit counts of the last search
+        self._xml_archive = None
+
+    @property
+    def xml_archive(self):
+        return self._xml_archive
+
+    @xml_archive.setter
+    def xml_archive(self, archive):
+        """Archive the fetched XML of every source that supports it"""
+        self._xml_archive = archive
+        for handler in self.handlers.values():
+            if hasattr(handler, "xml_archive"):
+                handler.xml_archive = archive
+
+    @staticmethod
+    def _keys(hit):
+        """Identifiers under which a hit is deduplicated"""
+        keys = []
+        if hit.get("pmcid"):
+            keys.append(f"pmc:{hit['pmcid']}")
+        if hit.get("doi"):
+            keys.append(f"doi:{hit['doi'].strip().lower()}")
+        return keys
+
+    def search_articles(self, query: str, max_results: int = 100, since=None):
+        """
+        Search all sources concurrently and merge their hits without duplicates
+
+        Returns:
+            List of up to max_results unique PMC IDs, in the order they arrived
+        """
+        pages = queue.Queue()
+        stop = threading.Event()
+
+        def search_source(name, handler):
+            try:
+                for page in handler.iter_search_pages(query, max_results, since=since):
+                    pages.put((name, page))
+                    if stop.is_set():
+                        break
+            except Exception as e:
+                print(f"⚠️ {name} search failed: {e}")
+            finally:
+                pages.put((name, None))
+
+        stats = {name: {"hits": 0, "unique": 0, "duplicates": 0, "without_pmcid": 0} for name in self.handlers}
+        seen = set()
+        article_ids = []
+        pool = ThreadPoolExecutor(max_workers=len(self.handlers))
+        try:
+            for name, handler in self.handlers.items():
+                pool.submit(search_source, name, handler)
+
+            active = len(self.handlers)
+            while active and len(article_ids) < max_results:
+                name, page = pages.get()
+                if page is None:
+                    active -= 1
+                    continue
+                for hit in page:
+                    stats[name]["hits"] += 1
+                    keys = self._keys(hit)
+                    if any(key in seen for key in keys):
+                        # Remember the other identifiers too (e.g. a DOI first seen with a PMC ID)
+                        seen.update(keys)
+                        stats[name]["duplicates"] += 1
+                        continue
+                    seen.update(keys)
+                    if not hit.get("pmcid"):
+                        stats[name]["without_pmcid"] += 1
+                        continue
+                    self.owners[hit["pmcid"]] = name
+                    article_ids.append(hit["pmcid"])
+                    stats[name]["unique"] += 1
+                    if len(article_ids) >= max_results:
+                        break
+        finally:
+            # Sources still paging stop after their current request
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        self.search_stats = stats
+        for name, counts in stats.items():
+            print(f"🔎 {name}: {counts['hits']} hits, {counts['unique']} unique, "
+                  f"{counts['duplicates']} duplicates")
+        print(f"Found {len(article_ids)} unique articles across {len(self.handlers)} sources")
+        return article_ids
+
+    def _group_by_source(self, article_ids):
+        """Split article IDs by the source that should fetch them"""
+        default = next(iter(self.handlers))
+        groups = {}
+        for article_id in article_ids:
+            groups.setdefault(self.owners.get(article_id, default), []).append(article_id)
+        return groups
+
+    def get_article_metadata(self, article_ids: list):
+        article_info = {}
+        for name, ids in self._group_by_source(article_ids).items():
+            article_info.update(self.handlers[name].get_article_metadata(ids))
+        return article_info
+
+    def get_supplementary_materials(self, article_ids: list, checkpoint=None):
+        """
+        Fetch each article from the source that found it, all sources in parallel
+
+        Returns:
+            SupplementResults mapping PMC IDs to lists of links
+
+        Raises:
+            IncompleteFetchError: A source failed part of its articles; the
+                results of every source are attached
+        """
+        groups = self._group_by_source(article_ids)
+
+        def fetch(name, ids):
+            """Fetch from one source, then what it couldn't serve from the next ones"""
+            materials = SupplementResults()
+            failures = []
+            tried = []
+            while ids:
+                handler = self.handlers[name]
+                tried.append(name)
+                # A failing source must not discard what the other sources fetched
+                try:
+                    if checkpoint is None:
+                        materials.update(handler.get_supplementary_materials(ids))
+                    else:
+                        materials.update(handler.get_supplementary_materials(ids, checkpoint=checkpoint))
+                except IncompleteFetchError as e:
+                    materials.update(e.results or SupplementResults())
+                    failures.append(f"{name}: {e}")
+                missing = getattr(handler, "missing_full_text", set())
+                ids = [article_id for article_id in ids if article_id in missing]
+                name = next((other for other in self.handlers if other not in tried), None)
+                if ids and name is None:
+                    print(f"⚠️ No source has the full text of {len(ids)} articles")
+                    break
+                if ids:
+                    print(f"Fetching {len(ids)} articles without {tried[-1]} full text from {name}")
+            return materials, failures
+
+        all_materials = SupplementResults()
+        failures = []
+        with ThreadPoolExecutor(max_workers=len(groups) or 1) as pool:
+            for materials, source_failures in pool.map(fetch, groups, groups.values()):
+                all_materials.update(materials)
+                failures.extend(source_failures)
+        if failures:
+            raise IncompleteFetchError("; ".join(failures), all_materials)
+        return all_materials
+
+    def close(self):
+        """Release the resources of every source"""
+        for handler in self.handlers.values():
+            if hasattr(handler, "close"):
+                handler.close()
@@ -0,0 +1,126 @@
+import json
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from infrastructure.metadata_store import MetadataStore, parse_identifier
+
+
+class MetadataService:
+    """
+    Batched article metadata and PMCID/PMID/DOI lookups against NCBI.
+
+    Answers come from the MetadataStore whenever it can give them; only the
+    IDs it doesn't know are sent to NCBI: esummary in batches of batch_size
+    (POSTed once an ID list is too long for a URL) and the PMC ID converter
+    in batches of 200, several batches at a time. Requests go through the
+    handler, so they share its session, rate limiter, cache and autotuner,
+    and every answer is written back to the store.
+    """
+
+    idconv_url = "https://www.ncbi.nlm.nih.gov/pmc/utils/idconv/v1.0/"
+    idconv_batch_size = 200  # Most IDs the ID converter accepts per request
+    post_threshold = 200     # esummary ID lists longer than this are POSTed
+
+    def __init__(self, handler, store=None, batch_size=500, workers=3):
+        """
+        Args:
+            handler: NCBIHandler sending the requests
+            store: MetadataStore holding the crosswalk (optional, defaults
+                to an in-memory store)
+            batch_size: IDs per esummary request
+            workers: Batches requested concurrently (the rate limiter still applies)
+        """
+        self.handler = handler
+        self.store = store if store is not None else MetadataStore(":memory:")
+        self.batch_size = batch_size
+        self.workers = workers
+
+    def _run_batches(self, fetch, ids, batch_size):
+        """Run fetch over batches of IDs concurrently and store the records it returns"""
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        if not batches:
+            return 0
+        stored = 0
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as pool:
+            for records in pool.map(fetch, batches):
+                stored += self.store.upsert(records)
+        return stored
+
+    def _esummary(self, pmcids):
+        """Fetch the esummary records of a batch of PMC IDs"""
+        params = {"db": "pmc", "id": ",".join(pmcids), "retmode": "json"}
+        try:
+            data = json.loads(self.handler._get(f"{self.handler.base_url}/esummary.fcgi", params,
+                                                post=len(pmcids) > self.post_threshold))
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ Error fetching article metadata: {e}")
+            return []
+
+        records = []
+        result = data.get("result", {})
+        for pmcid in result.get("uids", []):
+            doc = result.get(pmcid, {})
+            article_ids = {item.get("idtype"): item.get("value") for item in doc.get("articleids", [])}
+            records.append({
+                "pmcid": pmcid,
+                "pmid": article_ids.get("pmid") or None,
+                "doi": article_ids.get("doi"),
+                "title": doc.get("title"),
+                "journal": doc.get("fulljournalname") or doc.get("source"),
+                "pub_date": doc.get("pubdate"),
+                "authors": [author["name"] for author in doc.get("authors", []) if author.get("name")],
+                "source": "esummary"
+            })
+        return records
+
+    def _idconv(self, identifiers):
+        """Convert a batch of PMIDs or DOIs (one kind per batch) to crosswalk records"""
+        kind = parse_identifier(identifiers[0])[0]
+        params = {"ids": ",".join(parse_identifier(identifier)[1] for identifier in identifiers),
+                  "idtype": kind, "format": "json"}
+        try:
+            data = json.loads(self.handler._get(self.idconv_url, params))
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ Error converting article IDs: {e}")
+            return []
+        return [{"pmcid": record["pmcid"], "pmid": record.get("pmid"), "doi": record.get("doi"), "source": "idconv"}
+                for record in data.get("records", []) if record.get("pmcid")]
+
+    def lookup(self, pmcids):
+        """
+        Return the metadata of articles, fetching only what the store lacks
+
+        Args:
+            pmcids: List of PMC IDs
+
+        Returns:
+            Dictionary of PMC ID -> record (pmcid, pmid, doi, title, journal,
+            pub_date, authors, source); IDs NCBI doesn't know are left out
+        """
+        missing = self.store.missing(pmcids)
+        if missing:
+            stored = self._run_batches(self._esummary, missing, self.batch_size)
+            print(f"📇 Fetched metadata of {stored}/{len(missing)} articles "
+                  f"({len(pmcids) - len(missing)} already known)")
+        return self.store.get_many(pmcids)
+
+    def resolve(self, identifiers):
+        """
+        Map PMC IDs, PMIDs ("pmid:...") and DOIs to PMC IDs
+
+        Identifiers the store doesn't know are converted with the PMC ID
+        converter in batches; the answers are stored for later lookups.
+
+        Returns:
+            Dictionary of identifier -> PMC ID (unresolvable ones are left out)
+        """
+        resolved = self.store.resolve_many(identifiers)
+        unknown = {}
+        for identifier in identifiers:
+            kind = parse_identifier(identifier)[0]
+            if identifier not in resolved and kind in ("pmid", "doi"):
+                unknown.setdefault(kind, []).append(identifier)
+        for kind_ids in unknown.values():
+            self._run_batches(self._idconv, kind_ids, self.idconv_batch_size)
+        if unknown:
+            resolved.update(self.store.resolve_many([i for ids in unknown.values() for i in ids]))
+        return resolved
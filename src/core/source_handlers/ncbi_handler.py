@@ -1,130 +1,487 @@
-from .base_handler import BaseSourceHandler
+from .base_handler import BaseSourceHandler, IncompleteFetchError
+from .query_planner import DateSlicedSearch
+from .metadata_service import MetadataService
+import datetime
+import itertools
+import json
 import requests
 import xml.etree.ElementTree as ET
 import time  # Add this import
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+from core.document_processors.xml_processor import find_open_access, parse_supplementary_links
+from support.autotuner import classify_error
+from support.display_service import ProgressBoard
+from support.rate_limiter import RateLimiter
+from support.supplement_results import SupplementResults
+
 class NCBIHandler(BaseSourceHandler):
-    def __init__(self):
+    fetch_batch_size = 9  # Changed from 20 to 10
+    esearch_cap = 9999  # Largest result set requested from a single esearch call
+    search_workers = 4  # Date windows searched concurrently for large queries
+
+    def __init__(self, session=None, rate_limiter=None, cache=None, api_key=None, parse_workers=0, autotuner=None,
+                 metadata_store=None):
+        """
+        Args:
+            session: requests.Session whose connection pool is reused (optional)
+            rate_limiter: RateLimiter shared with other handlers (optional,
+                defaults to one request per second)
+            cache: CacheManager for E-utilities responses (optional)
+            api_key: NCBI API key (optional)
+            parse_workers: Number of processes parsing efetch XML while
+                fetching continues (0 parses inline on the calling thread)
+            autotuner: ConcurrencyAutotuner deciding how many efetch batches
+                are in flight at once (optional, batches are fetched one by
+                one without it)
+            metadata_store: MetadataStore caching the PMCID/PMID/DOI crosswalk
+                and bibliographic fields (optional, kept in memory without it)
+        """
         self.base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter or RateLimiter(requests_per_second=1)
+        self.cache = cache
+        self.api_key = api_key
+        self.parse_workers = parse_workers
+        self.autotuner = autotuner
+        self.metadata = MetadataService(self, metadata_store)
+        self.xml_archive = None  # XmlArchive receiving every fetched payload (optional)
+        self._parse_pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get(self, url, params, timeout=10, post=False):
+        """
+        Send a rate-limited GET request to E-utilities, using the cache if set
+
+        Args:
+            url: E-utilities URL
+            params: Request parameters
+            timeout: Request timeout in seconds
+            post: Send the parameters as a POST form instead, for ID lists
+                too long for a URL
+
+        Returns:
+            Raw response body
+        """
+        # The key leaves out the API key, so cached (and bundled) responses serve every node
+        cache_key = self.cache.make_key(url, params) if self.cache is not None else None
+        # efetch bodies are large and not requested twice in a run; keep them out of
+        # memory, and on disk only when asked to (their parsed links are kept instead)
+        remember = not url.endswith("/efetch.fcgi")
+        if cache_key is not None:
+            cached = self.cache.get(cache_key, remember=remember)
+            if cached is not None:
+                return cached
+        if self.api_key:
+            params = dict(params, api_key=self.api_key)
+
+        if self.autotuner is None:
+            self.rate_limiter.acquire()
+            response = self._send(url, params, timeout, post)
+            response.raise_for_status()
+        else:
+            response = self._get_tuned(url, params, timeout, post)
+
+        if cache_key is not None:
+            # Search results change as articles are added; only keep them for this run
+            persist = not url.endswith("/esearch.fcgi") and (remember or self.cache.store_full_text)
+            self.cache.set(cache_key, response.content, persist=persist, remember=remember)
+        return response.content
         
-    def search_articles(self, query: str, max_results: int = 100):
+    def _send(self, url, params, timeout, post):
+        if post:
+            return self.session.post(url, data=params, timeout=timeout)
+        return self.session.get(url, params=params, timeout=timeout)
+
+    def _get_tuned(self, url, params, timeout, post=False):
+        """Send a request within the autotuner's concurrency limit of the host and report how it went"""
+        host = urlparse(url).hostname or "unknown"
+        self.autotuner.acquire(host)
+        started = time.monotonic()
         try:
+            self.rate_limiter.acquire()
+            started = time.monotonic()
+            response = self._send(url, params, timeout, post)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            error, retry_after = classify_error(e)
+            self.autotuner.release(host, time.monotonic() - started, error=error, retry_after=retry_after)
+            raise
+        except BaseException:
+            self.autotuner.release(host, time.monotonic() - started)
+            raise
+        self.autotuner.release(host, time.monotonic() - started, len(response.content))
+        return response
+
+    def esearch(self, query: str, retmax: int, retstart: int = 0, **extra_params):
+        """
+        Run a single esearch request
+
+        Args:
+            query: Search query
+            retmax: Maximum number of IDs to return (0 only returns the count)
+            retstart: Index of the first ID to return
+            extra_params: Additional esearch parameters (e.g. datetype, mindate, maxdate)
+
+        Returns:
+            Tuple of (total hit count, list of IDs)
+        """
+        search_url = f"{self.base_url}/esearch.fcgi"
+        search_params = {
+            "db": "pmc",
+            "term": f'"{query}" AND "supplementary material"',
+            "retmode": "json",
+            "retmax": retmax
+        }
+        if retstart:
+            search_params["retstart"] = retstart
+        search_params.update(extra_params)
+
+        data = json.loads(self._get(search_url, search_params))
+        result = data.get("esearchresult", {})
+        return int(result.get("count", 0)), result.get("idlist", [])
+
+    def search_articles(self, query: str, max_results: int = 100, since=None):
+        """
+        Search PMC for articles matching the query
+
+        Args:
+            query: Search query
+            max_results: Maximum number of IDs to return
+            since: Only return articles added or modified on or after this
+                date (datetime.date or datetime.datetime, optional)
+
+        Returns:
+            List of PMC IDs
+        """
+        try:
+            if isinstance(since, datetime.datetime):
+                since = since.date()
+            date_params = {}
+            if since is not None:
+                date_params = {
+                    "datetype": "mdat",
+                    "mindate": since.strftime("%Y/%m/%d"),
+                    "maxdate": datetime.date.today().strftime("%Y/%m/%d")
+                }
+
+            # Too many results for one request: split the search into date windows
+            if max_results > self.esearch_cap:
+                planner = DateSlicedSearch(self, cap=self.esearch_cap, max_workers=self.search_workers,
+                                           start_date=since, datetype="mdat" if since else "pdat")
+                return planner.search(query, max_results)
+
             search_url = f"{self.base_url}/esearch.fcgi"
             search_params = {
                 "db": "pmc",
                 "term": f'"{query}" AND "supplementary material"',
                 "retmode": "json",
-                "retmax": max_results
+                "retmax": max_results,
+                **date_params
             }
             full_url = requests.Request('GET', search_url, params=search_params).prepare().url
             print(f"\nSearch Query URL: {full_url}")
             
-            response = requests.get(search_url, params=search_params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            pmc_ids = data.get("esearchresult", {}).get("idlist", [])
+            _, pmc_ids = self.esearch(query, max_results, **date_params)
             return pmc_ids
         except requests.exceptions.RequestException as e:
             print(f"⚠️ Error fetching search results: {e}")
             return []
+
+    def count_articles(self, query: str, since=None):
+        """Return the number of articles matching the query (added or updated since a date), or None on errors"""
+        if isinstance(since, datetime.datetime):
+            since = since.date()
+        date_params = {}
+        if since is not None:
+            date_params = {
+                "datetype": "mdat",
+                "mindate": since.strftime("%Y/%m/%d"),
+                "maxdate": datetime.date.today().strftime("%Y/%m/%d")
+            }
+        try:
+            count, _ = self.esearch(query, 0, **date_params)
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ Error counting search results: {e}")
+            return None
+        return count
+
+    def iter_search_pages(self, query: str, max_results: int = 100, since=None, page_size=500):
+        """
+        Yield the search hits in esearch pages of page_size IDs
+
+        Lets a caller merging several sources stop after the first pages.
+        PMC esearch returns no DOIs; hits carry the DOIs the metadata store
+        already knows and are otherwise identified by PMC ID only.
+        """
+        if max_results > self.esearch_cap:
+            # Date-sliced searches aren't paged; fall back to one large search
+            yield from super().iter_search_pages(query, max_results, since)
+            return
+
+        date_params = {}
+        if since is not None:
+            if isinstance(since, datetime.datetime):
+                since = since.date()
+            date_params = {
+                "datetype": "mdat",
+                "mindate": since.strftime("%Y/%m/%d"),
+                "maxdate": datetime.date.today().strftime("%Y/%m/%d")
+            }
+        retstart = 0
+        while retstart < max_results:
+            try:
+                count, pmc_ids = self.esearch(query, min(page_size, max_results - retstart), retstart, **date_params)
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ Error fetching search results: {e}")
+                return
+            if not pmc_ids:
+                return
+            known = self.metadata.store.get_many(pmc_ids)
+            yield [{"id": pmc_id, "pmcid": pmc_id, "doi": known.get(pmc_id, {}).get("doi")} for pmc_id in pmc_ids]
+            retstart += len(pmc_ids)
+            if retstart >= count:
+                return
+
     def get_article_metadata(self, article_ids: list):
+        """
+        Look up titles and identifiers, from the metadata store where possible
+
+        Returns:
+            Dictionary of PMC ID -> {"title", "links", "pmid", "doi", "journal", "pub_date", "authors"}
+        """
+        records = self.metadata.lookup(article_ids)
+        article_info = {}
+        for pmc_id in article_ids:
+            record = records.get(pmc_id, {})
+            article_info[pmc_id] = {
+                "title": record.get("title") or "Title Not Available",
+                "links": [],
+                **{field: record.get(field) for field in ("pmid", "doi", "journal", "pub_date", "authors")}
+            }
+        return article_info
+
+    def get_supplementary_materials(self, article_ids: list, checkpoint=None):
+        """
+        Fetch full-text XML in batches and collect supplementary material links
+
+        When the handler was created with ``parse_workers`` > 0, the raw efetch
+        payloads are parsed in a process pool while the next batches are
+        being fetched.
+
+        Args:
+            article_ids: List of PMC IDs
+            checkpoint: JobCheckpoint used to skip batches completed by an
+                earlier run and to record each finished batch (optional)
+
+        Returns:
+            SupplementResults mapping PMC IDs to lists of links
+
+        Raises:
+            IncompleteFetchError: A batch could not be fetched or parsed; the
+                batches finished before it are checkpointed and attached
+        """
+        fetch_url = f"{self.base_url}/efetch.fcgi"
+        batch_size = self.fetch_batch_size
+        all_materials = SupplementResults()
+        total_processed = 0
+
+        # Results of batches finished in a previous run of this job
+        if checkpoint is not None:
+            all_materials.update(checkpoint.get_results())
+
+        print(f"\nScanning {len(article_ids)} articles for supplementary materials...")
+        known, article_ids = self._known_links(article_ids)
+        all_materials.update(known)
+
+        board = ProgressBoard.get_instance()
+        batches = []
+        for i in range(0, len(article_ids), batch_size):
+            batch_ids = article_ids[i:i + batch_size]
+            total_processed += len(batch_ids)
+            if checkpoint is not None and checkpoint.is_batch_done(batch_ids):
+                if not board.live:
+                    print(f"Skipping batch {i//batch_size + 1} (already completed)")
+                continue
+            batches.append((i//batch_size + 1, batch_ids, total_processed))
+        board.stage("efetch", "batches").add_total(len(batches))
+
+        parse_pool = self._get_parse_pool()
+        pending = {}  # future -> batch IDs
+        failure = None
+
         try:
-            summary_url = f"{self.base_url}/esummary.fcgi"
-            summary_params = {
+            for batch_ids, xml_content, error in self._fetch_batches(fetch_url, batches, len(article_ids)):
+                if error is not None:
+                    print(f"Error fetching supplementary materials: {error}")
+                    failure = f"Error fetching supplementary materials: {error}"
+                    break
+
+                if self.xml_archive is not None:
+                    self.xml_archive.add_batch(xml_content)
+                # Downloads only look up OA packages of Open Access articles
+                self.metadata.store.upsert({"pmcid": pmc_id, "open_access": open_access}
+                                           for pmc_id, open_access in find_open_access(xml_content).items())
+
+                if parse_pool is None:
+                    try:
+                        batch_materials = self._parse_supplementary_links(xml_content)
+                    except ET.ParseError as e:
+                        print(f"Error parsing XML: {e}")
+                        failure = f"Error parsing XML: {e}"
+                        break
+                    self._record_batch(batch_ids, batch_materials, all_materials, checkpoint)
+                    continue
+
+                # Hand the payload to a parse worker and keep fetching; limit the
+                # number of payloads held in memory while workers catch up
+                pending[parse_pool.submit(parse_supplementary_links, xml_content)] = batch_ids
+                if len(pending) >= 2 * self.parse_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    if not self._collect_parsed(done, pending, all_materials, checkpoint):
+                        failure = "Error parsing XML"
+                        break
+
+            if pending and not self._collect_parsed(list(pending), pending, all_materials, checkpoint):
+                failure = failure or "Error parsing XML"
+        finally:
+            for future in pending:
+                future.cancel()
+
+        if failure is not None:
+            raise IncompleteFetchError(failure, all_materials)
+        return all_materials
+
+    def _fetch_batches(self, fetch_url, batches, total):
+        """
+        Fetch efetch batches and return them in order
+
+        Without an autotuner each batch is fetched once the previous one was
+        handled. With one, up to its maximum concurrency of batches are
+        requested ahead and its per-host limit decides how many of them are
+        actually in flight.
+
+        Args:
+            fetch_url: efetch URL
+            batches: List of (batch number, batch IDs, articles processed so far)
+            total: Number of articles in the run, for the progress messages
+
+        Returns:
+            Iterator of (batch IDs, response body, RequestException or None)
+        """
+        board = ProgressBoard.get_instance()
+        stage = board.stage("efetch", "batches")
+
+        def fetch(batch_number, batch_ids, processed):
+            fetch_params = {
                 "db": "pmc",
-                "id": ",".join(article_ids),
-                "retmode": "json"
+                "id": '%2C'.join(batch_ids),
+                "retmode": "xml"
             }
-            full_url = requests.Request('GET', summary_url, params=summary_params).prepare().url
-            print(f"Metadata Query URL: {full_url}")
-            
-            response = requests.get(summary_url, params=summary_params, timeout=10)
-            response.raise_for_status()
-            summary_data = response.json()
-            
-            article_info = {}
-            for pmc_id in article_ids:
-                doc = summary_data.get("result", {}).get(pmc_id, {})
-                title = doc.get("title", "Title Not Available")
-                article_info[pmc_id] = {"title": title, "links": []}
-            return article_info
-        except requests.exceptions.RequestException as e:
-            print(f"⚠️ Error fetching article metadata: {e}")
-            return {}
+            if not board.live:
+                print(f"\nProcessing batch {batch_number} ({processed}/{total} articles)...")
+                full_url = requests.Request('GET', fetch_url, params=fetch_params).prepare().url
+                print(f"Fetch Query URL (Batch {batch_number}): {full_url}")
+            stage.begin()
+            try:
+                xml_content = self._get(fetch_url, fetch_params)
+            except requests.exceptions.RequestException:
+                stage.finish(failed=True)
+                raise
+            stage.finish(len(xml_content))
+            return xml_content
 
-    def get_supplementary_materials(self, article_ids: list):
+        if self.autotuner is None:
+            for batch in batches:
+                try:
+                    yield batch[1], fetch(*batch), None
+                except requests.exceptions.RequestException as e:
+                    yield batch[1], None, e
+            return
+
+        pool = ThreadPoolExecutor(max_workers=self.autotuner.maximum)
         try:
-            fetch_url = f"{self.base_url}/efetch.fcgi"
-            batch_size = 9  # Changed from 20 to 10
-            all_materials = {}
-            total_processed = 0
+            queued = iter(batches)
+            ahead = [(batch[1], pool.submit(fetch, *batch)) for batch in itertools.islice(queued, self.autotuner.maximum)]
+            while ahead:
+                batch_ids, future = ahead.pop(0)
+                next_batch = next(queued, None)
+                if next_batch is not None:
+                    ahead.append((next_batch[1], pool.submit(fetch, *next_batch)))
+                try:
+                    yield batch_ids, future.result(), None
+                except requests.exceptions.RequestException as e:
+                    yield batch_ids, None, e
+        finally:
+            # Batches requested ahead are dropped when the caller stops early
+            pool.shutdown(wait=False, cancel_futures=True)
 
-            print(f"\nScanning {len(article_ids)} articles for supplementary materials...")
-            
-            for i in range(0, len(article_ids), batch_size):
-                batch_ids = article_ids[i:i + batch_size]
-                total_processed += len(batch_ids)
-                
-                print(f"\nProcessing batch {i//batch_size + 1} ({total_processed}/{len(article_ids)} articles)...")
-                
-                fetch_params = {
-                    "db": "pmc",
-                    "id": '%2C'.join(batch_ids),
-                    "retmode": "xml"
-                }
-                full_url = requests.Request('GET', fetch_url, params=fetch_params).prepare().url
-                print(f"Fetch Query URL (Batch {i//batch_size + 1}): {full_url}")
-                
-                if i > 0:
-                    time.sleep(1)  # Rate limiting
-                    
-                response = requests.get(fetch_url, params=fetch_params, timeout=10)
-                response.raise_for_status()
-                
-                # Parse XML for supplementary material links
-                root = ET.fromstring(response.content)
-                
-                # Define and register namespaces
-                namespaces = {
-                    'xlink': 'http://www.w3.org/1999/xlink'
-                }
-                ET.register_namespace('xlink', 'http://www.w3.org/1999/xlink')
-                
-                for article in root.findall(".//article"):
-                    pmc_id = article.find(".//article-id[@pub-id-type='pmc']")
-                    if pmc_id is not None:
-                        pmc_id = pmc_id.text
-                        supp_links = []
-                        
-                        # Find all supplementary material nodes
-                        supp_materials = article.findall(".//supplementary-material")
-                        
-                        for supp in supp_materials:
-                            # Look for media elements with xlink:href attributes
-                            media_elements = supp.findall(".//media")
-                            for media in media_elements:
-                                href = media.get("{http://www.w3.org/1999/xlink}href")
-                                if href:
-                                    # Construct the full URL for downloading
-                                    full_download_url = f"https://pmc.ncbi.nlm.nih.gov/articles/instance/{pmc_id}/bin/{href}"
-                                    supp_links.append(full_download_url)
-                                    print(f"Found supplementary material: {full_download_url}")
-                        
-                        if supp_links:
-                            all_materials[pmc_id] = supp_links
-                            print(f"  Article PMC{pmc_id}: Found {len(supp_links)} supplementary materials")
-                            
-                        # Add a sleep between batches
-                        if i < len(article_ids) - batch_size:
-                            time.sleep(1)
-                            
-                return all_materials
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching supplementary materials: {e}")
-            return {}
-        except ET.ParseError as e:
-            print(f"Error parsing XML: {e}")
-            return {}
+    def _get_parse_pool(self):
+        """Return the shared parse process pool, creating it on first use"""
+        if self.parse_workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+            return self._parse_pool
+
+    def close(self):
+        """Shut down the parse process pool"""
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(cancel_futures=True)
+            self._parse_pool = None
+
+    def _collect_parsed(self, futures, pending, all_materials, checkpoint):
+        """
+        Collect finished parse futures into the results
+
+        Returns:
+            False if a payload could not be parsed, True otherwise
+        """
+        ok = True
+        for future in futures:
+            batch_ids = pending.pop(future)
+            try:
+                batch_materials = future.result()
+            except ET.ParseError as e:
+                print(f"Error parsing XML: {e}")
+                ok = False
+                continue
+            self._report_materials(batch_materials)
+            self._record_batch(batch_ids, batch_materials, all_materials, checkpoint)
+        return ok
+
+    def _record_batch(self, batch_ids, batch_materials, all_materials, checkpoint):
+        """Merge a parsed batch into the results, keep its links in the cache and checkpoint it"""
+        all_materials.update(batch_materials)
+        self._store_links(batch_ids, batch_materials)
+        if checkpoint is not None:
+            checkpoint.complete_batch(batch_ids, batch_materials)
+
+    @staticmethod
+    def _report_materials(materials):
+        """Print the supplementary materials found in a batch (unless the live progress view is shown)"""
+        if ProgressBoard.get_instance().live:
+            return
+        for pmc_id, supp_links in materials.items():
+            for full_download_url in supp_links:
+                print(f"Found supplementary material: {full_download_url}")
+            print(f"  Article PMC{pmc_id}: Found {len(supp_links)} supplementary materials")
+
+    def _parse_supplementary_links(self, xml_content):
+        """
+        Parse an efetch XML payload for supplementary material links
+
+        Args:
+            xml_content: Raw efetch response body
+
+        Returns:
+            Dictionary with PMC IDs as keys and lists of links as values
+        """
+        materials = parse_supplementary_links(xml_content)
+        self._report_materials(materials)
+        return materials
 
 def process_search_results(self, query: str, max_results: int = 100):
     # Get article IDs from search
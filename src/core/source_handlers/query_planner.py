@@ -0,0 +1,135 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+DATE_FORMAT = "%Y/%m/%d"
+
+
+class DateWindow:
+    """Inclusive date range of an esearch slice"""
+
+    __slots__ = ("start", "end", "datetype")
+
+    def __init__(self, start, end, datetype="pdat"):
+        self.start = start
+        self.end = end
+        self.datetype = datetype
+
+    @property
+    def days(self):
+        return (self.end - self.start).days + 1
+
+    def split(self):
+        """Bisect the window into two halves"""
+        middle = self.start + datetime.timedelta(days=self.days // 2 - 1)
+        return (DateWindow(self.start, middle, self.datetype),
+                DateWindow(middle + datetime.timedelta(days=1), self.end, self.datetype))
+
+    def params(self):
+        """esearch date parameters for this window"""
+        return {
+            "datetype": self.datetype,
+            "mindate": self.start.strftime(DATE_FORMAT),
+            "maxdate": self.end.strftime(DATE_FORMAT)
+        }
+
+    def __repr__(self):
+        return f"DateWindow({self.start:%Y/%m/%d}-{self.end:%Y/%m/%d})"
+
+
+class DateSlicedSearch:
+    """
+    Enumerates queries with more hits than a single esearch can return.
+
+    The query is split into publication-date windows; windows whose hit count
+    exceeds the per-request cap are bisected until they fit. Windows are then
+    fetched in parallel (all requests go through the handler's shared rate
+    limiter) and the ID streams are merged newest-first without duplicates.
+
+    A single day with more hits than the cap can't be split further (esearch
+    takes one date range, and pages past the cap come back empty); only its
+    first cap IDs are returned, and the missing hits are reported and kept
+    in ``shortfall``.
+    """
+
+    def __init__(self, handler, cap=9999, max_workers=4, start_date=None, end_date=None, datetype="pdat"):
+        """
+        Args:
+            handler: NCBIHandler used to send the esearch requests
+            cap: Maximum number of IDs requested per esearch call
+            max_workers: Number of windows searched concurrently
+            start_date: Earliest publication date (optional)
+            end_date: Latest publication date (optional, defaults to today)
+            datetype: Date field the windows apply to ("pdat" publication,
+                "mdat" modification, "edat" Entrez date)
+        """
+        self.handler = handler
+        self.cap = cap
+        self.max_workers = max(1, int(max_workers))
+        self.start_date = start_date or datetime.date(1800, 1, 1)
+        self.end_date = end_date or datetime.date.today()
+        self.datetype = datetype
+        self.shortfall = 0  # Hits of the last search that could not be retrieved
+
+    def plan(self, query):
+        """
+        Split the query into date windows that each fit under the cap
+
+        Returns:
+            List of (window, count) tuples, newest window first
+        """
+        windows = []
+        level = [DateWindow(self.start_date, self.end_date, self.datetype)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while level:
+                counts = list(pool.map(lambda w: self.handler.esearch(query, retmax=0, **w.params())[0], level))
+                next_level = []
+                for window, count in zip(level, counts):
+                    if count > self.cap and window.days > 1:
+                        next_level.extend(window.split())
+                    elif count > 0:
+                        windows.append((window, count))
+                level = next_level
+        windows.sort(key=lambda item: item[0].start, reverse=True)
+        return windows
+
+    def _fetch_window(self, query, window, count):
+        """Fetch the IDs of a window (at most cap of them: esearch returns nothing past the cap)"""
+        _, ids = self.handler.esearch(query, retmax=min(count, self.cap), **window.params())
+        return ids
+
+    def search(self, query, max_results):
+        """
+        Enumerate up to max_results unique IDs for the query
+
+        Args:
+            query: Search query
+            max_results: Maximum number of IDs to return
+
+        Returns:
+            List of IDs, newest publication dates first; fewer than available
+            if a single day exceeds the cap (see ``shortfall``)
+        """
+        windows = self.plan(query)
+        total = sum(count for _, count in windows)
+        print(f"Planned {len(windows)} date windows for {total} hits")
+
+        # Only fetch as many windows as needed to reach max_results
+        selected = []
+        planned = 0
+        for window, count in windows:
+            if planned >= max_results:
+                break
+            selected.append((window, count))
+            planned += count
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            id_lists = list(pool.map(lambda item: self._fetch_window(query, *item), selected))
+
+        merged = list(dict.fromkeys(pmc_id for ids in id_lists for pmc_id in ids))
+        truncated = [(window, count, len(ids)) for (window, count), ids in zip(selected, id_lists) if len(ids) < count]
+        self.shortfall = min(sum(count - fetched for _, count, fetched in truncated), max(0, max_results - len(merged)))
+        if self.shortfall:
+            days = ", ".join(f"{window.start:%Y/%m/%d} ({fetched} of {count})" for window, count, fetched in truncated)
+            print(f"⚠️ {self.shortfall} hits could not be retrieved: esearch can't page past {self.cap} IDs "
+                  f"of a single day: {days}")
+        return merged[:max_results]
@@ -0,0 +1,56 @@
+import xml.etree.ElementTree as ET
+
+from .base_handler import BaseSourceHandler
+from core.document_processors.xml_processor import find_xml_files, parse_supplementary_links
+from infrastructure.xml_archive import XmlArchive, read_shard, split_articles
+
+
+class XmlReplayHandler(BaseSourceHandler):
+    """
+    Offline source handler answering searches and fetches from saved efetch
+    XML (files written by --save-xml, an XmlArchive, or tests/*.xml).
+
+    Used as a network-free stand-in for NCBIHandler in simulations and
+    benchmarks: every archived article matches every query.
+    """
+
+    fetch_batch_size = 9
+
+    def __init__(self, xml_path):
+        """
+        Args:
+            xml_path: Saved XML file, directory of XML files or XmlArchive directory
+        """
+        self.articles = {}
+        if XmlArchive.is_archive(xml_path):
+            for pmc_id, article in XmlArchive(xml_path).iter_articles():
+                self.articles[pmc_id] = article
+        else:
+            for xml_file in find_xml_files(xml_path):
+                if str(xml_file).endswith((".xml.gz", ".xml.zst")):
+                    content = read_shard(xml_file)
+                else:
+                    with open(xml_file, "rb") as f:
+                        content = f.read()
+                for pmc_id, article in split_articles(content):
+                    self.articles[pmc_id] = article
+
+    def search_articles(self, query: str, max_results: int = 100, since=None):
+        return list(self.articles)[:max_results]
+
+    def get_article_metadata(self, article_ids: list):
+        article_info = {}
+        for pmc_id in article_ids:
+            title = "Title Not Available"
+            if pmc_id in self.articles:
+                node = ET.fromstring(self.articles[pmc_id]).find(".//article-title")
+                if node is not None:
+                    title = "".join(node.itertext())
+            article_info[pmc_id] = {"title": title, "links": []}
+        return article_info
+
+    def get_supplementary_materials(self, article_ids: list, checkpoint=None):
+        payload = b"".join(self.articles[pmc_id] for pmc_id in article_ids if pmc_id in self.articles)
+        if not payload:
+            return {}
+        return parse_supplementary_links(b"<pmc-articleset>" + payload + b"</pmc-articleset>")
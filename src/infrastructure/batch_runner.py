@@ -0,0 +1,247 @@
+import os
+import re
+import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from core.source_handlers.base_handler import IncompleteFetchError
+from infrastructure.data_collector import DataCollector
+from support.config_manager import ConfigManager
+from support.supplement_results import SupplementResults
+
+
+def load_batch_spec(spec_path, defaults=None):
+    """
+    Load a batch job specification
+
+    The file is either a YAML job spec with a ``batch`` section (see
+    config/config.yaml) or a plain text file with one query per line.
+
+    Args:
+        spec_path: Path to the YAML spec or query list
+        defaults: Settings used when the spec doesn't define them (optional)
+
+    Returns:
+        Dictionary of batch settings with ``queries`` normalized to a list of
+        {"query": ..., "max_results": ...} dictionaries
+    """
+    spec_path = Path(spec_path)
+    spec = dict(defaults or {})
+
+    if spec_path.suffix.lower() in (".yaml", ".yml"):
+        spec.update(ConfigManager(spec_path).get("batch", {}) or {})
+        raw_queries = spec.get("queries") or []
+    else:
+        with open(spec_path, "r", encoding="utf-8") as f:
+            raw_queries = [line.strip() for line in f
+                           if line.strip() and not line.strip().startswith("#")]
+
+    max_results = spec.get("max_results", 100)
+    queries = []
+    for item in raw_queries:
+        if isinstance(item, str):
+            item = {"query": item}
+        queries.append({
+            "query": item["query"].strip(),
+            "max_results": int(item.get("max_results", max_results))
+        })
+    spec["queries"] = queries
+    return spec
+
+
+def query_slug(query):
+    """Turn a query into a folder-safe name"""
+    return re.sub(r"[^A-Za-z0-9]+", "_", query).strip("_")[:60] or "query"
+
+
+def incremental_output_dir(query, base_dir="output"):
+    """Stable catalog folder that incremental runs of a query merge into"""
+    output_dir = Path(base_dir) / "incremental" / query_slug(query)
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+
+def search_complete(source_handler, query, found, max_results, since=None):
+    """
+    Check whether a search returned every article matching the query
+
+    An incremental run may only move the query's last harvest forward when it
+    did; otherwise the articles cut off at max_results would never be
+    searched again.
+
+    Args:
+        source_handler: Handler that ran the search
+        query: Search query
+        found: IDs the search returned
+        max_results: Maximum number of results requested
+        since: Start of the incremental window (optional)
+
+    Returns:
+        (complete, count) with count the number of matching articles, or
+        None if the source can't tell (then a search that filled
+        max_results counts as cut off)
+    """
+    count = source_handler.count_articles(query, since=since)
+    if count is None:
+        return len(found) < max_results, None
+    return count <= max_results and len(found) >= count, count
+
+
+class BatchRunner:
+    """
+    Runs many queries non-interactively in one process.
+
+    All queries share the handler (and with it the HTTP connection pool, rate
+    limiter and response cache). Article IDs found by several queries are
+    fetched only once; each query still gets its own link files.
+    """
+
+    def __init__(self, source_handler, max_workers=4, session=None, access_manager=None, byte_limiter=None,
+                 disk_guard=None, layout="article", autotuner=None, metadata_store=None,
+                 similarity_index=None, oa_min_files=10):
+        """
+        Args:
+            source_handler: Handler shared by all queries
+            max_workers: Number of worker threads
+            session: requests.Session shared for downloads (optional)
+            access_manager: AccessManager shared by the downloads (optional)
+            byte_limiter: ByteRateLimiter shared by the downloads (optional)
+            disk_guard: DiskSpaceGuard shared by the downloads (optional)
+            layout: Subdirectories of the downloaded documents ("article", "hash" or "flat")
+            autotuner: ConcurrencyAutotuner shared by the downloads, so the
+                per-host limits hold across queries (optional)
+            metadata_store: MetadataStore resolving article IDs for the downloads (optional)
+            similarity_index: SimilarityIndex flagging near-duplicate downloads (optional)
+            oa_min_files: Supplements an article needs before the downloads
+                use its OA package (with oa_bulk)
+        """
+        self.source_handler = source_handler
+        self.max_workers = max(1, int(max_workers))
+        self.session = session
+        self.access_manager = access_manager
+        self.byte_limiter = byte_limiter
+        self.disk_guard = disk_guard
+        self.layout = layout
+        self.autotuner = autotuner
+        self.metadata_store = metadata_store
+        self.similarity_index = similarity_index
+        self.oa_min_files = oa_min_files
+
+    def run(self, queries, output_dir=None, download=False, extract=False, oa_bulk=False, harvest_state=None):
+        """
+        Search, fetch and save links for every query
+
+        Args:
+            queries: List of {"query": ..., "max_results": ...} dictionaries
+            output_dir: Base output directory (optional, defaults to today's folder)
+            download: Download the supplementary files of each query
+            extract: Extract downloaded zip files
+            oa_bulk: Download Open Access supplements from the per-article OA package
+            harvest_state: CheckpointStore holding each query's last harvest; when
+                given, only articles added or updated since then are searched and
+                results merge into output/incremental/<query> (optional)
+
+        Returns:
+            Dictionary of query -> {"articles", "links", "output_dir", "downloaded"}
+        """
+        if output_dir is None and harvest_state is None:
+            output_dir = DataCollector().create_date_folder()
+        source_name = type(self.source_handler).__name__.replace("Handler", "")
+        harvest_started = datetime.datetime.now()
+
+        last_harvests = {}
+
+        def search(query):
+            if harvest_state is not None:
+                since = harvest_state.get_last_harvest(source_name, query["query"])
+                last_harvests[query["query"]] = since
+                if since is not None:
+                    return self.source_handler.search_articles(query["query"], query["max_results"], since=since)
+            return self.source_handler.search_articles(query["query"], query["max_results"])
+
+        def fetch(chunk):
+            try:
+                return self.source_handler.get_supplementary_materials(chunk), False
+            except IncompleteFetchError as e:
+                print(f"⚠️ {e}")
+                return e.results or SupplementResults(), True
+
+        def query_output_dir(query):
+            if harvest_state is not None:
+                return incremental_output_dir(query["query"])
+            return Path(output_dir) / query_slug(query["query"])
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            # Stage 1: run all searches concurrently
+            print(f"\nSearching {len(queries)} queries...")
+            id_lists = list(pool.map(search, queries))
+
+            # Stage 2: deduplicate IDs across queries before fetching
+            unique_ids = list(dict.fromkeys(pmc_id for ids in id_lists for pmc_id in ids))
+            total_ids = sum(len(ids) for ids in id_lists)
+            print(f"Found {total_ids} article IDs ({len(unique_ids)} unique)")
+
+            batch_size = getattr(self.source_handler, "fetch_batch_size", 10)
+            chunks = [unique_ids[i:i + batch_size] for i in range(0, len(unique_ids), batch_size)]
+            materials = SupplementResults()
+            failed_ids = set()
+            for chunk, (chunk_materials, failed) in zip(chunks, pool.map(fetch, chunks)):
+                materials.update(chunk_materials)
+                if failed:
+                    failed_ids.update(chunk)
+
+            # Stage 3: save (and optionally download) per query
+            summary = {}
+            jobs = []
+            for query, ids in zip(queries, id_lists):
+                query_results = {pmc_id: materials[pmc_id] for pmc_id in ids if pmc_id in materials}
+                query_dir = query_output_dir(query)
+                summary[query["query"]] = {
+                    "articles": len(ids),
+                    "links": sum(len(links) for links in query_results.values()),
+                    "output_dir": str(query_dir),
+                    "downloaded": 0
+                }
+                if query_results:
+                    jobs.append((query["query"], query_results, query_dir))
+
+            def save_query(job):
+                query, query_results, query_dir = job
+                data_collector = DataCollector(session=self.session, byte_limiter=self.byte_limiter,
+                                               disk_guard=self.disk_guard, layout=self.layout,
+                                               autotuner=self.autotuner, metadata_store=self.metadata_store,
+                                               similarity_index=self.similarity_index,
+                                               rate_limiter=getattr(self.source_handler, "rate_limiter", None),
+                                               oa_min_files=self.oa_min_files)
+                data_collector.batch_save_links(query_results, source_type="ncbi", output_dir=query_dir)
+                downloaded = 0
+                if download:
+                    downloaded = data_collector.download_all_documents(query_dir, oa_bulk=oa_bulk,
+                                                                       access_manager=self.access_manager)
+                    if extract and downloaded > 0:
+                        data_collector.extract_zip_files()
+                return query, downloaded
+
+            for query, downloaded in pool.map(save_query, jobs):
+                summary[query]["downloaded"] = downloaded
+
+        # Failed searches also come back empty, so only advance queries that found articles,
+        # and only when every matching article was found and fetched
+        if harvest_state is not None:
+            for query, ids in zip(queries, id_lists):
+                if not ids:
+                    continue
+                complete, count = search_complete(self.source_handler, query["query"], ids, query["max_results"],
+                                                  since=last_harvests.get(query["query"]))
+                if not complete:
+                    print(f"⚠️ '{query['query']}': found {len(ids)} of {count if count is not None else 'more'} "
+                          f"articles; keeping the last harvest time so the rest is searched again "
+                          f"(raise max_results to catch up)")
+                elif failed_ids.intersection(ids):
+                    print(f"⚠️ '{query['query']}': some articles could not be fetched; "
+                          f"keeping the last harvest time so they are fetched again")
+                else:
+                    harvest_state.set_last_harvest(source_name, query["query"], harvest_started,
+                                                   summary[query["query"]]["output_dir"])
+
+        return summary
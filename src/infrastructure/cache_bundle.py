@@ -0,0 +1,245 @@
+import os
+import json
+import hashlib
+import datetime
+import zipfile
+from pathlib import Path, PurePosixPath
+
+from infrastructure.document_store import URL_ORIGINS
+
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = "bundle.json"
+SECTIONS = ("responses", "links", "metadata", "documents")
+
+
+def _blob_name(digest):
+    return f"blobs/{digest[:2]}/{digest}"
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _BundleWriter:
+    """Zip file receiving content-addressed blobs (each stored once) and JSON lines sections"""
+
+    def __init__(self, zip_file):
+        self.zip = zip_file
+        self.blobs = set()
+        self.blob_bytes = 0
+
+    def add_bytes(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in self.blobs:
+            self.zip.writestr(_blob_name(digest), data)
+            self.blobs.add(digest)
+            self.blob_bytes += len(data)
+        return digest
+
+    def add_file(self, path):
+        digest = _file_digest(path)
+        if digest not in self.blobs:
+            self.zip.write(path, _blob_name(digest))
+            self.blobs.add(digest)
+            self.blob_bytes += Path(path).stat().st_size
+        return digest
+
+
+def export_bundle(bundle_path, cache=None, metadata_store=None, document_store=None, since=None):
+    """
+    Write a cache bundle: a zip snapshot another node can import to start warm
+
+    Responses, document files and everything else large are stored as
+    content-addressed blobs (``blobs/<sha256>``), so identical content is
+    kept once and verified on import. The sections list what refers to them:
+
+    - responses.jsonl: response cache key -> blob, with the time it was stored
+    - links.jsonl: PMC ID -> supplementary links parsed from the article's
+      full text, with the time they were stored
+    - metadata.jsonl: MetadataStore records with their update time
+    - documents.jsonl: URL -> blob index of downloaded files, with their
+      place in the documents directory and the time they were fetched
+
+    Args:
+        bundle_path: Zip file to write
+        cache: CacheManager with a database (optional)
+        metadata_store: MetadataStore (optional)
+        document_store: DocumentStore of a documents directory (optional)
+        since: Only include entries stored or updated at or after this ISO
+            timestamp, for incremental bundles (optional)
+
+    Returns:
+        Dictionary of entries written per section, plus "blobs" and "bytes"
+    """
+    bundle_path = Path(bundle_path)
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = bundle_path.with_name(f"{bundle_path.name}.part")
+    counts = dict.fromkeys(SECTIONS, 0)
+
+    with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        writer = _BundleWriter(zip_file)
+        sections = {section: [] for section in SECTIONS}
+
+        if cache is not None:
+            for key, value, stored_at in cache.iter_stored(since):
+                sections["responses"].append({"key": key, "sha256": writer.add_bytes(value), "stored_at": stored_at})
+            sections["links"] = [{"pmc_id": pmc_id, "links": links, "stored_at": stored_at}
+                                 for pmc_id, links, stored_at in cache.iter_links(since)]
+
+        if metadata_store is not None:
+            sections["metadata"] = list(metadata_store.iter_records(since))
+
+        if document_store is not None:
+            for entry in document_store.entries():
+                path = document_store.documents_dir / entry["path"]
+                if (not entry.get("url") or entry.get("origin") not in URL_ORIGINS or not path.is_file()
+                        or (since and (entry.get("recorded_at") or "") < since)):
+                    continue
+                sections["documents"].append({
+                    "url": entry["url"],
+                    "path": entry["path"],
+                    "sha256": writer.add_file(path),
+                    "size": entry.get("size"),
+                    "article_id": entry.get("article_id"),
+                    "origin": entry["origin"],
+                    "content_type": entry.get("content_type"),
+                    "recorded_at": entry.get("recorded_at")
+                })
+
+        for section, entries in sections.items():
+            zip_file.writestr(f"{section}.jsonl",
+                              "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+            counts[section] = len(entries)
+        counts["blobs"] = len(writer.blobs)
+        counts["bytes"] = writer.blob_bytes
+        zip_file.writestr(MANIFEST_NAME, json.dumps({
+            "format": BUNDLE_FORMAT,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "since": since,
+            "counts": counts
+        }, indent=2))
+
+    os.replace(temp_path, bundle_path)
+    return counts
+
+
+class _BundleReader:
+    """Reads the sections and verified blobs of a cache bundle"""
+
+    def __init__(self, zip_file):
+        self.zip = zip_file
+        self.corrupt = 0
+        try:
+            manifest = json.loads(zip_file.read(MANIFEST_NAME))
+        except KeyError:
+            raise ValueError("Not a cache bundle (no bundle.json)")
+        if manifest.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported cache bundle format: {manifest.get('format')}")
+        self.manifest = manifest
+
+    def entries(self, section):
+        try:
+            with self.zip.open(f"{section}.jsonl") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        except KeyError:
+            return
+
+    def read_blob(self, digest):
+        """Return the content of a blob, or None if it is missing or doesn't match its hash"""
+        try:
+            data = self.zip.read(_blob_name(digest))
+        except KeyError:
+            data = None
+        if data is None or hashlib.sha256(data).hexdigest() != digest:
+            self.corrupt += 1
+            return None
+        return data
+
+    def extract_blob(self, digest, path):
+        """Write a blob to a file (atomically); returns False if it is missing or doesn't match its hash"""
+        temp_path = path.with_name(f"{path.name}.part")
+        hasher = hashlib.sha256()
+        try:
+            with self.zip.open(_blob_name(digest)) as source, open(temp_path, "wb") as target:
+                for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+                    target.write(chunk)
+        except KeyError:
+            temp_path.unlink(missing_ok=True)
+            self.corrupt += 1
+            return False
+        if hasher.hexdigest() != digest:
+            temp_path.unlink(missing_ok=True)
+            self.corrupt += 1
+            return False
+        os.replace(temp_path, path)
+        return True
+
+
+def _import_documents(reader, document_store):
+    """Restore the bundle's files whose URL the store lacks or has an older copy of"""
+    imported = 0
+    for entry in reader.entries("documents"):
+        relative = PurePosixPath(entry["path"])
+        if relative.is_absolute() or ".." in relative.parts:
+            reader.corrupt += 1
+            continue
+        local = document_store.path_for_url(entry["url"])
+        if local is not None:
+            local_entry = document_store.get(local)
+            if (local.is_file() and local_entry is not None
+                    and (local_entry.get("recorded_at") or "") >= (entry.get("recorded_at") or "")):
+                continue
+            path = local
+        else:
+            path = document_store.unique_path(document_store.documents_dir / relative)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not reader.extract_blob(entry["sha256"], path):
+            continue
+        document_store.record(path, url=entry["url"], article_id=entry.get("article_id"), origin=entry["origin"],
+                              content_type=entry.get("content_type"), recorded_at=entry.get("recorded_at"))
+        imported += 1
+    return imported
+
+
+def import_bundle(bundle_path, cache=None, metadata_store=None, document_store=None):
+    """
+    Merge a cache bundle into the local caches
+
+    Conflicts are resolved by timestamp: a cached response (or an article's
+    parsed links) is replaced by the bundle's only if that one was stored
+    later, metadata fields known on
+    both sides are taken from the more recently updated record, and a file
+    is restored if its URL isn't downloaded here or the local copy is older.
+    Blobs that are missing or don't match their hash are skipped.
+
+    Args:
+        bundle_path: Zip file written by export_bundle
+        cache: CacheManager with a database receiving the responses and links (optional)
+        metadata_store: MetadataStore receiving the records (optional)
+        document_store: DocumentStore receiving the files (optional)
+
+    Returns:
+        Dictionary of entries merged per section, plus "corrupt" (skipped blobs)
+    """
+    counts = dict.fromkeys(SECTIONS, 0)
+    with zipfile.ZipFile(bundle_path) as zip_file:
+        reader = _BundleReader(zip_file)
+        if cache is not None:
+            responses = ((entry["key"], reader.read_blob(entry["sha256"]), entry["stored_at"])
+                         for entry in reader.entries("responses"))
+            counts["responses"] = cache.merge(entry for entry in responses if entry[1] is not None)
+            counts["links"] = cache.merge_links((entry["pmc_id"], entry["links"], entry["stored_at"])
+                                                for entry in reader.entries("links"))
+        if metadata_store is not None:
+            counts["metadata"] = metadata_store.merge(reader.entries("metadata"))
+        if document_store is not None:
+            counts["documents"] = _import_documents(reader, document_store)
+        counts["corrupt"] = reader.corrupt
+    return counts
@@ -1,16 +1,56 @@
 import os
+import re
 import datetime
 from pathlib import Path
 
+# <source>_<article ID>_links.txt, as written by save_links_to_file
+LINK_FILE_PATTERN = re.compile(r"^(?:[A-Za-z]+_)?(.+)_links\.txt$")
+
 class DataCollector:
     """
     General-purpose utility for collecting and saving data from various sources
     """
     
-    def __init__(self):
-        """Initialize with empty tracking lists"""
+    throttle_retries = 2  # Retries of a download answered with HTTP 429/503
+    
+    def __init__(self, session=None, byte_limiter=None, disk_guard=None, layout="article", autotuner=None,
+                 metadata_store=None, similarity_index=None, rate_limiter=None, oa_min_files=10):
+        """
+        Initialize with empty tracking lists
+        
+        Args:
+            session: requests.Session shared for downloads (optional, one
+                is opened on the first download run and reused, so files
+                share keep-alive connections)
+            byte_limiter: ByteRateLimiter pacing the bytes downloaded (optional)
+            disk_guard: DiskSpaceGuard admitting downloads and zip extractions
+                only while the disk has room for them (optional)
+            layout: Subdirectories of new documents: "article" (one per
+                article), "hash" (by file name hash) or "flat"
+            autotuner: ConcurrencyAutotuner deciding how many files are
+                downloaded from each host at once (optional, a default one
+                is created per download run)
+            metadata_store: MetadataStore mapping the IDs in link file names
+                to PMC IDs and telling which articles are Open Access (optional)
+            similarity_index: SimilarityIndex flagging near-duplicate files
+                as they are downloaded; with skip_processing set, their zip
+                extraction is skipped (optional)
+            rate_limiter: RateLimiter of NCBI requests, shared with the NCBI
+                handler, pacing the OA web service lookups (optional)
+            oa_min_files: Supplements an article needs before its OA package
+                is downloaded instead of the files themselves
+        """
         self.saved_files = []
         self.current_output_dir = None
+        self.session = session
+        self.byte_limiter = byte_limiter
+        self.disk_guard = disk_guard
+        self.layout = layout
+        self.autotuner = autotuner
+        self.metadata_store = metadata_store
+        self.similarity_index = similarity_index
+        self.rate_limiter = rate_limiter
+        self.oa_min_files = oa_min_files
     
     def create_date_folder(self, base_dir="output"):
         """Create a folder with today's date as name"""
@@ -47,9 +87,14 @@ class DataCollector:
         
         return str(output_file)
     
-    def batch_save_links(self, article_dict, source_type=None):
+    def batch_save_links(self, article_dict, source_type=None, output_dir=None):
         """Save multiple sets of links to files in a batch operation"""
-        output_dir = self.create_date_folder()
+        if output_dir is None:
+            output_dir = self.create_date_folder()
+        else:
+            output_dir = Path(output_dir)
+            os.makedirs(output_dir, exist_ok=True)
+            self.current_output_dir = output_dir
         
         for article_id, links in article_dict.items():
             if links:
@@ -57,6 +102,26 @@ class DataCollector:
         
         return str(output_dir) if self.saved_files else None
     
+    def article_id_for(self, link_file):
+        """
+        Return the PMC ID of the article a link file belongs to
+        
+        Args:
+            link_file: Path of a <source>_<article ID>_links.txt file
+        
+        Returns:
+            The article ID, mapped through the metadata store when one is set
+            (so files named after a PMID or DOI resolve to the PMC ID), or
+            "unknown" for other file names
+        """
+        match = LINK_FILE_PATTERN.match(Path(link_file).name)
+        if not match:
+            return 'unknown'
+        article_id = match.group(1)
+        if self.metadata_store is not None:
+            return self.metadata_store.resolve(article_id) or article_id
+        return article_id
+    
     def print_summary(self):
         """Print a summary of all files created during this run"""
         if not self.saved_files:
@@ -78,12 +143,23 @@ class DataCollector:
         
         print(f"\n✅ All data has been successfully saved to: {self.current_output_dir}")
     
-    def download_all_documents(self, output_dir=None):
+    def download_all_documents(self, output_dir=None, checkpoint=None, oa_bulk=False, access_manager=None,
+                               link_files=None):
         """
         Download all documents from saved link files
         
         Args:
             output_dir: Directory containing the link files (optional)
+            checkpoint: JobCheckpoint recording the state of each download so a
+                resumed job skips files it already handled (optional)
+            oa_bulk: Fetch the supplements of Open Access articles with at
+                least oa_min_files files from the single per-article OA
+                package, falling back to per-file downloads for other articles
+            access_manager: AccessManager deciding from each article's first
+                download whether the rest of its files are fetched; all files
+                of an inaccessible article are deferred in bulk (optional)
+            link_files: Only download from these link files instead of every
+                link file in the output directory (optional)
         
         Returns:
             Number of successfully downloaded files
@@ -91,13 +167,19 @@ class DataCollector:
         import requests
         import os
         from pathlib import Path
-        import time
         from urllib.parse import urlparse
         import logging
         from support.logging_service import Logger
+        from infrastructure.oa_package import OAPackageDownloader
+        from support.content_sniffer import sniff_content, SNIFF_BYTES
+        from infrastructure.document_store import DocumentStore
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        from support.autotuner import ConcurrencyAutotuner, save_run_stats
+        from support.display_service import ProgressBoard
         
         # Get logger instance
         logger = Logger.get_instance()
+        board = ProgressBoard.get_instance()
         
         # Use current output directory if none is specified
         if output_dir is None:
@@ -108,14 +190,18 @@ class DataCollector:
         else:
             output_dir = Path(output_dir)
         
-        # Create documents folder if it doesn't exist
+        # Create documents folder if it doesn't exist; its manifest answers
+        # which files were already downloaded without listing the directory
         documents_dir = output_dir / "documents"
-        os.makedirs(documents_dir, exist_ok=True)
+        store = DocumentStore(documents_dir, layout=self.layout)
         logger.info(f"Documents will be saved to: {documents_dir}")
         print(f"Documents will be saved to: {documents_dir}")
         
         # Find all link files in the output directory
-        link_files = list(output_dir.glob("*_links.txt"))
+        if link_files is None:
+            link_files = list(output_dir.glob("*_links.txt"))
+        else:
+            link_files = [Path(link_file) for link_file in link_files]
         if not link_files:
             logger.warning(f"No link files found in {output_dir}")
             print(f"No link files found in {output_dir}")
@@ -142,114 +228,195 @@ class DataCollector:
         total_links = 0
         successful_downloads = 0
         failed_downloads = 0
+        deferred_downloads = 0
+        
+        # Download states recorded by a previous run of this job
+        download_states = checkpoint.get_download_states() if checkpoint is not None else {}
+        
+        # One session for the whole run: connections (and their TCP/TLS
+        # handshakes) are reused from file to file
+        if self.session is None:
+            self.session = requests.Session()
+        
+        oa_downloader = OAPackageDownloader(session=self.session, byte_limiter=self.byte_limiter,
+                                            disk_guard=self.disk_guard,
+                                            rate_limiter=self.rate_limiter) if oa_bulk else None
+        
+        downloads = []  # (url, filename, output path, article ID, progress label)
         
         # Process each link file
         for link_file in link_files:
             logger.info(f"Processing links from: {link_file.name}")
-            print(f"\nProcessing links from: {link_file.name}")
             
             with open(link_file, 'r') as f:
                 links = [line.strip() for line in f if line.strip()]
             
             total_links += len(links)
             logger.info(f"Found {len(links)} links to download.")
-            print(f"Found {len(links)} links to download.")
+            if not board.live:
+                print(f"\nProcessing links from: {link_file.name}")
+                print(f"Found {len(links)} links to download.")
             
-            # Download each file
-            for i, url in enumerate(links):
-                try:
-                    # Extract filename from URL
-                    parsed_url = urlparse(url)
-                    filename = os.path.basename(parsed_url.path)
-                    
-                    # If filename is not valid or empty, generate one
-                    if not filename or len(filename) < 3:
-                        filename = f"document_{link_file.stem}_{i+1}.bin"
-                    
-                    # Create full output path
-                    output_path = documents_dir / filename
+            article_id = self.article_id_for(link_file)
+            
+            # Try the article's Open Access package first; whatever it doesn't
+            # contain is downloaded file by file below. The package holds the
+            # full text and every supplement, so it only pays off for articles
+            # with many files, and articles parsed as not Open Access have none
+            use_package = oa_downloader is not None and len(links) >= self.oa_min_files
+            if use_package and self.metadata_store is not None:
+                record = self.metadata_store.get(article_id)
+                use_package = record is None or record.get("open_access") is not False
+            if use_package:
+                wanted_files = {}
+                for url in links:
+                    filename = os.path.basename(urlparse(url).path)
+                    if filename and store.find(filename, article_id, url) is None:
+                        wanted_files[filename] = url
+                
+                if wanted_files:
+                    target_paths = {filename: store.path_for(filename, article_id) for filename in wanted_files}
+                    try:
+                        extracted = oa_downloader.download_supplements(article_id, wanted_files, documents_dir,
+                                                                       target_paths=target_paths)
+                    except Exception as e:
+                        logger.warning(f"OA package download failed for PMC{article_id}, falling back to per-file downloads: {e}")
+                        extracted = {}
                     
-                    # Skip if file already exists
-                    if output_path.exists():
-                        logger.info(f"File already exists, skipping: {filename}")
-                        print(f"File already exists, skipping: {filename}")
+                    if extracted:
+                        logger.info(f"Extracted {len(extracted)} files from the OA package of PMC{article_id}")
+                        print(f"📦 Extracted {len(extracted)} files from the OA package of PMC{article_id}")
+                    for url, path in extracted.items():
+                        store.record(path, url=url, article_id=article_id, origin="oa_package")
                         successful_downloads += 1
-                        continue
-                    
-                    logger.info(f"Downloading {i+1}/{len(links)}: {filename}...")
-                    print(f"Downloading {i+1}/{len(links)}: {filename}...")
-                    
-                    # Add a referer header using the article's base URL
-                    article_id = link_file.stem.split('_')[1] if '_' in link_file.stem else 'unknown'
-                    referer = f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{article_id}/"
-                    current_headers = headers.copy()
-                    current_headers['Referer'] = referer
-                    
-                    # Download the file with browser-like headers
-                    session = requests.Session()
-                    
-                    # First, visit the article page to get cookies
-                    session.get(referer, headers=current_headers, timeout=30)
-                    
-                    # Then download the file
-                    response = session.get(url, headers=current_headers, stream=True, timeout=30)
-                    response.raise_for_status()
-                    
-                    # Check if we got actual content
-                    content_type = response.headers.get('Content-Type', '')
-                    if 'text/html' in content_type and len(response.content) < 10000:
-                        # This might be an error page, not the actual file
-                        error_msg = f"Received HTML instead of file data (possible access restriction). Content type: {content_type}"
-                        logger.error(error_msg)
-                        print(f"❌ {error_msg}")
-                        
-                        # Save the HTML response for debugging
-                        error_html_path = documents_dir / f"error_{filename}.html"
-                        with open(error_html_path, 'wb') as error_file:
-                            error_file.write(response.content)
-                        logger.info(f"Saved error HTML to {error_html_path}")
-                        
-                        failed_downloads += 1
-                        continue
-                    
-                    # Save the file
-                    with open(output_path, 'wb') as out_file:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            out_file.write(chunk)
-                    
+                        if checkpoint is not None:
+                            checkpoint.record_download(url, "downloaded", path)
+                    links = [url for url in links if url not in extracted]
+            
+            # Defer all files of an article already known to be blocked; for
+            # the others, the first download below decides
+            if access_manager is not None:
+                pending = [url for url in links
+                           if store.find(os.path.basename(urlparse(url).path), article_id, url) is None]
+                verdict = access_manager.check_article(article_id, pending[0]) if pending else None
+                if verdict is not None and not verdict.accessible:
+                    logger.warning(f"Skipping {len(pending)} files of inaccessible article PMC{article_id}: {verdict.reason}")
+                    print(f"🚫 Skipping {len(pending)} files of inaccessible article PMC{article_id}: {verdict.reason}")
+                    deferred_downloads += len(pending)
+                    if checkpoint is not None:
+                        for url in pending:
+                            checkpoint.record_download(url, "deferred", reason=verdict.reason)
+                    continue
+            
+            # Queue each file that still has to be downloaded
+            for i, url in enumerate(links):
+                # Extract filename from URL
+                parsed_url = urlparse(url)
+                filename = os.path.basename(parsed_url.path)
+                
+                # If filename is not valid or empty, generate one
+                if not filename or len(filename) < 3:
+                    filename = f"document_{link_file.stem}_{i+1}.bin"
+                
+                # Create full output path (or find where it was stored before)
+                existing_path = store.find(filename, article_id, url)
+                output_path = existing_path or store.path_for(filename, article_id)
+                
+                # Skip if a previous run of this job already downloaded it
+                if download_states.get(url) == "downloaded" and existing_path is not None:
                     successful_downloads += 1
-                    logger.info(f"Successfully downloaded: {filename}")
-                    print(f"✅ Successfully downloaded: {filename}")
-                    
-                    # Brief pause to avoid overwhelming the server
-                    time.sleep(1.5)
-                    
-                except requests.exceptions.RequestException as e:
-                    error_msg = f"Failed to download {url}: {str(e)}"
-                    logger.error(error_msg, exc_info=True)
-                    print(f"❌ {error_msg}")
-                    failed_downloads += 1
-                    
-                    # Alternative URL suggestion
-                    if "403" in str(e):
-                        article_id = link_file.stem.split('_')[1] if '_' in link_file.stem else 'unknown'
-                        alt_url = f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{article_id}/"
-                        logger.info(f"Try manually downloading from: {alt_url}")
-                        print(f"💡 Try manually downloading from: {alt_url}")
-                except Exception as e:
-                    error_msg = f"Error processing {url}: {str(e)}"
-                    logger.error(error_msg, exc_info=True)
-                    print(f"❌ {error_msg}")
-                    failed_downloads += 1
+                    continue
+                
+                # Skip if file already exists
+                if existing_path is not None:
+                    logger.info(f"File already exists, skipping: {filename}")
+                    if not board.live:
+                        print(f"File already exists, skipping: {filename}")
+                    successful_downloads += 1
+                    if checkpoint is not None:
+                        checkpoint.record_download(url, "downloaded", output_path)
+                    continue
+                
+                downloads.append((url, filename, output_path, article_id, f"{i+1}/{len(links)}"))
+        
+        # Download the queued files concurrently; the autotuner decides how
+        # many requests each host gets at a time
+        tuner = self.autotuner or ConcurrencyAutotuner()
+        blocked_articles = set()  # Articles that answered HTTP 403; their remaining files are deferred
+        if downloads:
+            stage = board.stage("download", "files")
+            stage.add_total(len(downloads))
+            
+            def count(future):
+                if future.cancelled() or future.exception() is not None or future.result() == "failed":
+                    stage.fail()
+                else:
+                    stage.add()
+            
+            # With an access manager, the first file of each article goes
+            # first; the article's other files are queued once it has shown
+            # whether the article is accessible
+            held_back = {}
+            if access_manager is not None:
+                first_files = {}
+                for download in downloads:
+                    if download[3] in first_files:
+                        held_back.setdefault(download[3], []).append(download)
+                    else:
+                        first_files[download[3]] = download
+                downloads = list(first_files.values())
+            
+            pool = ThreadPoolExecutor(max_workers=tuner.maximum)
+            try:
+                def submit(download):
+                    future = pool.submit(self._download_file, *download, store, headers, tuner, checkpoint,
+                                         access_manager, blocked_articles)
+                    future.add_done_callback(count)
+                    futures[future] = download
+                
+                futures = {}
+                for download in downloads:
+                    submit(download)
+                statuses = []
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        download = futures.pop(future)
+                        statuses.append(future.result())
+                        for held in held_back.pop(download[3], []):
+                            submit(held)
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+            successful_downloads += statuses.count("downloaded")
+            failed_downloads += statuses.count("failed")
+            deferred_downloads += statuses.count("deferred")
         
         # Print summary
         summary = f"\n📊 Download Summary:\n" \
                   f"  Total links processed: {total_links}\n" \
                   f"  Successfully downloaded: {successful_downloads}\n" \
                   f"  Failed downloads: {failed_downloads}"
+        if access_manager is not None or deferred_downloads:
+            summary += f"\n  Deferred (inaccessible articles or no disk space): {deferred_downloads}"
+        
+        tuner_lines = tuner.summary_lines()
+        if tuner_lines:
+            summary += "\n  Concurrency per host:\n" + "\n".join(f"    {line}" for line in tuner_lines)
+        if self.similarity_index is not None:
+            summary += f"\n  Near-duplicates: {self.similarity_index.summary_lines()[0]}"
         
         logger.info(summary)
         print(summary)
+        save_run_stats(output_dir, "download", tuner.stats())
+        
+        if access_manager is not None:
+            access_manager.save()
+            hints = access_manager.manual_download_hints()
+            if hints:
+                print(f"\n💡 {len(hints)} articles were not accessible. Try manually downloading from:")
+                for article_id, article_url, reason in hints:
+                    logger.info(f"Try manually downloading from: {article_url} ({reason})")
+                    print(f"  • {article_url} ({reason})")
         
         if failed_downloads > 0:
             alternative_msg = (
@@ -262,6 +429,232 @@ class DataCollector:
         
         return successful_downloads
 
+    def _download_file(self, url, filename, output_path, article_id, progress, store, headers, tuner,
+                       checkpoint=None, access_manager=None, blocked_articles=None, attempt=0):
+        """
+        Download one supplementary file within the autotuner's limit for its host
+        
+        Args:
+            url: File URL
+            filename: File name to save the file under
+            output_path: Path to save the file to
+            article_id: PMC ID of the article the file belongs to
+            progress: Progress label, e.g. "2/5"
+            store: DocumentStore recording the file
+            headers: Browser-like request headers
+            tuner: ConcurrencyAutotuner told how the request went
+            checkpoint: JobCheckpoint recording the download state (optional)
+            access_manager: AccessManager told whether the article's files
+                can be downloaded (optional)
+            blocked_articles: Set of article IDs whose files are deferred; a
+                refused download (HTTP 401/402/403/451 or an HTML interstitial)
+                adds the article when access_manager is set (optional)
+            attempt: Number of earlier attempts answered with HTTP 429/503
+        
+        Returns:
+            "downloaded", "failed" or "deferred"
+        """
+        import requests
+        import os
+        import time
+        from urllib.parse import urlparse
+        from support.logging_service import Logger
+        from support.content_sniffer import sniff_content, looks_like_html, SNIFF_BYTES
+        from support.autotuner import classify_error
+        from core.paywall_service.access_manager import BLOCKED_STATUS_CODES
+        from support.display_service import ProgressBoard
+        from infrastructure.similarity_index import ContentSketch
+        
+        logger = Logger.get_instance()
+        board = ProgressBoard.get_instance()
+        stage = board.stage("download", "files")
+        
+        # The article answered 403 for another of its files: defer the rest in bulk
+        if blocked_articles is not None and article_id in blocked_articles:
+            if checkpoint is not None:
+                checkpoint.record_download(url, "deferred", reason="HTTP 403")
+            return "deferred"
+        
+        host = urlparse(url).hostname or 'unknown'
+        documents_dir = store.documents_dir
+        try:
+            logger.info(f"Downloading {progress}: {filename}...")
+            if not board.live:
+                print(f"Downloading {progress}: {filename}...")
+            
+            # Add a referer header using the article's base URL
+            referer = f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{article_id}/"
+            current_headers = headers.copy()
+            current_headers['Referer'] = referer
+            
+            # Download the file with browser-like headers
+            session = self.session
+            
+            # Wait for the disk to be above its reserve before taking a host
+            # slot; the file's own space is reserved from the GET's Content-Length
+            reserved = 0
+            if self.disk_guard is not None:
+                if not self.disk_guard.admit(0, documents_dir, filename):
+                    reason = "insufficient disk space"
+                    logger.warning(f"Deferring {filename}: {reason}")
+                    print(f"⏭️ Deferring {filename}: {reason}")
+                    if checkpoint is not None:
+                        checkpoint.record_download(url, "deferred", reason=reason)
+                    return "deferred"
+            
+            tuner.acquire(host)
+            stage.begin()
+            started = time.monotonic()
+            latency = None
+            size = 0
+            error = retry_after = None
+            try:
+                # First, visit the article page to get cookies
+                session.get(referer, headers=current_headers, timeout=30)
+                
+                # Then download the file; latency is the time to the response headers
+                started = time.monotonic()
+                response = session.get(url, headers=current_headers, stream=True, timeout=30)
+                response.raise_for_status()
+                latency = time.monotonic() - started
+                
+                # Reserve room for the file and, for zips, its extracted contents
+                # without waiting, since the server would time out
+                if self.disk_guard is not None:
+                    needed = self.disk_guard.expected_bytes(response.headers.get('Content-Length'), filename)
+                    if not self.disk_guard.admit(needed, documents_dir, filename, wait=False):
+                        response.close()
+                        reason = "insufficient disk space"
+                        logger.warning(f"Deferring {filename}: {reason}")
+                        print(f"⏭️ Deferring {filename}: {reason}")
+                        if checkpoint is not None:
+                            checkpoint.record_download(url, "deferred", reason=reason)
+                        return "deferred"
+                    reserved = needed
+                
+                try:
+                    # Check if we got actual content by sniffing the first few KB
+                    # before anything else is read from the stream
+                    content_type = response.headers.get('Content-Type', '')
+                    chunks = response.iter_content(chunk_size=8192)
+                    if self.byte_limiter is not None:
+                        chunks = self.byte_limiter.throttle(host, chunks)
+                    head = b""
+                    for chunk in chunks:
+                        head += chunk
+                        if len(head) >= SNIFF_BYTES:
+                            break
+                    size = len(head)
+                    stage.add(0, size)
+                    # Sketch the content as it streams by, for the near-duplicate check
+                    sketch = ContentSketch() if self.similarity_index is not None else None
+                    
+                    accepted, reason = sniff_content(head, filename, content_type)
+                    if not accepted:
+                        # Abort the transfer without reading the rest of the body
+                        response.close()
+                        logger.error(reason)
+                        print(f"❌ {reason}")
+                        
+                        # Save the sniffed bytes for debugging
+                        error_html_path = output_path.parent / f"error_{filename}.html"
+                        os.makedirs(output_path.parent, exist_ok=True)
+                        with open(error_html_path, 'wb') as error_file:
+                            error_file.write(head)
+                        store.record(error_html_path, url=url, article_id=article_id, origin="rejected",
+                                     size=len(head), content_type=content_type)
+                        logger.info(f"Saved start of rejected response to {error_html_path}")
+                        
+                        if checkpoint is not None:
+                            checkpoint.record_download(url, "rejected", reason=reason)
+                        # An HTML page instead of the file is an access restriction
+                        if access_manager is not None and looks_like_html(head):
+                            access_manager.record_failure(article_id, url, "HTML interstitial instead of file data")
+                            if blocked_articles is not None:
+                                blocked_articles.add(article_id)
+                        return "failed"
+                    if reason is not None:
+                        # Kept: supplements are often saved under another format's extension
+                        logger.warning(f"{filename}: {reason}")
+                        if not board.live:
+                            print(f"⚠️ {filename}: {reason}")
+                    
+                    # Save the file
+                    os.makedirs(output_path.parent, exist_ok=True)
+                    with open(output_path, 'wb') as out_file:
+                        out_file.write(head)
+                        if sketch is not None:
+                            sketch.update(head)
+                        for chunk in chunks:
+                            out_file.write(chunk)
+                            size += len(chunk)
+                            stage.add(0, len(chunk))
+                            if sketch is not None:
+                                sketch.update(chunk)
+                    store.record(output_path, url=url, article_id=article_id, size=size,
+                                 content_type=content_type)
+                    if sketch is not None:
+                        match = self.similarity_index.add(output_path, sketch, article_id)
+                        if match is not None:
+                            logger.info(f"{filename} is a near-duplicate ({match[1]:.0%}) of {match[0]}")
+                finally:
+                    response.close()
+            except requests.exceptions.RequestException as e:
+                error, retry_after = classify_error(e)
+                raise
+            finally:
+                if latency is None:
+                    latency = time.monotonic() - started
+                tuner.release(host, latency, size, error=error, retry_after=retry_after)
+                stage.end()
+                if reserved:
+                    self.disk_guard.release(reserved)
+            
+            if checkpoint is not None:
+                checkpoint.record_download(url, "downloaded", output_path)
+            if access_manager is not None:
+                access_manager.record_success(article_id, url)
+            logger.info(f"Successfully downloaded: {filename}")
+            if not board.live:
+                print(f"✅ Successfully downloaded: {filename}")
+            return "downloaded"
+            
+        except requests.exceptions.RequestException as e:
+            # Throttled: retry once the autotuner lets the host have another request
+            if attempt < self.throttle_retries and classify_error(e)[0] == "throttled":
+                logger.warning(f"{host} throttled {filename}, retrying: {e}")
+                if not board.live:
+                    print(f"⏳ {host} throttled {filename}, retrying...")
+                return self._download_file(url, filename, output_path, article_id, progress, store, headers, tuner,
+                                           checkpoint, access_manager, blocked_articles, attempt + 1)
+            
+            error_msg = f"Failed to download {url}: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            print(f"❌ {error_msg}")
+            if checkpoint is not None:
+                checkpoint.record_download(url, "failed")
+            
+            # The article is blocked: its files that haven't started yet are deferred
+            status_code = getattr(getattr(e, "response", None), "status_code", None)
+            if access_manager is not None and status_code in BLOCKED_STATUS_CODES:
+                access_manager.record_failure(article_id, url, f"HTTP {status_code}")
+                if blocked_articles is not None:
+                    blocked_articles.add(article_id)
+            
+            # Alternative URL suggestion
+            elif "403" in str(e):
+                alt_url = f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{article_id}/"
+                logger.info(f"Try manually downloading from: {alt_url}")
+                print(f"💡 Try manually downloading from: {alt_url}")
+            return "failed"
+        except Exception as e:
+            error_msg = f"Error processing {url}: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            print(f"❌ {error_msg}")
+            if checkpoint is not None:
+                checkpoint.record_download(url, "failed")
+            return "failed"
+    
     def extract_zip_files(self, documents_dir=None):
         """
         Extract all .zip files in the documents directory directly into the documents directory
@@ -274,9 +667,11 @@ class DataCollector:
         """
         import zipfile
         import os
+        import time
         from pathlib import Path
         import logging
         from support.logging_service import Logger
+        from infrastructure.document_store import DocumentStore
         
         # Get logger instance
         logger = Logger.get_instance()
@@ -296,8 +691,12 @@ class DataCollector:
             print(f"Documents directory not found: {documents_dir}")
             return 0
         
-        # Find all .zip files in the documents directory
-        zip_files = list(documents_dir.glob("*.zip"))
+        # Find the .zip files in the manifest that weren't extracted by an earlier run
+        store = DocumentStore(documents_dir, layout=self.layout)
+        extracted_origins = {entry["origin"] for entry in store.entries()}
+        zip_entries = {entry["path"]: entry for entry in store.entries({".zip"})
+                       if f"zip:{entry['path']}" not in extracted_origins}
+        zip_files = [documents_dir / path for path in zip_entries]
         if not zip_files:
             logger.info("No zip files found to extract.")
             print("No zip files found to extract.")
@@ -309,18 +708,32 @@ class DataCollector:
         # Statistics
         successful_extractions = 0
         failed_extractions = 0
+        skipped_extractions = 0
+        duplicate_extractions = 0
         total_files_extracted = 0
         
         # Process each zip file
         for zip_file_path in zip_files:
             try:
-                logger.info(f"Extracting {zip_file_path.name} directly to documents directory...")
-                print(f"Extracting {zip_file_path.name} directly to documents directory...")
+                # Near-duplicates of an archive extracted before add nothing new
+                if self.similarity_index is not None and self.similarity_index.skip_processing:
+                    match = self.similarity_index.check(zip_file_path)
+                    if match is not None and self.similarity_index.processed(match["path"], "zip"):
+                        logger.info(f"Skipping {zip_file_path.name}: near-duplicate of {match['path']}")
+                        self.similarity_index.record_skip(zip_file_path, "zip", zip_file_path.stat().st_size)
+                        duplicate_extractions += 1
+                        continue
+                started = time.process_time()
+                
+                logger.info(f"Extracting {zip_file_path.name} next to the zip file...")
+                print(f"Extracting {zip_file_path.name} next to the zip file...")
+                zip_entry = zip_entries[store.relative(zip_file_path)]
                 
                 # Extract the zip file
                 with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
                     # Check for potentially harmful paths (zip slip vulnerability protection)
                     files_to_extract = []
+                    claimed_paths = set()
                     for zip_info in zip_ref.infolist():
                         if zip_info.filename.startswith('..') or zip_info.filename.startswith('/'):
                             logger.warning(f"Skipping potentially unsafe path in zip file: {zip_info.filename}")
@@ -337,31 +750,37 @@ class DataCollector:
                         if not filename:
                             continue
                         
-                        # Check if target file already exists
-                        target_path = documents_dir / filename
-                        if target_path.exists():
-                            # Create a unique name to avoid conflicts
-                            base_name = target_path.stem
-                            extension = target_path.suffix
-                            counter = 1
-                            while target_path.exists():
-                                new_name = f"{base_name}_{counter}{extension}"
-                                target_path = documents_dir / new_name
-                                counter += 1
-                            
-                            # Rename the file in the extraction process
-                            zip_info.filename = new_name
-                        else:
-                            zip_info.filename = filename
+                        # Create a unique name if the manifest (or this zip) already has the file
+                        target_path = store.unique_path(zip_file_path.parent / filename, taken=claimed_paths)
+                        claimed_paths.add(target_path)
                         
-                        files_to_extract.append(zip_info)
+                        # Rename the file in the extraction process
+                        zip_info.filename = target_path.name
+                        files_to_extract.append((zip_info, target_path))
+                    
+                    # The zip's directory knows the unpacked size; wait for room before extracting
+                    unpacked_size = sum(zip_info.file_size for zip_info, _ in files_to_extract)
+                    if self.disk_guard is not None and not self.disk_guard.admit(unpacked_size, documents_dir,
+                                                                                 zip_file_path.name):
+                        logger.warning(f"Skipping {zip_file_path.name}: not enough disk space to extract it")
+                        print(f"⏭️ Skipping {zip_file_path.name}: not enough disk space to extract it")
+                        skipped_extractions += 1
+                        continue
                     
                     # Extract files one by one with controlled filenames
-                    for zip_info in files_to_extract:
-                        zip_ref.extract(zip_info, documents_dir)
-                        total_files_extracted += 1
+                    try:
+                        for zip_info, target_path in files_to_extract:
+                            zip_ref.extract(zip_info, target_path.parent)
+                            store.record(target_path, url=zip_entry["url"], article_id=zip_entry["article_id"],
+                                         origin=f"zip:{zip_entry['path']}", size=zip_info.file_size)
+                            total_files_extracted += 1
+                    finally:
+                        if self.disk_guard is not None:
+                            self.disk_guard.release(unpacked_size)
                 
                 successful_extractions += 1
+                if self.similarity_index is not None:
+                    self.similarity_index.record_cost(zip_file_path, "zip", time.process_time() - started)
                 logger.info(f"Successfully extracted {len(files_to_extract)} files from {zip_file_path.name}")
                 print(f"✅ Successfully extracted {len(files_to_extract)} files from {zip_file_path.name}")
                 
@@ -382,19 +801,24 @@ class DataCollector:
                   f"  Total files extracted: {total_files_extracted}\n" \
                   f"  Successfully processed zip files: {successful_extractions}\n" \
                   f"  Failed zip files: {failed_extractions}"
+        if skipped_extractions:
+            summary += f"\n  Skipped (no disk space): {skipped_extractions}"
+        if duplicate_extractions:
+            summary += f"\n  Skipped (near-duplicates of extracted archives): {duplicate_extractions}"
         
         logger.info(summary)
         print(summary)
         
         return successful_extractions
 
-    def clean_documents_directory(self, documents_dir=None):
+    def clean_documents_directory(self, documents_dir=None, confirm=True):
         """
         Clean the documents directory by removing files that aren't research documents
         (excluding spreadsheets)
         
         Args:
             documents_dir: Directory containing the documents (optional)
+            confirm: Ask before removing files (pass False for unattended runs)
         
         Returns:
             Number of files removed
@@ -403,6 +827,7 @@ class DataCollector:
         from pathlib import Path
         import logging
         from support.logging_service import Logger
+        from infrastructure.document_store import DocumentStore
         
         # Get logger instance
         logger = Logger.get_instance()
@@ -440,8 +865,9 @@ class DataCollector:
         # Explicitly define spreadsheet extensions to highlight they're being removed
         spreadsheet_extensions = {".xls", ".xlsx", ".csv", ".tsv", ".ods"}
         
-        # Find all files in the documents directory
-        all_files = list(documents_dir.glob("*"))
+        # Find all files in the documents directory (from the manifest, without listing the tree)
+        store = DocumentStore(documents_dir, layout=self.layout)
+        all_files = [documents_dir / entry["path"] for entry in store.entries()]
         
         # Count files by type
         file_type_counts = {}
@@ -449,9 +875,6 @@ class DataCollector:
         kept_files = []
         
         for file_path in all_files:
-            if file_path.is_dir():
-                continue  # Skip directories
-            
             extension = file_path.suffix.lower()
             
             # Count file types
@@ -493,13 +916,13 @@ class DataCollector:
                     status = "(Spreadsheet)" if ext in spreadsheet_extensions else ""
                     print(f"  {ext}: {count} files {status}")
             
-            confirm = input("\nDo you want to remove these non-document files? (y/n): ").strip().lower()
+            answer = input("\nDo you want to remove these non-document files? (y/n): ").strip().lower() if confirm else 'y'
             
-            if confirm == 'y' or confirm == 'yes':
+            if answer == 'y' or answer == 'yes':
                 # Remove files
                 for file_path in removed_files:
                     try:
-                        os.remove(file_path)
+                        store.remove(file_path)
                         if file_path.suffix.lower() in spreadsheet_extensions:
                             logger.info(f"Removed spreadsheet: {file_path.name}")
                         else:
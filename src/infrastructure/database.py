@@ -1 +1,284 @@
+import json
+import sqlite3
+import datetime
+import threading
+from pathlib import Path
 
+
+class CheckpointStore:
+    """
+    SQLite-backed record of harvest job progress.
+
+    Every unit of work (the esearch result, each efetch batch and each file
+    download) is committed as soon as it completes, so an interrupted run can
+    be resumed from the last finished unit instead of starting from zero.
+    """
+
+    def __init__(self, db_path="output/jobs.sqlite3"):
+        """Open (and create if needed) the checkpoint database"""
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        """Create the job tables if they don't exist"""
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    source TEXT,
+                    query TEXT,
+                    max_results INTEGER,
+                    output_dir TEXT,
+                    article_ids TEXT,
+                    status TEXT,
+                    created_at TEXT,
+                    updated_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS fetch_batches (
+                    job_id TEXT,
+                    batch_key TEXT,
+                    completed_at TEXT,
+                    PRIMARY KEY (job_id, batch_key)
+                );
+                CREATE TABLE IF NOT EXISTS results (
+                    job_id TEXT,
+                    article_id TEXT,
+                    links TEXT,
+                    PRIMARY KEY (job_id, article_id)
+                );
+                CREATE TABLE IF NOT EXISTS harvest_state (
+                    source TEXT,
+                    query TEXT,
+                    last_harvest TEXT,
+                    output_dir TEXT,
+                    PRIMARY KEY (source, query)
+                );
+                CREATE TABLE IF NOT EXISTS downloads (
+                    job_id TEXT,
+                    url TEXT,
+                    status TEXT,
+                    path TEXT,
+                    reason TEXT,
+                    updated_at TEXT,
+                    PRIMARY KEY (job_id, url)
+                );
+            """)
+            # Databases created before download reasons were recorded
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(downloads)")]
+            if "reason" not in columns:
+                self.conn.execute("ALTER TABLE downloads ADD COLUMN reason TEXT")
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().isoformat(timespec="seconds")
+
+    def close(self):
+        """Close the database connection"""
+        self.conn.close()
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def create_job(self, source, query, max_results, output_dir, job_id=None):
+        """
+        Register a new harvest job
+
+        Args:
+            source: Source key used to rebuild the handler on resume (e.g. "ncbi")
+            query: Search query
+            max_results: Maximum number of results requested
+            output_dir: Output directory the job writes into
+            job_id: Explicit job ID (optional, defaults to a timestamp)
+
+        Returns:
+            The job ID
+        """
+        generated = job_id is None
+        if generated:
+            job_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        now = self._now()
+        with self._lock, self.conn:
+            if generated:
+                # Scripted runs can start several jobs within one second
+                base_id, suffix = job_id, 1
+                while self.conn.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone():
+                    suffix += 1
+                    job_id = f"{base_id}-{suffix}"
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, source, query, max_results, output_dir, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'running', ?, ?)",
+                (job_id, source, query, max_results, str(output_dir), now, now)
+            )
+        return job_id
+
+    def get_job(self, job_id):
+        """Return the stored job as a dict, or None if it doesn't exist"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT job_id, source, query, max_results, output_dir, article_ids, status, created_at, updated_at "
+                "FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "source", "query", "max_results", "output_dir",
+                "article_ids", "status", "created_at", "updated_at")
+        job = dict(zip(keys, row))
+        job["article_ids"] = json.loads(job["article_ids"]) if job["article_ids"] else None
+        return job
+
+    def list_jobs(self, limit=10):
+        """Return the most recently updated jobs, newest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT job_id FROM jobs ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self.get_job(row[0]) for row in rows]
+
+    def set_status(self, job_id, status):
+        """Update the job status (running, completed, ...)"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?",
+                (status, self._now(), job_id)
+            )
+
+    def save_article_ids(self, job_id, article_ids):
+        """Record the esearch result so a resumed job doesn't search again"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET article_ids = ?, updated_at = ? WHERE job_id = ?",
+                (json.dumps(list(article_ids)), self._now(), job_id)
+            )
+
+    # ------------------------------------------------------------------
+    # Efetch batches and parsed results
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def batch_key(batch_ids):
+        """Stable key identifying an efetch batch by its IDs"""
+        return ",".join(batch_ids)
+
+    def is_batch_done(self, job_id, batch_ids):
+        """Check whether an efetch batch was already completed"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM fetch_batches WHERE job_id = ? AND batch_key = ?",
+                (job_id, self.batch_key(batch_ids))
+            ).fetchone()
+        return row is not None
+
+    def complete_batch(self, job_id, batch_ids, materials):
+        """
+        Record a finished efetch batch together with its parsed results
+
+        Args:
+            job_id: Job ID
+            batch_ids: IDs that were fetched in the batch
+            materials: Dictionary of article ID -> list of links found in the batch
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results (job_id, article_id, links) VALUES (?, ?, ?)",
+                [(job_id, article_id, json.dumps(list(links))) for article_id, links in materials.items()]
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO fetch_batches (job_id, batch_key, completed_at) VALUES (?, ?, ?)",
+                (job_id, self.batch_key(batch_ids), self._now())
+            )
+
+    def get_results(self, job_id):
+        """Return all parsed results recorded for the job"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT article_id, links FROM results WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {article_id: json.loads(links) for article_id, links in rows}
+
+    def count_results(self, job_id):
+        """Return the number of articles with supplementary materials recorded for the job"""
+        with self._lock:
+            row = self.conn.execute("SELECT COUNT(*) FROM results WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0]
+
+    # ------------------------------------------------------------------
+    # Incremental harvesting
+    # ------------------------------------------------------------------
+
+    def get_last_harvest(self, source, query):
+        """
+        Return when the query was last harvested successfully
+
+        Returns:
+            datetime.datetime of the last successful harvest, or None
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT last_harvest FROM harvest_state WHERE source = ? AND query = ?",
+                (source, query)
+            ).fetchone()
+        return datetime.datetime.fromisoformat(row[0]) if row else None
+
+    def set_last_harvest(self, source, query, harvested_at, output_dir):
+        """Record a successful harvest of the query"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO harvest_state (source, query, last_harvest, output_dir) VALUES (?, ?, ?, ?)",
+                (source, query, harvested_at.isoformat(timespec="seconds"), str(output_dir))
+            )
+
+    # ------------------------------------------------------------------
+    # Downloads
+    # ------------------------------------------------------------------
+
+    def record_download(self, job_id, url, status, path=None, reason=None):
+        """Record the outcome of a file download (downloaded, failed, rejected) and why it failed"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO downloads (job_id, url, status, path, reason, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, url, status, str(path) if path else None, reason, self._now())
+            )
+
+    def get_download_states(self, job_id):
+        """Return a dictionary of URL -> download status for the job"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT url, status FROM downloads WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def count_downloads(self, job_id):
+        """Return a dictionary of download status -> number of files for the job"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM downloads WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall()
+        return dict(rows)
+
+
+class JobCheckpoint:
+    """Checkpoint view bound to a single job, handed to the pipeline stages"""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+
+    def is_batch_done(self, batch_ids):
+        return self.store.is_batch_done(self.job_id, batch_ids)
+
+    def complete_batch(self, batch_ids, materials):
+        self.store.complete_batch(self.job_id, batch_ids, materials)
+
+    def get_results(self):
+        return self.store.get_results(self.job_id)
+
+    def record_download(self, url, status, path=None, reason=None):
+        self.store.record_download(self.job_id, url, status, path, reason)
+
+    def get_download_states(self):
+        return self.store.get_download_states(self.job_id)
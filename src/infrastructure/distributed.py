@@ -0,0 +1,305 @@
+import os
+import time
+import socket
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+
+from infrastructure.data_collector import DataCollector
+from infrastructure.queue_manager import SQLiteWorkQueue
+from support.supplement_results import SupplementResults
+
+
+class _Heartbeat:
+    """Keeps a unit's lease alive from a background thread while it is processed"""
+
+    def __init__(self, queue, unit_id, worker_id, lease_seconds):
+        self.queue = queue
+        self.unit_id = unit_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(self.unit_id, self.worker_id, self.lease_seconds):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class HarvestCoordinator:
+    """
+    Splits a query into work units that any number of HarvestWorker processes
+    (on this or other hosts sharing the queue database) pull and process.
+
+    The coordinator only searches; efetch batches and downloads are queued as
+    units, and the per-batch results are merged back from the queue.
+    """
+
+    def __init__(self, queue, source_handler):
+        """
+        Args:
+            queue: Work queue shared with the workers
+            source_handler: Handler used for the search
+        """
+        self.queue = queue
+        self.source_handler = source_handler
+
+    def submit(self, query, max_results=100, output_dir=None, download=False, oa_bulk=False):
+        """
+        Search and queue one efetch unit per fetch batch
+
+        Args:
+            query: Search query
+            max_results: Maximum number of results
+            output_dir: Output directory shared by all workers (optional)
+            download: Also queue a download unit per article with links
+            oa_bulk: Download Open Access supplements from the per-article OA package
+
+        Returns:
+            Number of efetch units queued
+        """
+        if output_dir is None:
+            output_dir = DataCollector().create_date_folder()
+        # One job per queue: results of an earlier job would leak into merge()
+        self.queue.clear()
+        self.queue.set_meta("submitted", False)
+        # Workers may run from other directories; give them an absolute path
+        self.queue.set_meta("output_dir", str(Path(output_dir).resolve()))
+        self.queue.set_meta("download", download)
+        self.queue.set_meta("oa_bulk", oa_bulk)
+
+        print(f"\nSearching for articles with keyword: '{query}'...")
+        article_ids = self.source_handler.search_articles(query, max_results)
+        batch_size = getattr(self.source_handler, "fetch_batch_size", 10)
+        chunks = [article_ids[i:i + batch_size] for i in range(0, len(article_ids), batch_size)]
+        queued = self.queue.enqueue("efetch", [{"article_ids": chunk} for chunk in chunks])
+        self.queue.set_meta("submitted", True)
+        print(f"Found {len(article_ids)} articles, queued {queued} fetch units")
+        return queued
+
+    def wait(self, poll_interval=2.0, timeout=None):
+        """
+        Block until every unit is done or failed
+
+        Returns:
+            False if the timeout expired first
+        """
+        started = time.monotonic()
+        last_stats = None
+        while not self.queue.is_finished():
+            stats = self.queue.stats()
+            if stats != last_stats:
+                progress = ", ".join(f"{kind} {status}: {count}" for (kind, status), count in sorted(stats.items()))
+                print(f"⏳ {progress}")
+                last_stats = stats
+            if timeout is not None and time.monotonic() - started > timeout:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def merge(self):
+        """Merge the results of all completed efetch units into one SupplementResults"""
+        results = SupplementResults()
+        for batch_results in self.queue.results("efetch"):
+            results.update(batch_results or {})
+        return results
+
+
+class HarvestWorker:
+    """
+    Pulls work units from a shared queue until the submitted job is finished.
+
+    efetch units save the links of their batch into the job's output directory
+    (and queue download units if the job downloads); download units fetch the
+    files of one article. Leases are kept alive with heartbeats, so a unit is
+    only handed to another worker when this one dies or hangs.
+    """
+
+    def __init__(self, queue, source_handler, worker_id=None, lease_seconds=60, session=None,
+                 access_manager=None, byte_limiter=None, disk_guard=None, layout="article", autotuner=None,
+                 metadata_store=None, similarity_index=None, oa_min_files=10):
+        """
+        Args:
+            queue: Work queue shared with the coordinator
+            source_handler: Handler used for efetch units
+            worker_id: Identifier of this worker (optional, defaults to host:pid)
+            lease_seconds: Lease duration, renewed every third of it
+            session: requests.Session shared for downloads (optional)
+            access_manager: AccessManager used by the downloads (optional)
+            byte_limiter: ByteRateLimiter pacing the downloads (optional)
+            disk_guard: DiskSpaceGuard admitting the downloads (optional)
+            layout: Subdirectories of the downloaded documents ("article", "hash" or "flat")
+            autotuner: ConcurrencyAutotuner shared by the downloads (optional)
+            metadata_store: MetadataStore resolving article IDs for the downloads (optional)
+            similarity_index: SimilarityIndex flagging near-duplicate downloads (optional)
+            oa_min_files: Supplements an article needs before the downloads
+                use its OA package (with oa_bulk)
+        """
+        self.queue = queue
+        self.source_handler = source_handler
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.session = session
+        self.access_manager = access_manager
+        self.byte_limiter = byte_limiter
+        self.disk_guard = disk_guard
+        self.layout = layout
+        self.autotuner = autotuner
+        self.metadata_store = metadata_store
+        self.similarity_index = similarity_index
+        self.oa_min_files = oa_min_files
+        self.processed = 0
+
+    def run(self, poll_interval=1.0, idle_timeout=None):
+        """
+        Process units until the job is submitted and finished
+
+        Args:
+            poll_interval: Seconds to wait when no unit is available
+            idle_timeout: Stop after this many idle seconds (optional)
+
+        Returns:
+            Number of units processed
+        """
+        idle_since = time.monotonic()
+        while True:
+            unit = self.queue.lease(self.worker_id, lease_seconds=self.lease_seconds)
+            if unit is None:
+                if self.queue.get_meta("submitted", False) and self.queue.is_finished():
+                    break
+                if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            with _Heartbeat(self.queue, unit.unit_id, self.worker_id, self.lease_seconds) as heartbeat:
+                try:
+                    result = self.process(unit)
+                except Exception as e:
+                    print(f"⚠️ {self.worker_id}: unit {unit.unit_id} failed: {e}")
+                    self.queue.fail(unit.unit_id, self.worker_id, e)
+                    continue
+            if heartbeat.lost or not self.queue.complete(unit.unit_id, self.worker_id, result):
+                print(f"⚠️ {self.worker_id}: lost the lease on unit {unit.unit_id}, result discarded")
+                continue
+            self.processed += 1
+            idle_since = time.monotonic()
+        return self.processed
+
+    def process(self, unit):
+        """
+        Process one unit and return its JSON-serializable result
+
+        Raises whatever failed the unit, so run() hands it back to the queue;
+        an efetch unit that could only be fetched in part raises
+        IncompleteFetchError instead of completing with partial links.
+        """
+        output_dir = Path(self.queue.get_meta("output_dir"))
+        if unit.kind == "efetch":
+            materials = self.source_handler.get_supplementary_materials(unit.payload["article_ids"])
+            data_collector = DataCollector(session=self.session)
+            downloads = []
+            for article_id, links in materials.items():
+                if not links:
+                    continue
+                os.makedirs(output_dir, exist_ok=True)
+                link_file = data_collector.save_links_to_file(article_id, links, output_dir, "ncbi")
+                downloads.append({"article_id": article_id, "link_file": link_file})
+            if downloads and self.queue.get_meta("download", False):
+                self.queue.enqueue("download", downloads)
+            return dict(materials.items())
+
+        if unit.kind == "download":
+            data_collector = DataCollector(session=self.session, byte_limiter=self.byte_limiter,
+                                           disk_guard=self.disk_guard, layout=self.layout,
+                                           autotuner=self.autotuner, metadata_store=self.metadata_store,
+                                           similarity_index=self.similarity_index,
+                                           rate_limiter=getattr(self.source_handler, "rate_limiter", None),
+                                           oa_min_files=self.oa_min_files)
+            downloaded = data_collector.download_all_documents(
+                output_dir,
+                oa_bulk=self.queue.get_meta("oa_bulk", False),
+                access_manager=self.access_manager,
+                link_files=[unit.payload["link_file"]]
+            )
+            return {"article_id": unit.payload["article_id"], "downloaded": downloaded}
+
+        raise ValueError(f"Unknown unit kind: {unit.kind}")
+
+
+def _simulated_node(queue_path, xml_path, worker_id, lease_seconds, crash):
+    """Entry point of a simulated worker process"""
+    from core.source_handlers.replay_handler import XmlReplayHandler
+
+    queue = SQLiteWorkQueue(queue_path)
+    if crash:
+        # Take a unit and die without completing it; its lease has to expire
+        while queue.lease(worker_id, lease_seconds=lease_seconds) is None:
+            time.sleep(0.1)
+        os._exit(1)
+    HarvestWorker(queue, XmlReplayHandler(xml_path), worker_id=worker_id,
+                  lease_seconds=lease_seconds).run(poll_interval=0.2)
+
+
+def simulate_nodes(xml_path, nodes=3, lease_seconds=2, crash=True):
+    """
+    Run a coordinator and several worker processes against saved efetch XML
+    and check that the merged output equals a single-process replay
+
+    Args:
+        xml_path: Saved XML file, directory or XmlArchive used by every node
+        nodes: Number of worker processes
+        lease_seconds: Lease duration (short, so the crashed unit is requeued quickly)
+        crash: Let the first node die while holding a lease
+
+    Returns:
+        Dictionary with the merged results and a comparison report
+    """
+    from core.source_handlers.replay_handler import XmlReplayHandler
+
+    handler = XmlReplayHandler(xml_path)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        queue_path = Path(temp_dir) / "queue.sqlite3"
+        queue = SQLiteWorkQueue(queue_path)
+        coordinator = HarvestCoordinator(queue, handler)
+        units = coordinator.submit("simulation", max_results=len(handler.articles),
+                                   output_dir=Path(temp_dir) / "output")
+
+        started = time.monotonic()
+        processes = [
+            multiprocessing.Process(target=_simulated_node,
+                                    args=(str(queue_path), str(xml_path), f"node-{i}", lease_seconds, crash and i == 0))
+            for i in range(nodes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.monotonic() - started
+
+        merged = coordinator.merge()
+        expected = handler.get_supplementary_materials(list(handler.articles))
+        report = {
+            "nodes": nodes,
+            "units": units,
+            "requeued": queue.retried(),
+            "stats": queue.stats(),
+            "articles": len(merged),
+            "links": sum(len(links) for links in merged.values()),
+            "matches_single_process": merged == expected,
+            "elapsed": elapsed
+        }
+        queue.close()
+    return {"results": merged, "report": report}
@@ -0,0 +1,251 @@
+import os
+import json
+import hashlib
+import datetime
+import threading
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.jsonl"
+
+# flat: documents/<file>
+# article: documents/PMC<id>/<file>
+# hash: documents/<2 hex digits of the file name's hash>/<file>
+LAYOUTS = ("flat", "article", "hash")
+
+# Origins of files that are the content of their source URL
+URL_ORIGINS = ("download", "oa_package")
+
+
+class DocumentStore:
+    """
+    Documents directory split into subdirectories, with an append-only manifest.
+
+    Files are placed per article (or under a hash prefix of their name) so no
+    single directory grows to hundreds of thousands of entries. Every file
+    written or removed is appended to ``manifest.jsonl`` as one JSON line with
+    its path, size, type and source URL; the latest line of a path wins and
+    removals are recorded as ``{"path": ..., "removed": true}``.
+
+    Existence checks, cleanup, stats and resume read the manifest (loaded once
+    into memory) instead of listing or stat'ing the tree. A directory without
+    a manifest, e.g. one written before the manifest existed, is scanned once
+    to create it.
+
+    Appends are single short writes, so several processes can share a
+    manifest, but each store only sees the entries it loaded or wrote itself.
+    """
+
+    def __init__(self, documents_dir, layout="article"):
+        """
+        Args:
+            documents_dir: Root documents directory
+            layout: Placement of new files: "flat", "article" or "hash"
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown documents layout: {layout} (expected one of {', '.join(LAYOUTS)})")
+        self.documents_dir = Path(documents_dir)
+        self.layout = layout
+        self.manifest_path = self.documents_dir / MANIFEST_NAME
+        self._entries = {}  # relative path -> entry
+        self._urls = {}     # source URL -> relative path
+        self._lock = threading.Lock()
+        os.makedirs(self.documents_dir, exist_ok=True)
+        if self.manifest_path.exists():
+            self._load()
+        else:
+            self.rebuild()
+
+    def _load(self):
+        """Replay the manifest into memory"""
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash; everything before it is intact
+                    continue
+                self._apply(entry)
+
+    def _apply(self, entry):
+        path = entry["path"]
+        previous = self._entries.pop(path, None)
+        if previous is not None and self._urls.get(previous.get("url")) == path:
+            del self._urls[previous["url"]]
+        if entry.get("removed"):
+            return
+        self._entries[path] = entry
+        # Files unpacked from a zip or saved from a rejected response don't stand for their URL
+        if entry.get("url") and entry.get("origin") in URL_ORIGINS:
+            self._urls[entry["url"]] = path
+
+    def _append(self, entries):
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+
+    def rebuild(self):
+        """Index the files already in the directory and start a new manifest"""
+        entries = []
+        for path in sorted(self.documents_dir.rglob("*")):
+            if path.name == MANIFEST_NAME or not path.is_file():
+                continue
+            entries.append(self._entry(path, path.stat().st_size, origin="scan"))
+        with self._lock:
+            self._entries.clear()
+            self._urls.clear()
+            temp_path = self.manifest_path.with_name(f"{MANIFEST_NAME}.part")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+            os.replace(temp_path, self.manifest_path)
+            for entry in entries:
+                self._apply(entry)
+        return len(entries)
+
+    def compact(self):
+        """Rewrite the manifest with only the live entries (drops replaced and removed lines)"""
+        with self._lock:
+            temp_path = self.manifest_path.with_name(f"{MANIFEST_NAME}.part")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for entry in self._entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.manifest_path)
+
+    def shard(self, filename, article_id=None):
+        """Return the directory (relative to the documents directory) a new file goes in"""
+        if self.layout == "article" and article_id and article_id != "unknown":
+            article_id = str(article_id)
+            return article_id if article_id.upper().startswith("PMC") else f"PMC{article_id}"
+        if self.layout == "flat":
+            return ""
+        return hashlib.md5(filename.encode("utf-8")).hexdigest()[:2]
+
+    def path_for(self, filename, article_id=None):
+        """Return the path a file is stored at"""
+        return self.documents_dir / self.shard(filename, article_id) / filename
+
+    def relative(self, path):
+        """Return a path relative to the documents directory, as stored in the manifest"""
+        path = Path(path)
+        try:
+            return path.relative_to(self.documents_dir).as_posix()
+        except ValueError:
+            pass
+        if path.is_absolute():
+            return path.resolve().relative_to(self.documents_dir.resolve()).as_posix()
+        # Already relative to the documents directory
+        return path.as_posix()
+
+    def _entry(self, path, size, url=None, article_id=None, origin="download", content_type=None, recorded_at=None):
+        suffix = Path(path).suffix.lower().lstrip(".")
+        entry = {
+            "path": self.relative(path),
+            "size": size,
+            "type": suffix or "unknown",
+            "url": url,
+            "article_id": article_id,
+            "origin": origin,
+            "recorded_at": recorded_at or datetime.datetime.now().isoformat(timespec="seconds")
+        }
+        if content_type:
+            entry["content_type"] = content_type
+        return entry
+
+    def record(self, path, url=None, article_id=None, origin="download", size=None, content_type=None,
+               recorded_at=None):
+        """
+        Append a file that was just written to the manifest
+
+        Args:
+            path: Path of the file
+            url: URL it was downloaded from (optional)
+            article_id: Article it belongs to (optional)
+            origin: How it got here, e.g. "download", "oa_package" or "zip:<archive path>"
+            size: Size in bytes (optional, read from the file if omitted)
+            content_type: Content-Type the server sent (optional)
+            recorded_at: When the file was fetched, if not now (e.g. imported from a cache bundle)
+        """
+        if size is None:
+            size = Path(path).stat().st_size
+        entry = self._entry(path, size, url, article_id, origin, content_type, recorded_at)
+        with self._lock:
+            self._append([entry])
+            self._apply(entry)
+        return entry
+
+    def remove(self, path):
+        """Delete a file and record its removal"""
+        relative = self.relative(path)
+        try:
+            os.remove(self.documents_dir / relative)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._append([{"path": relative, "removed": True}])
+            self._apply({"path": relative, "removed": True})
+
+    def __contains__(self, path):
+        return self.relative(path) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path):
+        """Return the manifest entry of a file, or None"""
+        return self._entries.get(self.relative(path))
+
+    def path_for_url(self, url):
+        """Return the path of the file downloaded from a URL, or None"""
+        relative = self._urls.get(url)
+        return self.documents_dir / relative if relative is not None else None
+
+    def find(self, filename, article_id=None, url=None):
+        """
+        Return the path of an already stored file, or None
+
+        Looks up the source URL, the file's place in the current layout and
+        the top level (where files of a flat directory are).
+        """
+        path = self.path_for_url(url) if url else None
+        if path is not None:
+            return path
+        for path in (self.path_for(filename, article_id), self.documents_dir / filename):
+            if path in self:
+                return path
+        return None
+
+    def unique_path(self, path, taken=()):
+        """
+        Return path, or path with a _1, _2, ... suffix if the manifest already has a file there
+
+        Args:
+            path: Wanted path
+            taken: Paths claimed by files not recorded yet (optional)
+        """
+        path = Path(path)
+        candidate = path
+        counter = 1
+        while candidate in self or candidate in taken:
+            candidate = path.with_name(f"{path.stem}_{counter}{path.suffix}")
+            counter += 1
+        return candidate
+
+    def entries(self, suffixes=None):
+        """
+        Return the manifest entries of the stored files
+
+        Args:
+            suffixes: Only files with these extensions, e.g. {".zip"} (optional)
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+        if suffixes is not None:
+            entries = [entry for entry in entries if Path(entry["path"]).suffix.lower() in suffixes]
+        return entries
+
+    def stats(self):
+        """Return the number of files, total bytes and file count per type"""
+        types = {}
+        total = 0
+        for entry in self.entries():
+            types[entry["type"]] = types.get(entry["type"], 0) + 1
+            total += entry["size"] or 0
+        return {"files": len(self._entries), "bytes": total, "types": types}
@@ -0,0 +1,256 @@
+import json
+import re
+import sqlite3
+import datetime
+import threading
+from pathlib import Path
+
+FIELDS = ("pmcid", "pmid", "doi", "title", "journal", "pub_date", "authors", "source", "open_access")
+PMCID_PATTERN = re.compile(r"^(?:pmcid:)?(?:PMC)?(\d+)$", re.IGNORECASE)
+PMID_PATTERN = re.compile(r"^pmid:\s*(\d+)$", re.IGNORECASE)
+DOI_PATTERN = re.compile(r"^(?:doi:\s*|https?://(?:dx\.)?doi\.org/)?(10\.\d{4,9}/\S+)$", re.IGNORECASE)
+
+
+def parse_identifier(identifier):
+    """
+    Classify an article identifier
+
+    PMC IDs may be given with or without the "PMC" prefix; PMIDs need a
+    "pmid:" prefix to tell them apart from bare PMC IDs; DOIs may be given as
+    "doi:..." or doi.org URLs.
+
+    Returns:
+        (kind, value) with kind "pmcid" (digits only), "pmid" or "doi"
+        (lower case), or (None, identifier) if it isn't recognized
+    """
+    identifier = str(identifier).strip()
+    match = PMCID_PATTERN.match(identifier)
+    if match:
+        return "pmcid", match.group(1)
+    match = PMID_PATTERN.match(identifier)
+    if match:
+        return "pmid", match.group(1)
+    match = DOI_PATTERN.match(identifier)
+    if match:
+        return "doi", match.group(1).lower()
+    return None, identifier
+
+
+class MetadataStore:
+    """
+    SQLite store of the PMCID/PMID/DOI crosswalk and core bibliographic fields.
+
+    Records are keyed by PMC ID (digits only, like the handlers' article IDs)
+    and indexed by PMID and DOI, so any stage can map identifiers and look up
+    titles locally. Records from several sources are merged field by field:
+    a later lookup fills in missing fields but never blanks known ones.
+
+    ``open_access`` tells whether the article is in PMC's Open Access subset
+    (None while unknown), as marked in its efetch XML.
+    """
+
+    def __init__(self, db_path="output/metadata.sqlite3"):
+        """Open (and create if needed) the metadata store; ":memory:" keeps it in memory"""
+        self.db_path = Path(db_path)
+        if str(db_path) != ":memory:":
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        """Create the article table if it doesn't exist"""
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    pmcid TEXT PRIMARY KEY,
+                    pmid TEXT,
+                    doi TEXT,
+                    title TEXT,
+                    journal TEXT,
+                    pub_date TEXT,
+                    authors TEXT,
+                    source TEXT,
+                    open_access INTEGER,
+                    updated_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS articles_pmid ON articles (pmid);
+                CREATE INDEX IF NOT EXISTS articles_doi ON articles (doi);
+            """)
+            # Stores created before the Open Access status was recorded
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(articles)")]
+            if "open_access" not in columns:
+                self.conn.execute("ALTER TABLE articles ADD COLUMN open_access INTEGER")
+
+    @staticmethod
+    def _row_to_record(row):
+        record = dict(zip(FIELDS, row))
+        record["authors"] = json.loads(record["authors"]) if record["authors"] else []
+        record["open_access"] = None if record["open_access"] is None else bool(record["open_access"])
+        return record
+
+    @staticmethod
+    def _open_access(record):
+        """Column value of a record's Open Access status (False is known, not missing)"""
+        return None if record.get("open_access") is None else int(bool(record["open_access"]))
+
+    def upsert(self, records):
+        """
+        Merge article records into the store
+
+        Args:
+            records: Iterable of dictionaries with "pmcid" (digits, with or
+                without the PMC prefix) and any of the other FIELDS; records
+                without a PMC ID are skipped
+
+        Returns:
+            Number of records stored
+        """
+        rows = []
+        now = datetime.datetime.now().isoformat()
+        for record in records:
+            kind, pmcid = parse_identifier(record.get("pmcid") or "")
+            if kind != "pmcid":
+                continue
+            doi = (record.get("doi") or "").strip().lower() or None
+            authors = json.dumps(record["authors"]) if record.get("authors") else None
+            rows.append((pmcid, record.get("pmid") or None, doi, record.get("title") or None,
+                         record.get("journal") or None, record.get("pub_date") or None, authors,
+                         record.get("source"), self._open_access(record), now))
+        with self._lock, self.conn:
+            self.conn.executemany("""
+                INSERT INTO articles (pmcid, pmid, doi, title, journal, pub_date, authors, source, open_access,
+                                      updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (pmcid) DO UPDATE SET
+                    pmid = COALESCE(excluded.pmid, pmid),
+                    doi = COALESCE(excluded.doi, doi),
+                    title = COALESCE(excluded.title, title),
+                    journal = COALESCE(excluded.journal, journal),
+                    pub_date = COALESCE(excluded.pub_date, pub_date),
+                    authors = COALESCE(excluded.authors, authors),
+                    source = COALESCE(excluded.source, source),
+                    open_access = COALESCE(excluded.open_access, open_access),
+                    updated_at = excluded.updated_at
+            """, rows)
+        return len(rows)
+
+    def iter_records(self, since=None):
+        """
+        Yield every stored record with its "updated_at" timestamp
+
+        Args:
+            since: Only records updated at or after this ISO timestamp (optional)
+        """
+        with self._lock:
+            rows = self.conn.execute(f"SELECT {', '.join(FIELDS)}, updated_at FROM articles WHERE updated_at >= ?",
+                                     (since or "",)).fetchall()
+        for row in rows:
+            record = self._row_to_record(row[:-1])
+            record["updated_at"] = row[-1]
+            yield record
+
+    def merge(self, records):
+        """
+        Merge records exported from another store
+
+        A field known on both sides keeps the value of the more recently
+        updated record; fields only one side knows are filled in.
+
+        Args:
+            records: Iterable of records as yielded by iter_records
+
+        Returns:
+            Number of records added or changed
+        """
+        rows = []
+        for record in records:
+            kind, pmcid = parse_identifier(record.get("pmcid") or "")
+            if kind != "pmcid" or not record.get("updated_at"):
+                continue
+            authors = json.dumps(record["authors"]) if record.get("authors") else None
+            rows.append((pmcid, record.get("pmid") or None, record.get("doi") or None, record.get("title") or None,
+                         record.get("journal") or None, record.get("pub_date") or None, authors,
+                         record.get("source"), self._open_access(record), record["updated_at"]))
+        updates = ",\n".join(
+            f"{field} = CASE WHEN excluded.updated_at > updated_at THEN COALESCE(excluded.{field}, {field}) "
+            f"ELSE COALESCE({field}, excluded.{field}) END" for field in FIELDS[1:]
+        )
+        # Records that are neither newer nor fill a gap leave the row untouched
+        changes = " OR ".join(f"({field} IS NULL AND excluded.{field} IS NOT NULL)" for field in FIELDS[1:])
+        with self._lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(f"""
+                INSERT INTO articles (pmcid, pmid, doi, title, journal, pub_date, authors, source, open_access,
+                                      updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (pmcid) DO UPDATE SET
+                    {updates},
+                    updated_at = MAX(updated_at, excluded.updated_at)
+                WHERE excluded.updated_at > updated_at OR {changes}
+            """, rows)
+            return self.conn.total_changes - before
+
+    def get(self, pmcid):
+        """Return the record of a PMC ID, or None if it isn't stored"""
+        return self.get_many([pmcid]).get(parse_identifier(pmcid)[1])
+
+    def get_many(self, pmcids, chunk_size=500):
+        """
+        Return the stored records of several PMC IDs
+
+        Returns:
+            Dictionary of PMC ID (digits) -> record; unknown IDs are left out
+        """
+        pmcids = [parse_identifier(pmcid)[1] for pmcid in pmcids]
+        records = {}
+        with self._lock:
+            for i in range(0, len(pmcids), chunk_size):
+                chunk = pmcids[i:i + chunk_size]
+                rows = self.conn.execute(
+                    f"SELECT {', '.join(FIELDS)} FROM articles WHERE pmcid IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for row in rows:
+                    records[row[0]] = self._row_to_record(row)
+        return records
+
+    def missing(self, pmcids, fields=("title",)):
+        """Return the PMC IDs that aren't stored or lack any of the given fields"""
+        records = self.get_many(pmcids)
+        return [pmcid for pmcid in (parse_identifier(pmcid)[1] for pmcid in pmcids)
+                if pmcid not in records or any(not records[pmcid].get(field) for field in fields)]
+
+    def resolve(self, identifier):
+        """
+        Map a PMC ID, PMID ("pmid:...") or DOI to the PMC ID stored for it
+
+        Returns:
+            PMC ID (digits only; PMC IDs map to themselves), or None if the
+            identifier isn't known
+        """
+        kind, value = parse_identifier(identifier)
+        if kind == "pmcid":
+            return value
+        if kind is None:
+            return None
+        with self._lock:
+            row = self.conn.execute(f"SELECT pmcid FROM articles WHERE {kind} = ? LIMIT 1", (value,)).fetchone()
+        return row[0] if row else None
+
+    def resolve_many(self, identifiers):
+        """Return a dictionary of identifier -> PMC ID for the identifiers known locally"""
+        resolved = {}
+        for identifier in identifiers:
+            pmcid = self.resolve(identifier)
+            if pmcid is not None:
+                resolved[identifier] = pmcid
+        return resolved
+
+    def stats(self):
+        """Return record counts of the store"""
+        with self._lock:
+            articles, pmids, dois = self.conn.execute(
+                "SELECT COUNT(*), COUNT(pmid), COUNT(doi) FROM articles"
+            ).fetchone()
+        return {"articles": articles, "with_pmid": pmids, "with_doi": dois}
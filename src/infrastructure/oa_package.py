@@ -0,0 +1,126 @@
+import os
+import shutil
+import tarfile
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+
+import requests
+
+from support.rate_limiter import RateLimiter
+
+OA_SERVICE_URL = "https://www.ncbi.nlm.nih.gov/pmc/utils/oa/oa.fcgi"
+
+
+class OAPackageDownloader:
+    """
+    Downloads supplementary files of PMC Open Access articles from the
+    per-article package (a tar.gz with the full text and every supplement)
+    instead of fetching each file separately.
+
+    The OA web service is an NCBI endpoint, so its lookups are paced by the
+    E-utilities rate limiter shared with the NCBI handler.
+    """
+
+    def __init__(self, session=None, timeout=60, byte_limiter=None, disk_guard=None, rate_limiter=None):
+        """
+        Args:
+            session: requests.Session to reuse (optional)
+            timeout: Request timeout in seconds
+            byte_limiter: ByteRateLimiter pacing the package stream (optional)
+            disk_guard: DiskSpaceGuard admitting each extracted file (optional)
+            rate_limiter: RateLimiter of NCBI requests (optional, defaults to
+                3 requests per second, NCBI's limit without an API key)
+        """
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter or RateLimiter(requests_per_second=3)
+        self.timeout = timeout
+        self.byte_limiter = byte_limiter
+        self.disk_guard = disk_guard
+
+    def get_package_url(self, pmc_id):
+        """
+        Look up the article's OA package via the PMC OA web service
+
+        Args:
+            pmc_id: PMC ID with or without the "PMC" prefix
+
+        Returns:
+            HTTPS URL of the tar.gz package, or None if the article isn't in the OA subset
+        """
+        pmc_id = str(pmc_id)
+        if not pmc_id.upper().startswith("PMC"):
+            pmc_id = f"PMC{pmc_id}"
+
+        self.rate_limiter.acquire()
+        response = self.session.get(OA_SERVICE_URL, params={"id": pmc_id}, timeout=self.timeout)
+        response.raise_for_status()
+        root = ET.fromstring(response.content)
+
+        # Articles outside the OA subset come back as <error code="idIsNotOpenAccess">
+        if root.find(".//error") is not None:
+            return None
+        link = root.find(".//record/link[@format='tgz']")
+        if link is None or not link.get("href"):
+            return None
+        # The service advertises FTP links; the same path is served over HTTPS
+        return link.get("href").replace("ftp://", "https://", 1)
+
+    def download_supplements(self, pmc_id, wanted_files, documents_dir, target_paths=None):
+        """
+        Stream the article's OA package and extract only the wanted supplement files
+
+        Args:
+            pmc_id: PMC ID of the article
+            wanted_files: Dictionary of filename -> original supplement URL
+            documents_dir: Directory the files are written to
+            target_paths: Dictionary of filename -> path overriding documents_dir (optional)
+
+        Returns:
+            Dictionary of original URL -> path of each extracted file
+            (empty if the article isn't open access)
+        """
+        package_url = self.get_package_url(pmc_id)
+        if package_url is None:
+            return {}
+
+        extracted = {}
+        response = self.session.get(package_url, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        stream = response.raw
+        if self.byte_limiter is not None:
+            stream = self.byte_limiter.wrap(urlparse(package_url).hostname or "unknown", stream)
+        try:
+            # "r|gz" reads the archive as a stream without buffering the whole package
+            with tarfile.open(fileobj=stream, mode="r|gz") as package:
+                for member in package:
+                    if not member.isfile():
+                        continue
+                    # Only the basename is used, which also guards against path traversal
+                    filename = os.path.basename(member.name)
+                    if filename not in wanted_files:
+                        continue
+
+                    # Files without room are left to the per-file downloads, which defer them
+                    if self.disk_guard is not None and not self.disk_guard.admit(member.size, documents_dir,
+                                                                                 filename, wait=False):
+                        continue
+
+                    target_path = (target_paths or {}).get(filename) or documents_dir / filename
+                    temp_path = target_path.with_name(f"{filename}.part")
+                    os.makedirs(target_path.parent, exist_ok=True)
+                    source = package.extractfile(member)
+                    try:
+                        with open(temp_path, "wb") as out_file:
+                            shutil.copyfileobj(source, out_file)
+                    finally:
+                        if self.disk_guard is not None:
+                            self.disk_guard.release(member.size)
+                    os.replace(temp_path, target_path)
+                    extracted[wanted_files[filename]] = target_path
+
+                    if len(extracted) == len(wanted_files):
+                        break
+        finally:
+            response.close()
+
+        return extracted
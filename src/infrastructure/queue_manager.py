@@ -1 +1,279 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
 
+# Rollback journal modes work on network filesystems; WAL only on a local disk
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "WAL")
+
+
+class BaseWorkQueue(ABC):
+    """
+    Queue of work units shared by a coordinator and any number of workers.
+
+    Units are leased rather than popped: a worker that dies without
+    completing its unit lets the lease expire and the unit is handed to
+    another worker. Implementations can be backed by any broker; SQLiteWorkQueue
+    is the stand-in that works on a single machine or on shared storage.
+    """
+
+    @abstractmethod
+    def enqueue(self, kind, payloads):
+        pass
+
+    @abstractmethod
+    def lease(self, worker_id, kinds=None, lease_seconds=60):
+        pass
+
+    @abstractmethod
+    def heartbeat(self, unit_id, worker_id, lease_seconds=60):
+        pass
+
+    @abstractmethod
+    def complete(self, unit_id, worker_id, result=None):
+        pass
+
+    @abstractmethod
+    def fail(self, unit_id, worker_id, error):
+        pass
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+
+class WorkUnit:
+    """A leased unit of work"""
+
+    __slots__ = ("unit_id", "kind", "payload", "attempts")
+
+    def __init__(self, unit_id, kind, payload, attempts):
+        self.unit_id = unit_id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"WorkUnit({self.unit_id}, {self.kind}, attempt {self.attempts})"
+
+
+class SQLiteWorkQueue(BaseWorkQueue):
+    """
+    Work queue stored in an SQLite database.
+
+    Every state change runs in an IMMEDIATE transaction, so several processes
+    (or hosts sharing the database file) can lease units without handing the
+    same unit out twice.
+
+    The database uses SQLite's rollback journal by default, which relies only
+    on file locks and so works on a network filesystem shared by several
+    hosts. WAL needs shared memory between the processes: it is faster, but
+    only safe when every node runs on the same machine with the file on a
+    local disk.
+    """
+
+    def __init__(self, db_path, max_attempts=3, journal_mode="DELETE"):
+        """
+        Args:
+            db_path: Path of the queue database
+            max_attempts: Number of leases a unit gets before it is marked failed
+            journal_mode: SQLite journal mode, "DELETE" (shared storage) or
+                "WAL" (local disk only)
+
+        Raises:
+            ValueError: Unsupported journal mode
+        """
+        journal_mode = journal_mode.upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unsupported journal mode: {journal_mode}")
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), timeout=60, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS units (
+                unit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT,
+                payload TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS units_status ON units (status, kind);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+
+    def _transaction(self, fn):
+        """Run fn(cursor) inside an IMMEDIATE transaction"""
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(cursor)
+                cursor.execute("COMMIT")
+                return result
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        """Close the database connection"""
+        self.conn.close()
+
+    def clear(self):
+        """Remove all units and settings of a previous job"""
+        self._transaction(lambda c: (c.execute("DELETE FROM units"), c.execute("DELETE FROM meta")))
+
+    def set_meta(self, key, value):
+        """Store a job-wide setting (output directory, options, ...)"""
+        self._transaction(lambda c: c.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value))
+        ))
+
+    def get_meta(self, key, default=None):
+        """Read a job-wide setting"""
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def enqueue(self, kind, payloads):
+        """
+        Add work units
+
+        Args:
+            kind: Unit type, e.g. "efetch" or "download"
+            payloads: List of JSON-serializable payloads, one per unit
+
+        Returns:
+            Number of units added
+        """
+        now = time.time()
+        rows = [(kind, json.dumps(payload), now) for payload in payloads]
+        self._transaction(lambda c: c.executemany(
+            "INSERT INTO units (kind, payload, updated_at) VALUES (?, ?, ?)", rows
+        ))
+        return len(rows)
+
+    def lease(self, worker_id, kinds=None, lease_seconds=60):
+        """
+        Lease the next pending unit, requeueing units whose lease expired
+
+        Args:
+            worker_id: Identifier of the leasing worker
+            kinds: Unit types this worker accepts (optional)
+            lease_seconds: Lease duration; extend it with heartbeat()
+
+        Returns:
+            WorkUnit, or None if nothing is available
+        """
+        def take(cursor):
+            now = time.time()
+            # Expired leases go back to the queue, or fail after too many attempts
+            cursor.execute(
+                "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_owner = NULL, error = COALESCE(error, 'lease expired'), updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ?",
+                (self.max_attempts, now, now)
+            )
+            query = "SELECT unit_id, kind, payload, attempts FROM units WHERE status = 'pending'"
+            params = []
+            if kinds:
+                query += f" AND kind IN ({','.join('?' for _ in kinds)})"
+                params.extend(kinds)
+            row = cursor.execute(query + " ORDER BY unit_id LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            unit_id, kind, payload, attempts = row
+            cursor.execute(
+                "UPDATE units SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE unit_id = ?",
+                (worker_id, now + lease_seconds, now, unit_id)
+            )
+            return WorkUnit(unit_id, kind, json.loads(payload), attempts + 1)
+
+        return self._transaction(take)
+
+    def heartbeat(self, unit_id, worker_id, lease_seconds=60):
+        """
+        Extend a lease while the unit is still being worked on
+
+        Returns:
+            False if the lease was lost (expired and taken by another worker)
+        """
+        def extend(cursor):
+            cursor.execute(
+                "UPDATE units SET lease_expires = ?, updated_at = ? "
+                "WHERE unit_id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time() + lease_seconds, time.time(), unit_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(extend)
+
+    def complete(self, unit_id, worker_id, result=None):
+        """
+        Mark a leased unit as done and store its result
+
+        Returns:
+            False if the worker no longer held the lease (the result is discarded)
+        """
+        def finish(cursor):
+            cursor.execute(
+                "UPDATE units SET status = 'done', result = ?, lease_owner = NULL, updated_at = ? "
+                "WHERE unit_id = ? AND lease_owner = ? AND status = 'leased'",
+                (json.dumps(result), time.time(), unit_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(finish)
+
+    def fail(self, unit_id, worker_id, error):
+        """Release a unit after an error; it is retried until max_attempts is reached"""
+        self._transaction(lambda c: c.execute(
+            "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_owner = NULL, error = ?, updated_at = ? "
+            "WHERE unit_id = ? AND lease_owner = ? AND status = 'leased'",
+            (self.max_attempts, str(error), time.time(), unit_id, worker_id)
+        ))
+
+    def stats(self):
+        """Return a dictionary of (kind, status) -> unit count"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT kind, status, COUNT(*) FROM units GROUP BY kind, status"
+            ).fetchall()
+        return {(kind, status): count for kind, status, count in rows}
+
+    def is_finished(self):
+        """Check whether no unit is pending or leased"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM units WHERE status IN ('pending', 'leased')"
+            ).fetchone()
+        return row[0] == 0
+
+    def retried(self):
+        """Return the number of units that needed more than one lease"""
+        with self._lock:
+            row = self.conn.execute("SELECT COUNT(*) FROM units WHERE attempts > 1").fetchone()
+        return row[0]
+
+    def results(self, kind):
+        """Return the results of all completed units of a kind"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT result FROM units WHERE kind = ? AND status = 'done' ORDER BY unit_id", (kind,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
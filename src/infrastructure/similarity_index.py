@@ -0,0 +1,337 @@
+import sqlite3
+import struct
+import hashlib
+import datetime
+import threading
+from pathlib import Path
+
+NUM_BINS = 64         # Signature length (MinHash values per file)
+BANDS = 16            # LSH bands of NUM_BINS // BANDS values each
+ANCHOR = b"\n"        # Chunk boundary byte; content-defined, so insertions only change nearby chunks
+MAX_CHUNK = 4096      # Longer runs without an anchor are cut at this length
+MIN_CHUNKS = 8        # Files with fewer distinct chunks only match exact copies
+READ_SIZE = 1024 * 1024
+
+
+def _chunk_hash(chunk):
+    return int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little")
+
+
+class ContentSketch:
+    """
+    One-permutation MinHash sketch of a file's content-defined chunks.
+
+    Bytes are fed in as they are downloaded or read; the content is split at
+    every newline byte (about every 256 bytes of compressed data, every line
+    of text), so an edit only changes the chunks around it. Each chunk hash
+    falls into one of NUM_BINS bins by its low bits and the bin keeps its
+    smallest hash, which gives a MinHash signature in a single pass. The
+    SHA-256 of the content is computed alongside.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._hashes = set()
+        self._tail = b""
+
+    def update(self, data):
+        """Add the next bytes of the content"""
+        self.size += len(data)
+        self._sha256.update(data)
+        chunks = (self._tail + data).split(ANCHOR)
+        self._tail = chunks.pop()
+        while len(self._tail) > MAX_CHUNK:
+            chunks.append(self._tail[:MAX_CHUNK])
+            self._tail = self._tail[MAX_CHUNK:]
+        self._hashes.update(_chunk_hash(chunk) for chunk in chunks if chunk)
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    @property
+    def chunks(self):
+        """Number of distinct chunks seen so far"""
+        return len(self._hashes) + (1 if self._tail else 0)
+
+    def signature(self):
+        """
+        Return the MinHash signature of the content
+
+        Empty bins borrow the value of the next non-empty bin (rotation
+        densification), so small files still get comparable signatures.
+        """
+        hashes = self._hashes | ({_chunk_hash(self._tail)} if self._tail else set())
+        bins = [None] * NUM_BINS
+        for value in hashes:
+            index = value % NUM_BINS
+            value //= NUM_BINS
+            if bins[index] is None or value < bins[index]:
+                bins[index] = value
+        if all(value is None for value in bins):
+            return [0] * NUM_BINS
+        for index in range(NUM_BINS):
+            offset = 1
+            while bins[index] is None:
+                borrowed = bins[(index + offset) % NUM_BINS]
+                if borrowed is not None:
+                    bins[index] = borrowed + offset
+                offset += 1
+        return bins
+
+
+def file_sketch(path):
+    """Sketch the content of a file"""
+    sketch = ContentSketch()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(READ_SIZE), b""):
+            sketch.update(data)
+    return sketch
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of the chunk sets behind two signatures"""
+    return sum(1 for a, b in zip(signature, other) if a == b) / NUM_BINS
+
+
+class SimilarityIndex:
+    """
+    SQLite index of near-duplicate supplementary files.
+
+    Publishers attach the same templates, checklists and reporting forms to
+    many articles. Every file is sketched (ContentSketch) and looked up with
+    locality-sensitive hashing: the signature is cut into BANDS bands and
+    files of the same type sharing any band are compared. A file whose
+    estimated similarity to an earlier one reaches ``threshold`` is recorded
+    as its near-duplicate; the earlier file stays the canonical copy.
+
+    With ``skip_processing`` set, zip extraction and text extraction skip
+    near-duplicates (their text is linked to the canonical copy's). Skipped
+    work is recorded per stage, and the time the canonical copy took in that
+    stage is reported as the CPU saved.
+    """
+
+    def __init__(self, db_path="output/similarity.sqlite3", threshold=0.8, skip_processing=False):
+        """
+        Args:
+            db_path: SQLite database of the index, shared by all output directories
+            threshold: Estimated similarity from which a file counts as a near-duplicate
+            skip_processing: Skip zip and text extraction of near-duplicates
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.skip_processing = skip_processing
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        """Create the index tables if they don't exist"""
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    sha256 TEXT,
+                    size INTEGER,
+                    chunks INTEGER,
+                    signature BLOB,
+                    article_id TEXT,
+                    duplicate_of TEXT,
+                    similarity REAL,
+                    indexed_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+                CREATE TABLE IF NOT EXISTS bands (
+                    band INTEGER,
+                    bucket TEXT,
+                    path TEXT
+                );
+                CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+                CREATE TABLE IF NOT EXISTS costs (
+                    path TEXT,
+                    stage TEXT,
+                    seconds REAL,
+                    PRIMARY KEY (path, stage)
+                );
+                CREATE TABLE IF NOT EXISTS savings (
+                    path TEXT,
+                    stage TEXT,
+                    bytes INTEGER,
+                    PRIMARY KEY (path, stage)
+                );
+            """)
+
+    @staticmethod
+    def _key(path):
+        return str(Path(path).resolve())
+
+    @staticmethod
+    def _buckets(signature):
+        rows = NUM_BINS // BANDS
+        return [(band, hashlib.blake2b(struct.pack(f"<{rows}Q", *signature[band * rows:(band + 1) * rows]),
+                                       digest_size=8).hexdigest())
+                for band in range(BANDS)]
+
+    def _find_canonical(self, key, sketch, signature):
+        """
+        Return (path, similarity) of the most similar canonical file, or None (called with the lock held)
+
+        Only files of the same type are compared: a stored zip may hold the
+        same bytes as a text file, but skipping it would skip its extraction.
+        """
+        suffix = Path(key).suffix.lower()
+        for (path,) in self.conn.execute("SELECT path FROM files WHERE sha256 = ? AND duplicate_of IS NULL",
+                                         (sketch.sha256,)):
+            if Path(path).suffix.lower() == suffix:
+                return path, 1.0
+        if sketch.chunks < MIN_CHUNKS:
+            return None
+
+        candidates = set()
+        for band, bucket in self._buckets(signature):
+            candidates.update(path for (path,) in self.conn.execute(
+                "SELECT path FROM bands WHERE band = ? AND bucket = ?", (band, bucket))
+                if Path(path).suffix.lower() == suffix)
+        best = None
+        for path in candidates:
+            row = self.conn.execute("SELECT signature FROM files WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                continue
+            score = similarity(signature, struct.unpack(f"<{NUM_BINS}Q", row[0]))
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (path, score)
+        return best
+
+    def add(self, path, sketch, article_id=None):
+        """
+        Index a file and check it against the files indexed before
+
+        Args:
+            path: Path of the file
+            sketch: ContentSketch of its whole content
+            article_id: Article the file belongs to (optional)
+
+        Returns:
+            (canonical path, similarity) if the file is a near-duplicate, else None
+        """
+        key = self._key(path)
+        signature = sketch.signature()
+        with self._lock, self.conn:
+            # A file written again replaces its old entry
+            self.conn.execute("DELETE FROM files WHERE path = ?", (key,))
+            self.conn.execute("DELETE FROM bands WHERE path = ?", (key,))
+            match = self._find_canonical(key, sketch, signature)
+            self.conn.execute(
+                "INSERT INTO files (path, sha256, size, chunks, signature, article_id, duplicate_of, similarity, "
+                "indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, sketch.sha256, sketch.size, sketch.chunks, struct.pack(f"<{NUM_BINS}Q", *signature),
+                 article_id, match[0] if match else None, match[1] if match else None,
+                 datetime.datetime.now().isoformat())
+            )
+            # Only canonical files are candidates for later lookups
+            if match is None and sketch.chunks >= MIN_CHUNKS:
+                self.conn.executemany("INSERT INTO bands (band, bucket, path) VALUES (?, ?, ?)",
+                                      [(band, bucket, key) for band, bucket in self._buckets(signature)])
+        return match
+
+    def check(self, path, article_id=None):
+        """
+        Return the canonical copy of a file, indexing the file first if needed
+
+        Returns:
+            Dictionary with path, sha256 and similarity of the canonical copy
+            if the file is a near-duplicate, else None
+        """
+        key = self._key(path)
+        size = Path(path).stat().st_size
+        with self._lock:
+            row = self.conn.execute("SELECT size, duplicate_of, similarity FROM files WHERE path = ?",
+                                    (key,)).fetchone()
+        if row is None or row[0] != size:
+            match = self.add(path, file_sketch(path), article_id)
+            if match is None:
+                return None
+            canonical, score = match
+        elif row[1] is None:
+            return None
+        else:
+            canonical, score = row[1], row[2]
+        with self._lock:
+            canonical_row = self.conn.execute("SELECT sha256 FROM files WHERE path = ?", (canonical,)).fetchone()
+        return {"path": canonical, "sha256": canonical_row[0] if canonical_row else None, "similarity": score}
+
+    def record_cost(self, path, stage, seconds):
+        """Record the CPU seconds a file took in a processing stage (e.g. "zip" or "text")"""
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO costs (path, stage, seconds) VALUES (?, ?, ?)",
+                              (self._key(path), stage, seconds))
+
+    def processed(self, path, stage):
+        """
+        Check that a file went through a processing stage and is still there
+
+        Only successful runs record a cost, so a canonical copy whose extraction
+        failed, was deferred for disk space or that was removed since doesn't
+        count: its near-duplicates have to be processed themselves.
+        """
+        key = self._key(path)
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM costs WHERE path = ? AND stage = ?", (key, stage)).fetchone()
+        return row is not None and Path(key).exists()
+
+    def record_skip(self, path, stage, nbytes):
+        """Record that a near-duplicate's nbytes were not processed in a stage"""
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO savings (path, stage, bytes) VALUES (?, ?, ?)",
+                              (self._key(path), stage, nbytes))
+
+    def duplicates(self, limit=None):
+        """Return (path, canonical path, similarity) of the near-duplicates, most frequent canonical copies first"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT path, duplicate_of, similarity FROM files WHERE duplicate_of IS NOT NULL "
+                "ORDER BY (SELECT COUNT(*) FROM files f WHERE f.duplicate_of = files.duplicate_of) DESC, "
+                "duplicate_of, path LIMIT ?", (-1 if limit is None else limit,)
+            ).fetchall()
+
+    def stats(self):
+        """
+        Return the index counts and the work saved
+
+        Returns:
+            Dictionary with files, duplicates, duplicate_bytes and saved:
+            {stage: {"files", "bytes", "seconds"}}; seconds is the time the
+            canonical copies took in that stage, where it was measured
+        """
+        with self._lock:
+            files, duplicates, duplicate_bytes = self.conn.execute(
+                "SELECT COUNT(*), COUNT(duplicate_of), COALESCE(SUM(CASE WHEN duplicate_of IS NOT NULL "
+                "THEN size END), 0) FROM files"
+            ).fetchone()
+            rows = self.conn.execute("""
+                SELECT s.stage, COUNT(*), COALESCE(SUM(s.bytes), 0), COALESCE(SUM(c.seconds), 0)
+                FROM savings s
+                JOIN files f ON f.path = s.path
+                LEFT JOIN costs c ON c.path = f.duplicate_of AND c.stage = s.stage
+                GROUP BY s.stage
+            """).fetchall()
+        return {
+            "files": files,
+            "duplicates": duplicates,
+            "duplicate_bytes": duplicate_bytes,
+            "saved": {stage: {"files": count, "bytes": nbytes, "seconds": seconds}
+                      for stage, count, nbytes, seconds in rows}
+        }
+
+    def summary_lines(self):
+        """Human-readable summary of the near-duplicates and the work saved"""
+        stats = self.stats()
+        lines = [f"{stats['duplicates']} of {stats['files']} indexed files are near-duplicates "
+                 f"({stats['duplicate_bytes'] / 1024 ** 2:.1f} MB)"]
+        for stage, saved in stats["saved"].items():
+            lines.append(f"{stage} extraction skipped for {saved['files']} files: "
+                         f"{saved['bytes'] / 1024 ** 2:.1f} MB and ~{saved['seconds']:.1f} s CPU saved")
+        return lines
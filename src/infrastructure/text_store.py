@@ -0,0 +1,144 @@
+import sqlite3
+import datetime
+import threading
+from pathlib import Path
+
+
+class TextStore:
+    """
+    SQLite store of text extracted from supplementary files.
+
+    Documents are keyed by content hash, so a file downloaded again (or under
+    another name) is never parsed twice. The text is indexed with FTS5 when
+    the SQLite build supports it, for searching across all supplements
+    without re-reading the files.
+    """
+
+    def __init__(self, db_path="output/text_store.sqlite3"):
+        """Open (and create if needed) the text store"""
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        """Create the document tables if they don't exist"""
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    sha256 TEXT PRIMARY KEY,
+                    format TEXT,
+                    pages INTEGER,
+                    tables INTEGER,
+                    rows INTEGER,
+                    chars INTEGER,
+                    text TEXT,
+                    error TEXT,
+                    extracted_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    sha256 TEXT,
+                    size INTEGER,
+                    mtime REAL
+                );
+            """)
+            try:
+                self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(sha256 UNINDEXED, text)")
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5; search() falls back to LIKE
+                self.fts = False
+
+    def unchanged_file(self, path, size, mtime):
+        """Return the stored hash of a file if its size and modification time are unchanged"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT sha256 FROM files WHERE path = ? AND size = ? AND mtime = ?", (str(path), size, mtime)
+            ).fetchone()
+        return row[0] if row else None
+
+    def has_document(self, sha256):
+        """Check whether content with this hash was already extracted (failed extractions are tried again)"""
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM documents WHERE sha256 = ? AND error IS NULL",
+                                    (sha256,)).fetchone()
+        return row is not None
+
+    def add_file(self, path, sha256, size, mtime):
+        """Record which content a file path holds"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (path, sha256, size, mtime) VALUES (?, ?, ?, ?)",
+                (str(path), sha256, size, mtime)
+            )
+
+    def add_document(self, sha256, result):
+        """
+        Store the extraction result of one document
+
+        Args:
+            sha256: Content hash of the document
+            result: Dictionary returned by extract_document()
+        """
+        text = result.get("text") or ""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents (sha256, format, pages, tables, rows, chars, text, error, extracted_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha256, result.get("format"), result.get("pages"), result.get("tables"), result.get("rows"),
+                 len(text), text, result.get("error"), datetime.datetime.now().isoformat())
+            )
+            if self.fts and text:
+                self.conn.execute("DELETE FROM documents_fts WHERE sha256 = ?", (sha256,))
+                self.conn.execute("INSERT INTO documents_fts (sha256, text) VALUES (?, ?)", (sha256, text))
+
+    def get_text(self, path):
+        """Return the extracted text of a file, or None if it wasn't extracted"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT d.text FROM files f JOIN documents d ON d.sha256 = f.sha256 WHERE f.path = ?", (str(path),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def search(self, query, limit=20):
+        """
+        Search the extracted text
+
+        Args:
+            query: FTS5 query (plain words match documents containing all of them;
+                queries that aren't valid FTS5 syntax match their words literally)
+            limit: Maximum number of documents returned
+
+        Returns:
+            List of (path, snippet) tuples
+        """
+        with self._lock:
+            if self.fts:
+                sql = ("SELECT (SELECT path FROM files WHERE files.sha256 = documents_fts.sha256 LIMIT 1), "
+                       "snippet(documents_fts, 1, '[', ']', '...', 12) "
+                       "FROM documents_fts WHERE documents_fts MATCH ? ORDER BY rank LIMIT ?")
+                try:
+                    rows = self.conn.execute(sql, (query, limit)).fetchall()
+                except sqlite3.OperationalError:
+                    # Not valid FTS5 syntax (e.g. "COVID-19", "p<0.05"): match each word literally
+                    terms = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+                    rows = self.conn.execute(sql, (terms, limit)).fetchall() if terms else []
+            else:
+                rows = self.conn.execute(
+                    "SELECT (SELECT path FROM files WHERE files.sha256 = documents.sha256 LIMIT 1), "
+                    "substr(text, max(1, instr(lower(text), lower(?)) - 40), 120) "
+                    "FROM documents WHERE text LIKE ? LIMIT ?", (query, f"%{query}%", limit)
+                ).fetchall()
+        return rows
+
+    def stats(self):
+        """Return document counts and totals of the store"""
+        with self._lock:
+            documents, chars, failed = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(chars), 0), COUNT(error) FROM documents"
+            ).fetchone()
+            files = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return {"documents": documents, "files": files, "chars": chars, "failed": failed}
@@ -0,0 +1,205 @@
+import gzip
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional, gzip is always available
+    zstandard = None
+
+ARTICLE_PATTERN = re.compile(rb"<article[\s>].*?</article>", re.DOTALL)
+# NCBI tags the PMC ID "pmc"; Europe PMC full text uses "pmcid" with the PMC prefix
+PMC_ID_PATTERN = re.compile(rb'<article-id pub-id-type=["\']pmc(?:id)?["\']>\s*(?:PMC)?(\d+)\s*<', re.IGNORECASE)
+
+INDEX_FILE = "index.jsonl"
+
+
+def split_articles(xml_content):
+    """
+    Split a raw efetch payload into the raw bytes of each <article> element
+
+    Args:
+        xml_content: Raw efetch response body
+
+    Returns:
+        List of (pmc_id, article_bytes) tuples; articles without a PMC ID are skipped
+    """
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode("utf-8")
+    articles = []
+    for match in ARTICLE_PATTERN.finditer(xml_content):
+        article = match.group(0)
+        pmc_id = PMC_ID_PATTERN.search(article)
+        if pmc_id:
+            articles.append((pmc_id.group(1).decode("ascii"), article))
+    return articles
+
+
+class XmlArchive:
+    """
+    Append-only archive of raw article XML in compressed shards.
+
+    Every article is written as an independent gzip member (or zstd frame)
+    appended to the current shard, and ``index.jsonl`` records
+    pmc_id -> (shard, offset, length). A single article can therefore be read
+    back with one seek and a small decompression, while a whole shard is still
+    a valid .gz/.zst stream for command-line tools.
+    """
+
+    def __init__(self, archive_dir, compression="gzip", shard_size=256 * 1024 * 1024):
+        """
+        Args:
+            archive_dir: Directory holding the shards and the index
+            compression: "gzip" or "zstd" (zstd requires the zstandard package)
+            shard_size: Size in bytes after which a new shard is started
+        """
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        if compression not in ("gzip", "zstd"):
+            raise ValueError(f"Unsupported compression: {compression}")
+
+        self.archive_dir = Path(archive_dir)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.compression = compression
+        self.shard_size = shard_size
+        self.index_path = self.archive_dir / INDEX_FILE
+        self._lock = threading.Lock()
+        self.index = self._load_index()
+
+    @classmethod
+    def is_archive(cls, path):
+        """Check whether a directory contains an XmlArchive"""
+        return (Path(path) / INDEX_FILE).is_file()
+
+    def _load_index(self):
+        """Read the offset index (later entries override earlier ones)"""
+        index = {}
+        if self.index_path.exists():
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        index[entry["pmc_id"]] = entry
+        return index
+
+    @property
+    def extension(self):
+        return ".xml.gz" if self.compression == "gzip" else ".xml.zst"
+
+    def shard_paths(self):
+        """Return the paths of all shards in write order"""
+        return sorted(self.archive_dir.glob("shard_*.xml.*"))
+
+    def _current_shard(self):
+        """Return the shard to append to, starting a new one when the current one is full"""
+        shards = sorted(self.archive_dir.glob(f"shard_*{self.extension}"))
+        if shards and shards[-1].stat().st_size < self.shard_size:
+            return shards[-1]
+        return self.archive_dir / f"shard_{len(shards):05d}{self.extension}"
+
+    def _compress(self, data):
+        if self.compression == "gzip":
+            return gzip.compress(data)
+        return zstandard.ZstdCompressor().compress(data)
+
+    def _decompress(self, data, compression):
+        if compression == "gzip":
+            return gzip.decompress(data)
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    def add_batch(self, xml_content):
+        """
+        Append every article of an efetch payload to the archive
+
+        Args:
+            xml_content: Raw efetch response body
+
+        Returns:
+            List of PMC IDs that were stored
+        """
+        articles = split_articles(xml_content)
+        if not articles:
+            return []
+
+        with self._lock:
+            shard_path = self._current_shard()
+            entries = []
+            with open(shard_path, "ab") as shard, open(self.index_path, "a", encoding="utf-8") as index_file:
+                offset = shard.tell()
+                for pmc_id, article in articles:
+                    compressed = self._compress(article)
+                    shard.write(compressed)
+                    entry = {
+                        "pmc_id": pmc_id,
+                        "shard": shard_path.name,
+                        "offset": offset,
+                        "length": len(compressed)
+                    }
+                    entries.append(entry)
+                    offset += len(compressed)
+                # Make the data durable before the index points at it
+                shard.flush()
+                os.fsync(shard.fileno())
+                for entry in entries:
+                    index_file.write(json.dumps(entry) + "\n")
+                    self.index[entry["pmc_id"]] = entry
+
+        return [pmc_id for pmc_id, _ in articles]
+
+    def __contains__(self, pmc_id):
+        return str(pmc_id) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, pmc_id):
+        """
+        Read the raw XML of a single article
+
+        Args:
+            pmc_id: PMC ID of the article
+
+        Returns:
+            Article XML as bytes, or None if the article isn't archived
+        """
+        entry = self.index.get(str(pmc_id))
+        if entry is None:
+            return None
+        shard_path = self.archive_dir / entry["shard"]
+        with open(shard_path, "rb") as shard:
+            shard.seek(entry["offset"])
+            data = shard.read(entry["length"])
+        compression = "gzip" if shard_path.name.endswith(".gz") else "zstd"
+        return self._decompress(data, compression)
+
+    def iter_articles(self):
+        """Yield (pmc_id, article_bytes) for every archived article"""
+        for pmc_id in list(self.index):
+            yield pmc_id, self.read(pmc_id)
+
+
+def read_shard(shard_path):
+    """
+    Decompress a whole shard into a parseable <pmc-articleset> document
+
+    Args:
+        shard_path: Path to a .xml.gz or .xml.zst shard
+
+    Returns:
+        XML document as bytes
+    """
+    shard_path = Path(shard_path)
+    with open(shard_path, "rb") as f:
+        if shard_path.name.endswith(".gz"):
+            data = gzip.decompress(f.read())
+        else:
+            if zstandard is None:
+                raise ValueError("zstd compression requires the 'zstandard' package")
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            data = reader.read()
+    return b"<pmc-articleset>" + data + b"</pmc-articleset>"
@@ -4,44 +4,299 @@ from pathlib import Path
 import logging
 import datetime
 import sys
-import requests  # Make sure this is added
 
-# Import your modules using relative imports
-from core.source_handlers.ncbi_handler import NCBIHandler
-from infrastructure.data_collector import DataCollector
-from support.display_service import DisplayService
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Everything else (requests, handlers, databases) is imported inside the
+# functions that need it, so short invocations from job scripts start fast
 logger = logging.getLogger("ResearchPaperPeeker")
 
-def parse_arguments():
+# Menu key -> (name, module, class); handler modules are imported on selection
+SOURCES = {
+    "1": ("NCBI", "core.source_handlers.ncbi_handler", "NCBIHandler"),
+    "2": ("Google Scholar", None, None),  # To be implemented
+    "3": ("Europe PMC", "core.source_handlers.europepmc_handler", "EuropePMCHandler"),
+    "4": ("Federated (NCBI + Europe PMC)", "core.source_handlers.federated_handler", "FederatedHandler")
+}
+
+def add_subcommands(parser):
+    """Add the non-interactive subcommands to the argument parser"""
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND",
+                                       help="Run one stage non-interactively (omit for the interactive menu)")
+    
+    search = subparsers.add_parser("search", help="Search and print matching article IDs")
+    search.add_argument("query", help="Search query")
+    search.add_argument("--max-results", type=int, default=argparse.SUPPRESS, help="Maximum number of IDs")
+    search.add_argument("--since", metavar="YYYY-MM-DD", help="Only articles added or updated since this date")
+    search.add_argument("--source", default="NCBI", help="Source name (NCBI, EuropePMC or Federated)")
+    search.add_argument("--output", metavar="FILE", help="Write the IDs to FILE instead of stdout")
+    
+    fetch = subparsers.add_parser("fetch", help="Search, fetch and save supplementary links as a resumable job")
+    fetch.add_argument("query", nargs="?", help="Search query (optional with --ids)")
+    fetch.add_argument("--ids", metavar="FILE",
+                       help="Fetch the articles listed in FILE: PMC IDs (output of search), pmid:N or DOIs")
+    fetch.add_argument("--max-results", type=int, default=argparse.SUPPRESS, help="Maximum number of results")
+    fetch.add_argument("--output-dir", metavar="DIR", help="Output directory (default: today's folder)")
+    fetch.add_argument("--source", default="NCBI", help="Source name (NCBI, EuropePMC or Federated)")
+    fetch.add_argument("--incremental", action="store_true", default=argparse.SUPPRESS,
+                       help="Only harvest articles added or updated since the query's last successful run")
+    fetch.add_argument("--save-xml", action="store_true", default=argparse.SUPPRESS, help="Archive the efetch XML")
+    fetch.add_argument("--parse-workers", type=int, default=argparse.SUPPRESS,
+                       help="Parse efetch XML in this many worker processes")
+    
+    download = subparsers.add_parser("download", help="Download the files of saved link files")
+    download.add_argument("output_dir", nargs="?", help="Directory with the *_links.txt files (default: the job's)")
+    download.add_argument("--job", help="Record download states in this job so reruns skip finished files")
+    download.add_argument("--oa-bulk", action="store_true", default=argparse.SUPPRESS,
+                          help="Download Open Access supplements from the per-article OA package")
+    download.add_argument("--extract-zip", action="store_true", help="Extract downloaded zip files afterwards")
+    
+    extract = subparsers.add_parser("extract", help="Extract text from downloaded supplements into the text store")
+    extract.add_argument("documents_dir", help="Documents directory (or an output directory containing documents/)")
+    extract.add_argument("--zip", action="store_true", help="Unpack zip files before extracting text")
+    extract.add_argument("--search", metavar="QUERY", help="Search the text store afterwards")
+    
+    clean = subparsers.add_parser("clean", help="Remove non-document files from a documents directory")
+    clean.add_argument("documents_dir", help="Documents directory (or an output directory containing documents/)")
+    clean.add_argument("--yes", action="store_true", help="Don't ask for confirmation")
+    
+    resolve = subparsers.add_parser("resolve", help="Map PMC IDs, PMIDs (pmid:N) and DOIs to each other")
+    resolve.add_argument("ids", nargs="+", help="Article identifiers")
+    
+    export_cache = subparsers.add_parser("export-cache",
+                                         help="Write the response cache, metadata and downloaded files to a bundle")
+    export_cache.add_argument("bundle", help="Bundle file to write (zip)")
+    export_cache.add_argument("--documents", metavar="DIR",
+                              help="Include the files downloaded to DIR (a documents or output directory)")
+    export_cache.add_argument("--since", metavar="TIMESTAMP",
+                              help="Only entries stored since this ISO date/time (incremental bundle)")
+    
+    import_cache = subparsers.add_parser("import-cache", help="Merge a cache bundle from another node")
+    import_cache.add_argument("bundle", help="Bundle file written by export-cache")
+    import_cache.add_argument("--output-dir", metavar="DIR",
+                              help="Restore the bundle's files into DIR/documents (download DIR then skips them)")
+    
+    stats = subparsers.add_parser("stats", help="Show job, download and text store statistics")
+    stats.add_argument("--job", help="Only show this job")
+    stats.add_argument("--limit", type=int, default=10, help="Number of recent jobs to show")
+    stats.add_argument("--decisions", type=int, default=5,
+                       help="Latest concurrency autotuner decisions to show per stage")
+
+def parse_arguments(argv=None):
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description="ResearchPaper_Peeker - Search and download supplementary materials")
     parser.add_argument("--save-xml", action="store_true", help="Save XML responses for debugging")
     parser.add_argument("--debug", action="store_true", help="Run in debug mode")
+    parser.add_argument("--xml-format", choices=["archive", "files"], default="archive",
+                        help="Store saved XML in compressed shards (archive) or one file per batch (files)")
     parser.add_argument("--max-results", type=int, default=100, help="Maximum number of results to return")
     parser.add_argument("--download-only", action="store_true", help="Only download files from existing links")
-    return parser.parse_args()
+    parser.add_argument("--oa-bulk", action="store_true", help="Download Open Access supplements from the per-article OA package")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only harvest articles added or updated since the query's last successful run")
+    parser.add_argument("--resume", metavar="JOB", help="Resume an interrupted job from its last checkpoint")
+    parser.add_argument("--parse-workers", type=int, default=None, help="Parse efetch XML in this many worker processes while fetching continues")
+    parser.add_argument("--from-xml", metavar="PATH", help="Replay saved efetch XML (file or directory) offline instead of querying NCBI")
+    parser.add_argument("--batch", metavar="FILE", help="Run queries from a text file (one per line) or YAML job spec without prompting")
+    parser.add_argument("--coordinator", action="store_true", help="Search and queue fetch/download units for worker processes")
+    parser.add_argument("--worker", action="store_true", help="Process queued units until the coordinator's job is finished")
+    parser.add_argument("--queue", metavar="PATH", default="output/work_queue.sqlite3",
+                        help="Work queue database shared by the coordinator and workers (put it on shared storage)")
+    parser.add_argument("--query", help="Search query (skips the prompt)")
+    parser.add_argument("--live", action="store_true",
+                        help="Show a live per-stage progress view instead of per-file messages")
+    parser.add_argument("--simulate-nodes", type=int, metavar="N",
+                        help="Simulate N worker nodes on the --from-xml data and compare with a single-process run")
+    parser.add_argument("--extract-text", metavar="DIR",
+                        help="Extract text from the downloaded supplements below DIR into the text store")
+    parser.add_argument("--search-text", metavar="QUERY", help="Search the text extracted from supplements")
+    add_subcommands(parser)
+    return parser.parse_args(argv)
 
-def get_source_handler():  # Fixed function name
-    """Get the source handler based on user selection"""
-    sources = {
-        "1": ("NCBI", NCBIHandler),
-        "2": ("Google Scholar", None)  # To be implemented
+def create_shared_resources(config, args=None):
+    """
+    Create the HTTP session, rate limiter and response cache shared by all handlers
+    
+    Args:
+        config: ConfigManager with the application settings
+        args: Parsed command line arguments overriding the config (optional)
+        
+    Returns:
+        Dictionary of handler keyword arguments
+    """
+    from support.rate_limiter import RateLimiter
+    from support.http_transport import create_session
+    
+    parse_workers = config.get("ncbi.parse_workers", 0)
+    if args is not None and args.parse_workers is not None:
+        parse_workers = args.parse_workers
+    
+    session = create_session(
+        http2=config.get("http.http2", False),
+        pool_connections=config.get("http.pool_connections", 10),
+        pool_maxsize=config.get("http.pool_maxsize", 20),
+        http2_max_connections=config.get("http.http2_max_connections", 10)
+    )
+    
+    return {
+        "session": session,
+        "rate_limiter": RateLimiter(requests_per_second=config.get("ncbi.requests_per_second", 3)),
+        "cache": create_response_cache(config),
+        "api_key": config.get("ncbi.api_key"),
+        "parse_workers": parse_workers,
+        "autotuner": create_autotuner(config, "efetch"),
+        "metadata_store": create_metadata_store(config)
     }
+
+def create_response_cache(config):
+    """Create the response cache, kept on disk if cache.path is set"""
+    from support.cache_manager import CacheManager
+    ttl_hours = config.get("cache.ttl_hours")
+    return CacheManager(max_entries=config.get("cache.max_entries", 1024), db_path=config.get("cache.path"),
+                        ttl=ttl_hours * 3600 if ttl_hours else None,
+                        store_full_text=config.get("cache.store_full_text", False))
+
+def create_metadata_store(config):
+    """Open the persistent PMCID/PMID/DOI crosswalk and bibliographic metadata store"""
+    from infrastructure.metadata_store import MetadataStore
+    return MetadataStore(config.get("metadata.store_path", "output/metadata.sqlite3"))
+
+def create_similarity_index(config):
+    """Open the near-duplicate index of supplementary files, or return None if it is disabled"""
+    if not config.get("near_duplicates.enabled", True):
+        return None
+    from infrastructure.similarity_index import SimilarityIndex
+    return SimilarityIndex(config.get("near_duplicates.index_path", "output/similarity.sqlite3"),
+                           threshold=config.get("near_duplicates.threshold", 0.8),
+                           skip_processing=config.get("near_duplicates.skip_processing", False))
+
+def create_autotuner(config, stage):
+    """
+    Create the concurrency autotuner of a stage, or None if autotuning is disabled
     
-    logger.info("Available sources:")
-    for key, (name, _) in sources.items():
-        print(f"{key}: {name}")
+    Args:
+        config: ConfigManager with the application settings
+        stage: "efetch" or "download"; autotune.<stage>.* overrides autotune.*
+    """
+    if not config.get(f"autotune.{stage}.enabled", config.get("autotune.enabled", True)):
+        return None
+    from support.autotuner import ConcurrencyAutotuner
+    
+    def setting(name, default):
+        return config.get(f"autotune.{stage}.{name}", config.get(f"autotune.{name}", default))
+    
+    return ConcurrencyAutotuner(
+        initial=setting("initial_concurrency", 1),
+        minimum=setting("min_concurrency", 1),
+        maximum=setting("max_concurrency", 8),
+        latency_factor=setting("latency_factor", 2.0),
+        max_error_rate=setting("max_error_rate", 0.1),
+        decrease_factor=setting("decrease_factor", 0.5),
+        cooldown=setting("cooldown_seconds", 2.0)
+    )
+
+def create_live_progress(args, config):
+    """
+    Create the live progress view of the fetch and download stages
+    
+    Args:
+        args: Parsed command line arguments
+        config: ConfigManager with the application settings
+    
+    Returns:
+        Context manager showing the view while a stage runs (a no-op context
+        if neither --live nor display.live is set)
+    """
+    import contextlib
+    
+    if not (getattr(args, "live", False) or config.get("display.live", False)):
+        return contextlib.nullcontext()
+    from support.display_service import DisplayService
+    return DisplayService().live_progress(interval=config.get("display.refresh_seconds", 0.5),
+                                          line_interval=config.get("display.line_seconds", 15))
+
+def create_download_options(config):
+    """
+    Create the bandwidth limiter, disk space guard, concurrency autotuner,
+    metadata store and near-duplicate index shared by all downloads, and read
+    the documents layout
+    
+    Args:
+        config: ConfigManager with the application settings
         
-    choice = input("Select source (1-2): ").strip()
+    Returns:
+        Dictionary of DataCollector keyword arguments (None for disabled limits)
+    """
+    byte_limiter = None
+    if (config.get("bandwidth.max_bytes_per_second") or config.get("bandwidth.per_host")
+            or config.get("bandwidth.default_host_bytes_per_second")):
+        from support.rate_limiter import ByteRateLimiter
+        byte_limiter = ByteRateLimiter(
+            bytes_per_second=config.get("bandwidth.max_bytes_per_second"),
+            host_rates=config.get("bandwidth.per_host") or {},
+            default_host_rate=config.get("bandwidth.default_host_bytes_per_second")
+        )
+    
+    disk_guard = None
+    if config.get("disk.admission", True):
+        from support.disk_guard import DiskSpaceGuard
+        disk_guard = DiskSpaceGuard(
+            reserve_bytes=int(config.get("disk.reserve_mb", 512) * 1024 ** 2),
+            zip_expansion=config.get("disk.zip_expansion", 3.0),
+            wait_seconds=config.get("disk.wait_seconds", 600),
+            poll_seconds=config.get("disk.poll_seconds", 15)
+        )
+    
+    return {"byte_limiter": byte_limiter, "disk_guard": disk_guard,
+            "layout": config.get("documents.layout", "article"),
+            "autotuner": create_autotuner(config, "download"),
+            "metadata_store": create_metadata_store(config),
+            "similarity_index": create_similarity_index(config),
+            "oa_min_files": config.get("documents.oa_package_min_files", 10)}
+
+def create_access_manager(config):
+    """
+    Create the AccessManager used by the downloader, or None if access checks are disabled
+    
+    Args:
+        config: ConfigManager with the application settings
+    """
+    if not config.get("access.probe", True):
+        return None
+    from core.paywall_service.access_manager import AccessManager
+    return AccessManager(
+        ttl=config.get("access.ttl_seconds", 3600),
+        host_block_threshold=config.get("access.host_block_threshold", 10),
+        cache_path=config.get("access.cache_path", "output/access_cache.json")
+    )
+
+def get_source_handler(choice=None, **handler_kwargs):  # Fixed function name
+    """
+    Get the source handler based on user selection
+    
+    Args:
+        choice: Menu key or source name (optional, prompts the user if omitted)
+        handler_kwargs: Shared resources passed to the handler constructor
+    """
+    sources = SOURCES
+    
+    if choice is None:
+        logger.info("Available sources:")
+        for key, (name, _, _) in sources.items():
+            print(f"{key}: {name}")
+            
+        choice = input(f"Select source (1-{len(sources)}): ").strip()
+    
+    # Allow selecting a source by name or by the handler name stored with a job
+    for key, (name, _, class_name) in sources.items():
+        if choice.lower() in (name.lower(), (class_name or "").replace("Handler", "").lower()):
+            choice = key
     
     if choice in sources:
-        name, handler_class = sources[choice]
-        if handler_class:
+        name, module_name, class_name = sources[choice]
+        if module_name:
+            import importlib
+            handler_class = getattr(importlib.import_module(module_name), class_name)
             logger.info(f"Selected source: {name}")
-            return handler_class()  # Fixed return statement
+            return handler_class(**handler_kwargs)  # Fixed return statement
         logger.warning(f"{name} handler not implemented yet")
         print(f"{name} handler not implemented yet")
         return None
@@ -62,6 +317,8 @@ def save_xml_responses(source_handler, article_ids, output_dir=None):
     Returns:
         List of paths to saved XML files
     """
+    import requests
+    
     saved_files = []
     
     # Create output directory for XML responses
@@ -121,43 +378,689 @@ def save_xml_responses(source_handler, article_ids, output_dir=None):
     print(f"Total XML responses saved: {len(saved_files)}")
     return saved_files
 
-def main():
+def run_batch(args, config):
+    """
+    Run every query of a batch file without prompting
+    
+    Args:
+        args: Parsed command line arguments
+        config: ConfigManager with the application settings
+    """
+    from infrastructure.batch_runner import BatchRunner, load_batch_spec
+    from infrastructure.database import CheckpointStore
+    
+    spec = load_batch_spec(args.batch, defaults=config.get("batch", {}))
+    if not spec["queries"]:
+        print(f"No queries found in {args.batch}")
+        return
+    
+    shared = create_shared_resources(config, args)
+    source_handler = get_source_handler(spec.get("source", "NCBI"), **shared)
+    if not source_handler:
+        return
+    
+    with source_handler:
+        runner = BatchRunner(source_handler, max_workers=spec.get("max_workers", 4), session=shared["session"],
+                             access_manager=create_access_manager(config),
+                             **create_download_options(config))
+        with create_live_progress(args, config):
+            # The spec is merged with the config defaults, so a flag given on the command line wins over it
+            summary = runner.run(
+                spec["queries"],
+                harvest_state=CheckpointStore() if args.incremental or spec.get("incremental", False) else None,
+                download=spec.get("download", False),
+                extract=spec.get("extract", False),
+                oa_bulk=args.oa_bulk or spec.get("oa_bulk", False)
+            )
+    
+    print("\n📊 Batch Summary:")
+    for query, stats in summary.items():
+        print(f"  • {query}: {stats['articles']} articles, {stats['links']} links, "
+              f"{stats['downloaded']} downloaded → {stats['output_dir']}")
+
+def create_distributed_handler(args, config, queue_path):
+    """
+    Create the source handler of a coordinator or worker node
+    
+    All nodes share one rate-limit bucket stored next to the work queue, so the
+    combined request rate of every host stays within the API's limits.
+    """
+    from support.rate_limiter import SharedRateLimiter
+    
+    if args.from_xml:
+        from core.source_handlers.replay_handler import XmlReplayHandler
+        return XmlReplayHandler(args.from_xml), None
+    shared = create_shared_resources(config, args)
+    shared["rate_limiter"] = SharedRateLimiter(queue_path, requests_per_second=config.get("ncbi.requests_per_second", 3),
+                                               journal_mode=config.get("distributed.journal_mode", "DELETE"))
+    return get_source_handler("NCBI", **shared), shared["session"]
+
+def run_coordinator(args, config):
+    """
+    Queue a query's fetch and download units and merge the workers' results
+    
+    Args:
+        args: Parsed command line arguments
+        config: ConfigManager with the application settings
+    """
+    from infrastructure.queue_manager import SQLiteWorkQueue
+    from infrastructure.distributed import HarvestCoordinator
+    from support.display_service import DisplayService
+    
+    query = args.query or input("\nEnter your search query: ").strip()
+    if not query:
+        print("Search query cannot be empty")
+        return
+    
+    queue = SQLiteWorkQueue(args.queue, journal_mode=config.get("distributed.journal_mode", "DELETE"))
+    source_handler, _ = create_distributed_handler(args, config, args.queue)
+    with source_handler:
+        coordinator = HarvestCoordinator(queue, source_handler)
+        if not coordinator.submit(query, args.max_results, download=args.download_only, oa_bulk=args.oa_bulk):
+            print("No articles found")
+            return
+    
+        print(f"Waiting for workers (start them with: --worker --queue {args.queue})...")
+        coordinator.wait()
+        DisplayService().display_results(coordinator.merge())
+    print(f"Links saved to {queue.get_meta('output_dir')}")
+
+def run_worker(args, config):
+    """
+    Process queued units until the coordinator's job is finished
+    
+    Args:
+        args: Parsed command line arguments
+        config: ConfigManager with the application settings
+    """
+    from infrastructure.queue_manager import SQLiteWorkQueue
+    from infrastructure.distributed import HarvestWorker
+    
+    queue = SQLiteWorkQueue(args.queue, journal_mode=config.get("distributed.journal_mode", "DELETE"))
+    source_handler, session = create_distributed_handler(args, config, args.queue)
+    with source_handler:
+        worker = HarvestWorker(queue, source_handler, session=session,
+                               access_manager=create_access_manager(config), **create_download_options(config))
+        print(f"Worker {worker.worker_id} pulling units from {args.queue}...")
+        with create_live_progress(args, config):
+            processed = worker.run()
+    print(f"Worker {worker.worker_id} processed {processed} units")
+
+def run_simulation(args):
+    """
+    Simulate several worker nodes on saved XML and check the merged output
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    from infrastructure.distributed import simulate_nodes
+    
+    print(f"\nSimulating {args.simulate_nodes} worker nodes on {args.from_xml}...")
+    report = simulate_nodes(args.from_xml, nodes=args.simulate_nodes)["report"]
+    print(f"📊 {report['units']} units, {report['requeued']} requeued after a crashed node, "
+          f"{report['articles']} articles / {report['links']} links in {report['elapsed']:.1f}s")
+    if report["matches_single_process"]:
+        print("✅ Merged output matches the single-process run")
+    else:
+        print("❌ Merged output differs from the single-process run")
+
+def run_text_extraction(config, documents_dir=None, search=None):
+    """
+    Extract text from downloaded supplements and/or search the extracted text
+    
+    Args:
+        config: ConfigManager with the application settings
+        documents_dir: Directory of downloaded supplements to extract (optional)
+        search: Query to search the extracted text for (optional)
+    """
+    from infrastructure.text_store import TextStore
+    from core.document_processors.text_extractor import DocumentTextExtractor
+    
+    store = TextStore(config.get("text.store_path", "output/text_store.sqlite3"))
+    
+    if documents_dir:
+        similarity_index = create_similarity_index(config)
+        extractor = DocumentTextExtractor(store, max_workers=config.get("text.workers"),
+                                          similarity_index=similarity_index)
+        stats = extractor.run(documents_dir)
+        print(f"\n📊 Text extraction: {stats['extracted']} extracted, {stats['skipped']} unchanged, "
+              f"{stats['failed']} failed, {stats['duplicates']} near-duplicates linked")
+        if similarity_index is not None:
+            for line in similarity_index.summary_lines():
+                print(f"  • {line}")
+    
+    if search:
+        matches = store.search(search)
+        print(f"\n🔍 {len(matches)} supplements match '{search}':")
+        for path, snippet in matches:
+            print(f"  • {path}: {' '.join(snippet.split())}")
+
+def run_replay(args):
+    """
+    Re-run parsing, link extraction and export from saved efetch XML without network access
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    from core.document_processors.xml_processor import find_xml_files, replay_xml_files
+    from infrastructure.data_collector import DataCollector
+    from support.display_service import DisplayService
+    
+    xml_files = find_xml_files(args.from_xml)
+    if not xml_files:
+        print(f"No XML files found in {args.from_xml}")
+        return
+    
+    print(f"\nReplaying {len(xml_files)} saved XML files from {args.from_xml}...")
+    results, failed = replay_xml_files(xml_files, max_workers=args.parse_workers)
+    for xml_path, error in failed:
+        print(f"⚠️ Error parsing {xml_path}: {error}")
+    
+    display_service = DisplayService()
+    display_service.display_results(results)
+    
+    if results:
+        print("\nSaving links to files...")
+        data_collector = DataCollector()
+        data_collector.batch_save_links(results, source_type="ncbi")
+        print("Links saved successfully")
+
+def documents_path(path):
+    """Resolve an output directory to its documents/ folder; other paths are used as given"""
+    path = Path(path)
+    return path / "documents" if (path / "documents").is_dir() else path
+
+def harvest(args, config, source_handler, source_name, query, max_results, output_dir, job_id, checkpoint_store,
+            pmc_ids=None, interactive=True):
+    """
+    Run a registered job and mark it completed
+    
+    Args:
+        args: Parsed command line arguments
+        config: ConfigManager with the application settings
+        source_handler: The source handler
+        source_name: Source name stored with the job
+        query: Search query
+        max_results: Maximum number of results
+        output_dir: Output directory of the job
+        job_id: Job ID in the checkpoint store
+        checkpoint_store: CheckpointStore holding the job
+        pmc_ids: Article IDs from an earlier run or an ID list (optional)
+        interactive: Ask whether to download and extract the files
+    
+    Returns:
+        False if the job was interrupted or some batches failed
+    """
+    from core.source_handlers.base_handler import IncompleteFetchError
+    from infrastructure.data_collector import DataCollector
+    from infrastructure.database import JobCheckpoint
+    
+    checkpoint = JobCheckpoint(checkpoint_store, job_id)
+    print(f"Job ID: {job_id} (resume with --resume {job_id})")
+    
+    # Archive the raw XML of every efetch batch as it is fetched
+    if (args.debug or args.save_xml) and args.xml_format == "archive":
+        from infrastructure.xml_archive import XmlArchive
+        archive_dir = Path(output_dir) / "xml_archive"
+        source_handler.xml_archive = XmlArchive(archive_dir, compression=config.get("archive.compression", "gzip"))
+        print(f"\n📄 Archiving XML responses to {archive_dir}")
+    
+    since = None
+    if args.incremental:
+        since = checkpoint_store.get_last_harvest(source_name, query)
+        if since is not None:
+            print(f"Incremental run: only articles added or updated since {since:%Y-%m-%d}")
+    harvest_started = datetime.datetime.now()
+    
+    # Downloads reuse the handler's session and its open connections
+    data_collector = DataCollector(session=getattr(source_handler, "session", None),
+                                   rate_limiter=getattr(source_handler, "rate_limiter", None),
+                                   **create_download_options(config))
+    try:
+        run_job(args, source_handler, query, max_results, output_dir, data_collector, checkpoint, pmc_ids,
+                access_manager=create_access_manager(config) if interactive else None,
+                since=since, interactive=interactive, live=create_live_progress(args, config))
+    except KeyboardInterrupt:
+        print(f"\nInterrupted. Resume this job with: --resume {job_id}")
+        return False
+    except IncompleteFetchError as e:
+        # Finished batches are checkpointed; a resumed run fetches the rest
+        checkpoint_store.set_status(job_id, "failed")
+        print(f"\n❌ {e}\nThe job is incomplete. Resume it with: --resume {job_id}")
+        return False
+    
+    checkpoint_store.set_status(job_id, "completed")
+    # Failed searches also come back empty, so only advance after a run that found articles;
+    # repeating an empty window next time is cheap
+    found = checkpoint_store.get_job(job_id)["article_ids"]
+    if args.incremental and found:
+        from infrastructure.batch_runner import search_complete
+        complete, count = search_complete(source_handler, query, found, max_results, since=since)
+        if complete:
+            checkpoint_store.set_last_harvest(source_name, query, harvest_started, output_dir)
+        else:
+            print(f"⚠️ Found {len(found)} of {count if count is not None else 'more'} matching articles; "
+                  f"keeping the last harvest time so the rest is searched again (raise --max-results to catch up)")
+    return True
+
+def cmd_search(args, config):
+    """search: print the article IDs matching a query, one per line"""
+    import contextlib
+    
+    source_handler = get_source_handler(args.source, **create_shared_resources(config, args))
+    if not source_handler:
+        return 1
+    since = datetime.datetime.strptime(args.since, "%Y-%m-%d") if args.since else None
+    # Keep stdout for the IDs; the handler's progress output goes to stderr
+    with source_handler, contextlib.redirect_stdout(sys.stderr):
+        if since is not None:
+            pmc_ids = source_handler.search_articles(args.query, args.max_results, since=since)
+        else:
+            pmc_ids = source_handler.search_articles(args.query, args.max_results)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.writelines(f"{pmc_id}\n" for pmc_id in pmc_ids)
+        print(f"Saved {len(pmc_ids)} article IDs to {args.output}", file=sys.stderr)
+    else:
+        sys.stdout.writelines(f"{pmc_id}\n" for pmc_id in pmc_ids)
+    return 0
+
+def resolve_article_ids(metadata, identifiers):
+    """
+    Map PMIDs ("pmid:N") and DOIs in an ID list to PMC IDs, keeping the order
+    
+    Args:
+        metadata: MetadataService of the source handler
+        identifiers: PMC IDs, PMIDs and DOIs
+    
+    Returns:
+        List of unique PMC IDs; unresolvable identifiers are reported and dropped
+    """
+    resolved = metadata.resolve(identifiers)
+    unresolved = [identifier for identifier in identifiers if identifier not in resolved]
+    if unresolved:
+        print(f"⚠️ {len(unresolved)} IDs have no PMC ID and are skipped: {', '.join(unresolved[:5])}"
+              f"{' ...' if len(unresolved) > 5 else ''}", file=sys.stderr)
+    return list(dict.fromkeys(resolved[identifier] for identifier in identifiers if identifier in resolved))
+
+def cmd_resolve(args, config):
+    """resolve: print the PMC ID, PMID, DOI and title of article identifiers"""
+    import contextlib
+    from core.source_handlers.ncbi_handler import NCBIHandler
+    
+    shared = create_shared_resources(config, args)
+    with NCBIHandler(**shared) as handler, contextlib.redirect_stdout(sys.stderr):
+        metadata = handler.metadata
+        resolved = metadata.resolve(args.ids)
+        records = metadata.lookup(list(dict.fromkeys(resolved.values())))
+    for identifier in args.ids:
+        record = records.get(resolved.get(identifier), {})
+        pmcid = f"PMC{record['pmcid']}" if record.get("pmcid") else "-"
+        print("\t".join([identifier, pmcid, record.get("pmid") or "-", record.get("doi") or "-",
+                         record.get("title") or "-"]))
+    return 0 if len(resolved) == len(set(args.ids)) else 1
+
+def cmd_fetch(args, config):
+    """fetch: search (or read an ID list), fetch and save links as a resumable job"""
+    from infrastructure.database import CheckpointStore
+    
+    if not args.query and not args.ids:
+        print("fetch needs a query or --ids FILE")
+        return 1
+    pmc_ids = None
+    if args.ids:
+        with open(args.ids, "r", encoding="utf-8") as f:
+            pmc_ids = [line.strip() for line in f if line.strip()]
+    query = args.query or f"ids:{Path(args.ids).name}"
+    
+    source_handler = get_source_handler(args.source, **create_shared_resources(config, args))
+    if not source_handler:
+        return 1
+    if pmc_ids and getattr(source_handler, "metadata", None) is not None:
+        pmc_ids = resolve_article_ids(source_handler.metadata, pmc_ids)
+    source_name = type(source_handler).__name__.replace("Handler", "")
+    if args.output_dir:
+        output_dir = Path(args.output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+    elif args.incremental:
+        from infrastructure.batch_runner import incremental_output_dir
+        output_dir = incremental_output_dir(query)
+    else:
+        from infrastructure.data_collector import DataCollector
+        output_dir = DataCollector().create_date_folder()
+    
+    checkpoint_store = CheckpointStore()
+    job_id = checkpoint_store.create_job(source_name, query, args.max_results, output_dir)
+    if pmc_ids is not None:
+        checkpoint_store.save_article_ids(job_id, pmc_ids)
+    with source_handler:
+        completed = harvest(args, config, source_handler, source_name, query, args.max_results, output_dir, job_id,
+                            checkpoint_store, pmc_ids, interactive=False)
+    if not completed:
+        return 1 if checkpoint_store.get_job(job_id)["status"] == "failed" else 130
+    print(f"Links saved to {output_dir} (download with: download {output_dir} --job {job_id})")
+    return 0
+
+def cmd_download(args, config):
+    """download: download the files of saved link files"""
+    from infrastructure.data_collector import DataCollector
+    
+    checkpoint = None
+    output_dir = args.output_dir
+    if args.job:
+        from infrastructure.database import CheckpointStore, JobCheckpoint
+        checkpoint_store = CheckpointStore()
+        job = checkpoint_store.get_job(args.job)
+        if job is None:
+            print(f"No job found with ID: {args.job}")
+            return 1
+        checkpoint = JobCheckpoint(checkpoint_store, args.job)
+        output_dir = output_dir or job["output_dir"]
+    if not output_dir:
+        print("download needs an output directory or --job JOB")
+        return 1
+    
+    shared = create_shared_resources(config, args)
+    data_collector = DataCollector(session=shared["session"], rate_limiter=shared["rate_limiter"],
+                                   **create_download_options(config))
+    downloaded = data_collector.download_all_documents(Path(output_dir), checkpoint=checkpoint, oa_bulk=args.oa_bulk,
+                                                       access_manager=create_access_manager(config))
+    if args.extract_zip and downloaded > 0:
+        data_collector.extract_zip_files(Path(output_dir) / "documents")
+    return 0
+
+def cmd_extract(args, config):
+    """extract: unpack zip files (optional) and extract text into the text store"""
+    documents_dir = documents_path(args.documents_dir)
+    if args.zip:
+        from infrastructure.data_collector import DataCollector
+        DataCollector(**create_download_options(config)).extract_zip_files(documents_dir)
+    run_text_extraction(config, documents_dir, args.search)
+    return 0
+
+def cmd_clean(args, config):
+    """clean: remove non-document files from a documents directory"""
+    from infrastructure.data_collector import DataCollector
+    
+    DataCollector().clean_documents_directory(documents_path(args.documents_dir), confirm=not args.yes)
+    return 0
+
+def cmd_stats(args, config):
+    """stats: show recent jobs, their download states and the text store"""
+    from infrastructure.database import CheckpointStore
+    from support.autotuner import load_run_stats
+    
+    checkpoint_store = CheckpointStore()
+    jobs = [checkpoint_store.get_job(args.job)] if args.job else checkpoint_store.list_jobs(args.limit)
+    jobs = [job for job in jobs if job is not None]
+    if not jobs:
+        print("No jobs recorded")
+    for job in jobs:
+        article_count = len(job["article_ids"]) if job["article_ids"] else 0
+        print(f"📁 {job['job_id']} [{job['status']}] '{job['query']}' → {job['output_dir']}")
+        print(f"   {article_count} articles, {checkpoint_store.count_results(job['job_id'])} with supplements")
+        downloads = checkpoint_store.count_downloads(job["job_id"])
+        if downloads:
+            print("   Downloads: " + ", ".join(f"{status} {count}" for status, count in sorted(downloads.items())))
+        documents_dir = Path(job["output_dir"]) / "documents"
+        if (documents_dir / "manifest.jsonl").exists():
+            from infrastructure.document_store import DocumentStore
+            document_stats = DocumentStore(documents_dir).stats()
+            types = sorted(document_stats["types"].items(), key=lambda item: -item[1])[:5]
+            print(f"   Documents: {document_stats['files']} files, {document_stats['bytes'] / 1024 ** 2:.1f} MB "
+                  f"({', '.join(f'{doc_type} {count}' for doc_type, count in types) or 'empty'})")
+        for stage, stage_stats in load_run_stats(job["output_dir"]).items():
+            for host, totals in stage_stats.get("hosts", {}).items():
+                print(f"   {stage} {host}: concurrency {totals['limit']} (peak {totals['peak_limit']}), "
+                      f"{totals['throttled']} throttled, {totals['timeouts']} timeouts")
+            decisions = stage_stats.get("decisions", [])
+            for decision in (decisions[-args.decisions:] if args.decisions > 0 else []):
+                print(f"     {decision['time']} {decision['host']} {decision['from']}→{decision['to']}: "
+                      f"{decision['reason']}")
+    
+    cache_path = config.get("cache.path")
+    if cache_path and Path(cache_path).exists():
+        cache_stats = create_response_cache(config).stats()
+        print(f"🗄️ Response cache: {cache_stats['stored']} fresh responses, parsed links of "
+              f"{cache_stats['articles']} articles")
+
+    metadata_path = Path(config.get("metadata.store_path", "output/metadata.sqlite3"))
+    if metadata_path.exists():
+        metadata_stats = create_metadata_store(config).stats()
+        print(f"📇 Metadata store: {metadata_stats['articles']} articles ({metadata_stats['with_pmid']} with PMID, "
+              f"{metadata_stats['with_doi']} with DOI)")
+    
+    store_path = Path(config.get("text.store_path", "output/text_store.sqlite3"))
+    if store_path.exists():
+        from infrastructure.text_store import TextStore
+        text_stats = TextStore(store_path).stats()
+        print(f"📚 Text store: {text_stats['documents']} documents ({text_stats['files']} files, "
+              f"{text_stats['chars']} characters, {text_stats['failed']} failed)")
+    
+    index_path = Path(config.get("near_duplicates.index_path", "output/similarity.sqlite3"))
+    if index_path.exists():
+        similarity_index = create_similarity_index(config)
+        if similarity_index is not None:
+            print("🔁 Near-duplicates: " + "\n   ".join(similarity_index.summary_lines()))
+            for path, canonical, score in similarity_index.duplicates(limit=args.limit):
+                print(f"   {Path(path).name} ≈ {Path(canonical).name} ({score:.0%})")
+    return 0
+
+def cmd_export_cache(args, config):
+    """export-cache: write a cache bundle for warm-starting another node"""
+    from infrastructure.cache_bundle import export_bundle
+    
+    cache = create_response_cache(config)
+    if cache.conn is None:
+        print("⚠️ The response cache isn't kept on disk (cache.path); exporting without responses")
+        cache = None
+    document_store = None
+    if args.documents:
+        from infrastructure.document_store import DocumentStore
+        documents_dir = documents_path(args.documents)
+        if not documents_dir.is_dir():
+            print(f"No documents directory found at {args.documents}")
+            return 1
+        document_store = DocumentStore(documents_dir, layout=config.get("documents.layout", "article"))
+    counts = export_bundle(args.bundle, cache=cache, metadata_store=create_metadata_store(config),
+                           document_store=document_store, since=args.since)
+    print(f"📦 Wrote {args.bundle}: {counts['responses']} responses, links of {counts['links']} articles, "
+          f"{counts['metadata']} metadata records, {counts['documents']} files ({counts['blobs']} unique blobs, "
+          f"{counts['bytes'] / 1024 ** 2:.1f} MB before compression)")
+    return 0
+
+def cmd_import_cache(args, config):
+    """import-cache: merge a cache bundle into the local caches"""
+    import zipfile
+    from infrastructure.cache_bundle import import_bundle
+    
+    if not Path(args.bundle).is_file():
+        print(f"Bundle not found: {args.bundle}")
+        return 1
+    cache = create_response_cache(config)
+    if cache.conn is None:
+        print("⚠️ The response cache isn't kept on disk (cache.path); skipping the bundle's responses")
+        cache = None
+    document_store = None
+    if args.output_dir:
+        from infrastructure.document_store import DocumentStore
+        document_store = DocumentStore(Path(args.output_dir) / "documents",
+                                       layout=config.get("documents.layout", "article"))
+    try:
+        counts = import_bundle(args.bundle, cache=cache, metadata_store=create_metadata_store(config),
+                               document_store=document_store)
+    except (ValueError, zipfile.BadZipFile) as e:
+        print(f"❌ Could not import {args.bundle}: {e}")
+        return 1
+    print(f"📦 Merged {args.bundle}: {counts['responses']} responses, links of {counts['links']} articles, "
+          f"{counts['metadata']} metadata records, {counts['documents']} files")
+    if counts["corrupt"]:
+        print(f"⚠️ Skipped {counts['corrupt']} entries whose content was missing or damaged")
+    return 0
+
+COMMANDS = {
+    "search": cmd_search,
+    "fetch": cmd_fetch,
+    "download": cmd_download,
+    "extract": cmd_extract,
+    "clean": cmd_clean,
+    "stats": cmd_stats,
+    "resolve": cmd_resolve,
+    "export-cache": cmd_export_cache,
+    "import-cache": cmd_import_cache
+}
+
+def main(argv=None):
     """Main function to run the application"""
     # Parse command line arguments
-    args = parse_arguments()
+    args = parse_arguments(argv)
+    
+    from support.config_manager import ConfigManager
+    config = ConfigManager()
+    
+    if args.command:
+        return COMMANDS[args.command](args, config)
     
+    logging.basicConfig(level=logging.INFO)
     print("ResearchPaper_Peeker - Find and Download Supplementary Materials")
     print("---------------------------------------------------------------")
     
-    # Get the source handler
-    source_handler = get_source_handler()
-    if not source_handler:
+    if args.simulate_nodes:
+        if not args.from_xml:
+            print("--simulate-nodes needs saved XML to replay (--from-xml PATH)")
+            return
+        run_simulation(args)
+        print("\nDone!")
         return
     
-    # Get user query
-    query = input("\nEnter your search query: ").strip()
-    if not query:
-        print("Search query cannot be empty")
+    if args.coordinator or args.worker:
+        if args.coordinator:
+            run_coordinator(args, config)
+        else:
+            run_worker(args, config)
+        print("\nDone!")
         return
     
-    # Set maximum results
-    max_results = args.max_results
+    if args.extract_text or args.search_text:
+        run_text_extraction(config, args.extract_text, args.search_text)
+        print("\nDone!")
+        return
     
-    # Search for articles
-    print(f"\nSearching for articles with keyword: '{query}'...")
-    pmc_ids = source_handler.search_articles(query, max_results)
+    if args.from_xml:
+        run_replay(args)
+        print("\nDone!")
+        return
     
-    if not pmc_ids:
-        print("No articles found")
+    if args.batch:
+        run_batch(args, config)
+        print("\nDone!")
         return
     
+    from infrastructure.data_collector import DataCollector
+    from infrastructure.database import CheckpointStore
+    from infrastructure.batch_runner import incremental_output_dir
+    
+    checkpoint_store = CheckpointStore()
+    
+    if args.resume:
+        # Restore the job's parameters instead of asking for them again
+        job = checkpoint_store.get_job(args.resume)
+        if job is None:
+            print(f"No job found with ID: {args.resume}")
+            return
+        print(f"Resuming job {job['job_id']} (query: '{job['query']}')")
+        
+        source_handler = get_source_handler(job["source"], **create_shared_resources(config, args))
+        if not source_handler:
+            return
+        query = job["query"]
+        max_results = job["max_results"]
+        output_dir = Path(job["output_dir"])
+        job_id = job["job_id"]
+        pmc_ids = job["article_ids"]
+        source_name = job["source"]
+    else:
+        # Get the source handler
+        source_handler = get_source_handler(**create_shared_resources(config, args))
+        if not source_handler:
+            return
+        
+        # Get user query
+        query = args.query or input("\nEnter your search query: ").strip()
+        if not query:
+            print("Search query cannot be empty")
+            return
+        
+        # Set maximum results
+        max_results = args.max_results
+        source_name = type(source_handler).__name__.replace("Handler", "")
+        if args.incremental:
+            # Incremental runs keep merging into one catalog folder per query
+            output_dir = incremental_output_dir(query)
+        else:
+            output_dir = DataCollector().create_date_folder()
+        job_id = checkpoint_store.create_job(source_name, query, max_results, output_dir)
+        pmc_ids = None
+    
+    with source_handler:
+        completed = harvest(args, config, source_handler, source_name, query, max_results, output_dir, job_id,
+                            checkpoint_store, pmc_ids)
+    if completed:
+        print("\nDone!")
+
+def run_job(args, source_handler, query, max_results, output_dir, data_collector, checkpoint, pmc_ids=None,
+            access_manager=None, since=None, interactive=True, live=None):
+    """
+    Run the search, fetch and download stages of a job, checkpointing each unit of work
+    
+    Args:
+        args: Parsed command line arguments
+        source_handler: The source handler
+        query: Search query
+        max_results: Maximum number of results
+        output_dir: Output directory of the job
+        data_collector: DataCollector used for saving and downloading
+        checkpoint: JobCheckpoint for the job
+        pmc_ids: Article IDs from an earlier run of the job (optional)
+        access_manager: AccessManager used by the downloader (optional)
+        since: Only search articles added or updated since this date (optional)
+        interactive: Ask whether to download and extract the files
+        live: Context manager showing the live progress view while the fetch
+            and download stages run (optional)
+    """
+    import contextlib
+    from support.display_service import DisplayService
+    
+    live = live or contextlib.nullcontext()
+    resumed = pmc_ids is not None
+    
+    if pmc_ids is None:
+        # Search for articles
+        print(f"\nSearching for articles with keyword: '{query}'...")
+        if since is not None:
+            pmc_ids = source_handler.search_articles(query, max_results, since=since)
+        else:
+            pmc_ids = source_handler.search_articles(query, max_results)
+        
+        if not pmc_ids:
+            print("No articles found")
+            return
+        checkpoint.store.save_article_ids(checkpoint.job_id, pmc_ids)
+    
     print(f"Found {len(pmc_ids)} articles")
     
+    # Record the PMID/DOI crosswalk and titles of the articles, in batches, so
+    # later stages resolve identifiers from the metadata store
+    metadata = getattr(source_handler, "metadata", None)
+    if metadata is not None:
+        metadata.lookup(pmc_ids)
+    
     # For debugging: Save the XML responses if flag is set
-    if args.debug or args.save_xml:
+    if (args.debug or args.save_xml) and args.xml_format == "files":
         print("\n📄 Saving XML responses for debugging...")
         try:
-            xml_files = save_xml_responses(source_handler, pmc_ids)
+            xml_files = save_xml_responses(source_handler, pmc_ids, output_dir)
             print(f"✅ Saved {len(xml_files)} XML response files")
             
             # Print the first few file paths to help locate them
@@ -172,32 +1075,46 @@ def main():
     
     # Get supplementary materials
     print("\nLooking for supplementary materials...")
-    results = source_handler.get_supplementary_materials(pmc_ids)  # Make sure this matches the method name in NCBIHandler
+    with live:
+        results = source_handler.get_supplementary_materials(pmc_ids, checkpoint=checkpoint)
+    autotuner = getattr(source_handler, "autotuner", None)
+    if autotuner is not None:
+        from support.autotuner import save_run_stats
+        save_run_stats(output_dir, "efetch", autotuner.stats())
     
     # Display results
     display_service = DisplayService()
     display_service.display_results(results)
     
     # Save results
-    data_collector = DataCollector()
     if results:
         print("\nSaving links to files...")
-        data_collector.batch_save_links(results, source_type="ncbi")
+        data_collector.batch_save_links(results, source_type="ncbi", output_dir=output_dir)
         print("Links saved successfully")
         
+        if not interactive:
+            return
+        
         # If download-only mode is selected, just download files from existing links
         if args.download_only:
             print("Download-only mode: Processing existing link link...")
-            data_collector = DataCollector()
-            output_dir = data_collector.create_date_folder()
-            data_collector.download_all_documents(output_dir)
+            with live:
+                data_collector.download_all_documents(output_dir, checkpoint=checkpoint, oa_bulk=args.oa_bulk,
+                                                      access_manager=access_manager)
             return
         
-        # Ask user if they want to download the files now
-        download_now = input("\nWould you like to download all supplementary materials now? (y/n): ").strip().lower()
+        # A resumed job that had started downloading continues without asking
+        if resumed and checkpoint.get_download_states():
+            download_now = 'y'
+        else:
+            # Ask user if they want to download the files now
+            download_now = input("\nWould you like to download all supplementary materials now? (y/n): ").strip().lower()
         if download_now == 'y' or download_now == 'yes':
             print("\nDownloading supplementary materials...")
-            downloaded_files = data_collector.download_all_documents()
+            with live:
+                downloaded_files = data_collector.download_all_documents(output_dir, checkpoint=checkpoint,
+                                                                         oa_bulk=args.oa_bulk,
+                                                                         access_manager=access_manager)
             
             if downloaded_files > 0:
                 # Ask if user wants to extract zip files
@@ -205,8 +1122,6 @@ def main():
                 if extract_now == 'y' or extract_now == 'yes':
                     print("\nExtracting zip files...")
                     data_collector.extract_zip_files()
-    
-    print("\nDone!")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+RUN_STATS_NAME = "run_stats.json"
+# Longest pause after repeated HTTP 429/503 responses without Retry-After
+MAX_BACKOFF_SECONDS = 60.0
+
+
+def classify_error(error):
+    """
+    Map a request exception to the autotuner's error kinds
+
+    Returns:
+        (kind, retry_after): kind is "throttled" (HTTP 429/503), "timeout",
+        "error" or None for client errors such as 403 or 404, which say
+        nothing about the host's load; retry_after is the server's
+        Retry-After in seconds, if any
+    """
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout", None
+    response = getattr(error, "response", None)
+    if response is not None:
+        if response.status_code in (429, 503):
+            retry_after = response.headers.get("Retry-After", "")
+            return "throttled", float(retry_after) if retry_after.isdigit() else None
+        if 400 <= response.status_code < 500:
+            return None, None
+    return "error", None
+
+
+class _HostState:
+    """Concurrency limit and measurements of one host"""
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.throttled_in_row = 0        # consecutive HTTP 429/503 responses
+        self.baseline_latency = None     # lowest smoothed window latency seen
+        self.previous_throughput = None  # bytes/second of the previous window
+        self.window = []                 # (latency, bytes, error kind) since the last evaluation
+        self.window_started = time.monotonic()
+        self.totals = {"completed": 0, "errors": 0, "throttled": 0, "timeouts": 0, "bytes": 0,
+                       "increases": 0, "decreases": 0, "peak_limit": int(limit)}
+
+
+class ConcurrencyAutotuner:
+    """
+    AIMD controller of the number of concurrent requests per host.
+
+    Every host starts at ``initial`` concurrent requests. After each window
+    of completed requests the controller compares throughput, latency and
+    errors with the previous window: while throughput keeps up and latency
+    stays within ``latency_factor`` of the best seen, the host's limit grows
+    by one (additive increase). HTTP 429/503 responses, timeouts, an error
+    rate above ``max_error_rate`` or rising latency cut it by
+    ``decrease_factor`` (multiplicative decrease), at most once per cooldown
+    so a burst of failures from requests already in flight counts once.
+    A Retry-After header pauses the host for that long; without one the
+    host is paused for cooldown seconds, doubling with every consecutive
+    429/503 up to MAX_BACKOFF_SECONDS.
+
+    Callers wrap each request in acquire()/release(). One instance can be
+    shared by all threads of a stage; every decision is kept for the run
+    stats.
+    """
+
+    def __init__(self, initial=1, minimum=1, maximum=8, window=None, latency_factor=2.0, max_error_rate=0.1,
+                 decrease_factor=0.5, cooldown=2.0):
+        """
+        Args:
+            initial: Concurrent requests per host at the start
+            minimum: Lowest concurrency a host is cut to
+            maximum: Highest concurrency a host may reach
+            window: Completed requests per evaluation (optional, defaults to
+                twice the host's current limit, at least 4)
+            latency_factor: Latency above this multiple of the baseline counts as rising
+            max_error_rate: Share of failed requests in a window tolerated before backing off
+            decrease_factor: Multiplier applied to the limit when backing off
+            cooldown: Minimum seconds between two decreases of one host
+        """
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        self.latency_factor = latency_factor
+        self.max_error_rate = max_error_rate
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.decisions = []
+        self._hosts = {}
+        self._condition = threading.Condition()
+
+    def _host(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = _HostState(self.initial)
+        return self._hosts[host]
+
+    def limit(self, host):
+        """Current concurrency limit of a host"""
+        with self._condition:
+            return int(self._host(host).limit)
+
+    def acquire(self, host):
+        """Block until the host has room for another request"""
+        with self._condition:
+            state = self._host(host)
+            while True:
+                wait = state.paused_until - time.monotonic()
+                if wait <= 0 and state.in_flight < int(state.limit):
+                    state.in_flight += 1
+                    return
+                self._condition.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, host, latency, nbytes=0, error=None, retry_after=None):
+        """
+        Record a finished request and adjust the host's limit
+
+        Args:
+            host: Host the request went to
+            latency: Seconds until the response started (or the request failed)
+            nbytes: Bytes received
+            error: None for success, or "throttled", "timeout" or "error"
+            retry_after: Seconds the server asked to wait (optional)
+        """
+        with self._condition:
+            state = self._host(host)
+            state.in_flight -= 1
+            state.window.append((latency, nbytes, error))
+            totals = state.totals
+            totals["completed"] += 1
+            totals["bytes"] += nbytes
+            if error == "throttled":
+                totals["throttled"] += 1
+            elif error == "timeout":
+                totals["timeouts"] += 1
+            elif error:
+                totals["errors"] += 1
+
+            if error == "throttled":
+                state.throttled_in_row += 1
+                if not retry_after:
+                    retry_after = min(self.cooldown * 2 ** (state.throttled_in_row - 1), MAX_BACKOFF_SECONDS)
+            elif not error:
+                state.throttled_in_row = 0
+            if retry_after:
+                state.paused_until = max(state.paused_until, time.monotonic() + retry_after)
+            if error in ("throttled", "timeout"):
+                self._decrease(host, state, "HTTP 429/503" if error == "throttled" else "timeout")
+            elif len(state.window) >= (self.window or max(4, 2 * int(state.limit))):
+                self._evaluate(host, state)
+            self._condition.notify_all()
+
+    def _evaluate(self, host, state):
+        """Compare the finished window with the previous one and adjust the limit"""
+        window = state.window
+        elapsed = max(time.monotonic() - state.window_started, 1e-6)
+        state.window = []
+        state.window_started = time.monotonic()
+
+        latencies = sorted(latency for latency, _, error in window if not error)
+        errors = sum(1 for _, _, error in window if error)
+        throughput = sum(nbytes for _, nbytes, _ in window) / elapsed
+        latency = latencies[len(latencies) // 2] if latencies else None
+        if latency is not None and (state.baseline_latency is None or latency < state.baseline_latency):
+            state.baseline_latency = latency
+
+        if errors / len(window) > self.max_error_rate:
+            self._decrease(host, state, f"{errors}/{len(window)} requests failed")
+        elif latency is not None and latency > self.latency_factor * state.baseline_latency:
+            self._decrease(host, state, f"latency {latency * 1000:.0f} ms vs "
+                                        f"{state.baseline_latency * 1000:.0f} ms baseline")
+        elif state.previous_throughput is None or throughput >= 0.9 * state.previous_throughput:
+            if state.limit < self.maximum and state.in_flight + 1 >= int(state.limit):
+                self._record(host, state, "increase", state.limit + 1,
+                             f"throughput {throughput / 1024:.0f} KB/s, latency healthy")
+        state.previous_throughput = throughput
+
+    def _decrease(self, host, state, reason):
+        now = time.monotonic()
+        if now - state.last_decrease < self.cooldown or state.limit <= self.minimum:
+            return
+        state.last_decrease = now
+        # Measurements taken at the old limit don't describe the new one
+        state.window = []
+        state.window_started = now
+        state.previous_throughput = None
+        self._record(host, state, "decrease", max(self.minimum, int(state.limit * self.decrease_factor)), reason)
+
+    def _record(self, host, state, action, new_limit, reason):
+        self.decisions.append({
+            "time": time.strftime("%H:%M:%S"),
+            "host": host,
+            "action": action,
+            "from": int(state.limit),
+            "to": int(new_limit),
+            "reason": reason
+        })
+        state.totals["increases" if action == "increase" else "decreases"] += 1
+        state.limit = float(new_limit)
+        state.totals["peak_limit"] = max(state.totals["peak_limit"], int(new_limit))
+
+    def stats(self):
+        """Return the per-host limits and totals and the decision log"""
+        with self._condition:
+            hosts = {host: dict(state.totals, limit=int(state.limit)) for host, state in self._hosts.items()}
+            return {"hosts": hosts, "decisions": list(self.decisions)}
+
+    def summary_lines(self):
+        """Human-readable per-host summary for the run reports"""
+        lines = []
+        for host, totals in self.stats()["hosts"].items():
+            lines.append(f"{host}: concurrency {totals['limit']} (peak {totals['peak_limit']}, "
+                         f"{totals['increases']} up / {totals['decreases']} down), {totals['completed']} requests, "
+                         f"{totals['throttled']} throttled, {totals['timeouts']} timeouts, {totals['errors']} errors")
+        return lines
+
+
+def save_run_stats(output_dir, stage, stats):
+    """
+    Store a stage's statistics in the output directory's run_stats.json
+
+    Args:
+        output_dir: Output directory of the job
+        stage: Stage name, e.g. "efetch" or "download"
+        stats: JSON-serializable statistics (e.g. ConcurrencyAutotuner.stats())
+    """
+    path = Path(output_dir) / RUN_STATS_NAME
+    run_stats = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            run_stats = json.load(f)
+    run_stats[stage] = stats
+    temp_path = path.with_name(f"{RUN_STATS_NAME}.part")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(run_stats, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def load_run_stats(output_dir):
+    """Return the run_stats.json of an output directory, or an empty dictionary"""
+    path = Path(output_dir) / RUN_STATS_NAME
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -1 +1,282 @@
+import hashlib
+import json
+import sqlite3
+import zlib
+import datetime
+import threading
+from pathlib import Path
+from collections import OrderedDict
 
+
+class CacheManager:
+    """
+    Thread-safe in-memory LRU cache for API responses.
+
+    Shared between handlers so that identical requests issued by different
+    queries in the same process are only sent once. Bulky responses that are
+    not asked for twice in a run (full-text payloads) can be kept out of
+    memory with remember=False. With a db_path the
+    responses are also written to SQLite (zlib-compressed), so later runs
+    (and other nodes, through cache bundles) start with them; entries older
+    than ttl seconds are fetched again.
+
+    The database also keeps the supplementary links parsed from each
+    article, so an article is only fetched again once they are stale. Full
+    text bodies are only stored when store_full_text is set: they are large,
+    already kept by the XML archive, and efetch bodies are keyed by the
+    exact batch they were fetched in.
+    """
+
+    def __init__(self, max_entries=1024, db_path=None, ttl=None, store_full_text=False):
+        """
+        Args:
+            max_entries: Maximum number of responses kept in memory
+            db_path: SQLite database keeping the responses between runs (optional)
+            ttl: Age in seconds after which stored responses are stale (optional, never)
+            store_full_text: Also store efetch and full-text bodies in the database
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store_full_text = store_full_text
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if db_path is not None:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            with self.conn:
+                self.conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        value BLOB,
+                        stored_at TEXT
+                    );
+                    CREATE TABLE IF NOT EXISTS links (
+                        pmc_id TEXT PRIMARY KEY,
+                        links TEXT,
+                        stored_at TEXT
+                    );
+                """)
+                # Databases written before compression hold plain values
+                columns = [row[1] for row in self.conn.execute("PRAGMA table_info(responses)")]
+                if "encoding" not in columns:
+                    self.conn.execute("ALTER TABLE responses ADD COLUMN encoding TEXT")
+                cutoff = self._cutoff()
+                if cutoff is not None:
+                    self.conn.execute("DELETE FROM responses WHERE stored_at < ?", (cutoff,))
+                    self.conn.execute("DELETE FROM links WHERE stored_at < ?", (cutoff,))
+
+    @staticmethod
+    def make_key(url, params=None):
+        """Build a cache key from a URL and its query parameters"""
+        parts = [url]
+        for name, value in sorted((params or {}).items()):
+            parts.append(f"{name}={value}")
+        return hashlib.sha256("&".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().isoformat(timespec="seconds")
+
+    def _cutoff(self):
+        """Return the oldest stored_at that is still fresh, or None without a TTL"""
+        if self.ttl is None:
+            return None
+        return (datetime.datetime.now() - datetime.timedelta(seconds=self.ttl)).isoformat(timespec="seconds")
+
+    @staticmethod
+    def _unpack(value, encoding):
+        return zlib.decompress(value) if encoding == "zlib" else value
+
+    def get(self, key, remember=True):
+        """
+        Return the cached value for a key, or None
+
+        Args:
+            key: Cache key
+            remember: Keep a value read from the database in memory
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            if self.conn is not None:
+                row = self.conn.execute("SELECT value, encoding FROM responses WHERE key = ? AND stored_at >= ?",
+                                        (key, self._cutoff() or "")).fetchone()
+                if row is not None:
+                    value = self._unpack(*row)
+                    if remember:
+                        self._remember(key, value)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def _remember(self, key, value):
+        """Keep a value in memory, evicting the least recently used entry if full (called with the lock held)"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, key, value, persist=True, remember=True):
+        """
+        Store a value, evicting the least recently used entry if full
+
+        Args:
+            key: Cache key
+            value: Response body
+            persist: Also write it to the database; False keeps answers that
+                change over time, like search results, for this run only
+            remember: Keep it in memory; False for large responses that are
+                only read again by later runs
+        """
+        with self._lock:
+            if remember:
+                self._remember(key, value)
+            if self.conn is not None and persist:
+                with self.conn:
+                    self.conn.execute("INSERT OR REPLACE INTO responses (key, value, stored_at, encoding) "
+                                      "VALUES (?, ?, ?, 'zlib')", (key, zlib.compress(value), self._now()))
+
+    def clear(self):
+        """Remove all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute("DELETE FROM responses")
+                    self.conn.execute("DELETE FROM links")
+
+    def iter_stored(self, since=None):
+        """
+        Yield (key, value, stored_at) of the fresh responses in the database
+
+        Args:
+            since: Only responses stored at or after this ISO timestamp (optional)
+        """
+        if self.conn is None:
+            return
+        cutoff = max(self._cutoff() or "", since or "")
+        with self._lock:
+            keys = [key for (key,) in self.conn.execute("SELECT key FROM responses WHERE stored_at >= ?", (cutoff,))]
+        for key in keys:
+            with self._lock:
+                row = self.conn.execute("SELECT value, encoding, stored_at FROM responses WHERE key = ?",
+                                        (key,)).fetchone()
+            if row is not None:
+                yield key, self._unpack(row[0], row[1]), row[2]
+
+    def merge(self, entries):
+        """
+        Add responses from another cache; of two responses to the same request the newer one is kept
+
+        Args:
+            entries: Iterable of (key, value, stored_at)
+
+        Returns:
+            Number of responses added or replaced
+        """
+        if self.conn is None:
+            raise ValueError("Merging responses needs a cache database (db_path)")
+        cutoff = self._cutoff() or ""
+        merged = 0
+        with self._lock, self.conn:
+            for key, value, stored_at in entries:
+                if stored_at < cutoff:
+                    continue
+                cursor = self.conn.execute("""
+                    INSERT INTO responses (key, value, stored_at, encoding) VALUES (?, ?, ?, 'zlib')
+                    ON CONFLICT (key) DO UPDATE SET value = excluded.value, stored_at = excluded.stored_at,
+                        encoding = excluded.encoding
+                    WHERE excluded.stored_at > stored_at
+                """, (key, zlib.compress(value), stored_at))
+                if cursor.rowcount:
+                    merged += 1
+                    self._entries.pop(key, None)
+        return merged
+
+    def get_links(self, pmc_ids, chunk_size=500):
+        """
+        Return the fresh supplementary links parsed for articles before
+
+        Returns:
+            Dictionary of PMC ID -> list of links (empty for articles
+            without supplements); articles never parsed are left out
+        """
+        if self.conn is None:
+            return {}
+        pmc_ids = [str(pmc_id) for pmc_id in pmc_ids]
+        found = {}
+        with self._lock:
+            for i in range(0, len(pmc_ids), chunk_size):
+                chunk = pmc_ids[i:i + chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT pmc_id, links FROM links WHERE stored_at >= ? AND pmc_id IN ({placeholders})",
+                    [self._cutoff() or ""] + chunk
+                ).fetchall()
+                found.update((pmc_id, json.loads(links)) for pmc_id, links in rows)
+        return found
+
+    def set_links(self, materials):
+        """Store the links parsed for articles (a dictionary of PMC ID -> links)"""
+        if self.conn is None:
+            return
+        now = self._now()
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO links (pmc_id, links, stored_at) VALUES (?, ?, ?)",
+                                  [(str(pmc_id), json.dumps(list(links)), now) for pmc_id, links in materials.items()])
+
+    def iter_links(self, since=None):
+        """Yield (PMC ID, links, stored_at) of the fresh parsed links in the database"""
+        if self.conn is None:
+            return
+        cutoff = max(self._cutoff() or "", since or "")
+        with self._lock:
+            rows = self.conn.execute("SELECT pmc_id, links, stored_at FROM links WHERE stored_at >= ?",
+                                     (cutoff,)).fetchall()
+        for pmc_id, links, stored_at in rows:
+            yield pmc_id, json.loads(links), stored_at
+
+    def merge_links(self, entries):
+        """
+        Add parsed links from another cache; of two entries for an article the newer one is kept
+
+        Args:
+            entries: Iterable of (PMC ID, links, stored_at)
+
+        Returns:
+            Number of articles added or replaced
+        """
+        if self.conn is None:
+            raise ValueError("Merging links needs a cache database (db_path)")
+        cutoff = self._cutoff() or ""
+        merged = 0
+        with self._lock, self.conn:
+            for pmc_id, links, stored_at in entries:
+                if stored_at < cutoff:
+                    continue
+                cursor = self.conn.execute("""
+                    INSERT INTO links (pmc_id, links, stored_at) VALUES (?, ?, ?)
+                    ON CONFLICT (pmc_id) DO UPDATE SET links = excluded.links, stored_at = excluded.stored_at
+                    WHERE excluded.stored_at > stored_at
+                """, (str(pmc_id), json.dumps(list(links)), stored_at))
+                merged += cursor.rowcount
+        return merged
+
+    def stats(self):
+        """Return the number of responses in memory and in the database, and of articles with parsed links"""
+        stored = articles = 0
+        if self.conn is not None:
+            with self._lock:
+                stored = self.conn.execute("SELECT COUNT(*) FROM responses WHERE stored_at >= ?",
+                                           (self._cutoff() or "",)).fetchone()[0]
+                articles = self.conn.execute("SELECT COUNT(*) FROM links WHERE stored_at >= ?",
+                                             (self._cutoff() or "",)).fetchone()[0]
+        return {"memory": len(self._entries), "stored": stored, "articles": articles, "hits": self.hits,
+                "misses": self.misses}
@@ -1 +1,41 @@
+from pathlib import Path
 
+import yaml
+
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parents[2] / "config" / "config.yaml"
+
+
+class ConfigManager:
+    """
+    Loads application settings from config/config.yaml (or another YAML file).
+    Values are looked up with dotted keys, e.g. ``config.get("ncbi.requests_per_second")``.
+    """
+
+    def __init__(self, config_path=None):
+        """
+        Args:
+            config_path: Path to a YAML file (optional, defaults to config/config.yaml)
+        """
+        self.config_path = Path(config_path) if config_path else DEFAULT_CONFIG_PATH
+        self.data = {}
+        if self.config_path.exists():
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                self.data = yaml.safe_load(f) or {}
+
+    def get(self, key, default=None):
+        """
+        Get a configuration value
+
+        Args:
+            key: Dotted key, e.g. "batch.max_workers"
+            default: Value returned if the key is missing
+
+        Returns:
+            The configured value or the default
+        """
+        value = self.data
+        for part in key.split("."):
+            if not isinstance(value, dict) or part not in value:
+                return default
+            value = value[part]
+        return value
@@ -0,0 +1,111 @@
+import re
+import mimetypes
+from pathlib import PurePosixPath
+
+# Number of leading bytes inspected before a download is accepted
+SNIFF_BYTES = 4096
+
+# Magic numbers of the binary formats commonly attached as supplements
+MAGIC_SIGNATURES = {
+    "pdf": [b"%PDF"],
+    "zip": [b"PK\x03\x04", b"PK\x05\x06"],
+    "ole": [b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"],
+    "gzip": [b"\x1f\x8b"],
+    "png": [b"\x89PNG\r\n\x1a\n"],
+    "jpeg": [b"\xff\xd8\xff"],
+    "gif": [b"GIF87a", b"GIF89a"],
+    "tiff": [b"II*\x00", b"MM\x00*"],
+    "rtf": [b"{\\rtf"],
+    "riff": [b"RIFF"],
+}
+
+# Expected signature family per file extension (Office Open XML files are zips,
+# legacy Office files are OLE compound documents). Only used to warn: supplements
+# are often saved under another format's extension (RTF or HTML as .doc, HTML
+# tables, XML spreadsheets or tab-separated text as .xls) and .gz bodies arrive
+# already decoded when the server sent them with Content-Encoding: gzip
+EXTENSION_FAMILIES = {
+    ".pdf": "pdf",
+    ".zip": "zip", ".docx": "zip", ".xlsx": "zip", ".pptx": "zip", ".odt": "zip", ".ods": "zip",
+    ".doc": "ole", ".xls": "ole", ".ppt": "ole",
+    ".gz": "gzip", ".tgz": "gzip",
+    ".png": "png",
+    ".jpg": "jpeg", ".jpeg": "jpeg",
+    ".gif": "gif",
+    ".tif": "tiff", ".tiff": "tiff",
+    ".rtf": "rtf",
+    ".avi": "riff", ".wav": "riff",
+}
+
+# Only a doctype or root element marks a page: <title>, <head> and <body> also
+# occur in SVG, JATS XML and plain text tables
+HTML_MARKER = re.compile(rb"<!doctype html|<html[\s>]")
+# Word and Excel documents saved as HTML declare the Office namespaces
+OFFICE_HTML_MARKER = re.compile(rb"urn:schemas-microsoft-com:office")
+HTML_EXTENSIONS = {".html", ".htm", ".xhtml"}
+# Markup and text formats that may mention HTML elements themselves; they are
+# only rejected as HTML when the server also declares text/html
+TEXT_EXTENSIONS = {".xml", ".svg", ".kml", ".gpx", ".txt", ".csv", ".tsv", ".tab", ".json", ".md", ".tex"}
+
+
+def expected_mimetype(filename):
+    """Guess the mimetype a supplement should have from its filename (as given by the JATS <media> href)"""
+    return mimetypes.guess_type(filename)[0]
+
+
+def looks_like_html(head):
+    """Check whether the first bytes of a response are an HTML page (not an Office document saved as HTML)"""
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    return HTML_MARKER.search(text[:1024]) is not None and OFFICE_HTML_MARKER.search(text) is None
+
+
+def matches_family(head, family):
+    """Check the first bytes against the magic numbers of a signature family"""
+    signatures = MAGIC_SIGNATURES[family]
+    if family == "riff":
+        return head.startswith(b"RIFF")
+    return any(head.startswith(signature) for signature in signatures)
+
+
+def detect_family(head):
+    """Return the signature family the first bytes belong to, or None for text and unknown formats"""
+    return next((family for family in MAGIC_SIGNATURES if matches_family(head, family)), None)
+
+
+def sniff_content(head, filename, content_type=""):
+    """
+    Decide from the first bytes of a response whether it is the file or an error page
+
+    Only empty bodies, HTML pages and pages declared as text/html are
+    rejected. Content that doesn't match the extension's format is accepted
+    with a warning, as many supplements are saved under another extension.
+
+    Args:
+        head: Up to SNIFF_BYTES leading bytes of the response body
+        filename: Name of the supplement being downloaded
+        content_type: Declared Content-Type header (optional)
+
+    Returns:
+        Tuple of (accepted, reason); reason explains a rejection, or the
+        format mismatch of an accepted file, and is None otherwise
+    """
+    extension = PurePosixPath(filename).suffix.lower()
+    declared = (content_type or "").split(";")[0].strip().lower()
+
+    if not head:
+        return False, "Empty response body"
+
+    if (extension not in HTML_EXTENSIONS and looks_like_html(head)
+            and (extension not in TEXT_EXTENSIONS or declared == "text/html")):
+        return False, (f"Received HTML instead of file data (possible access restriction). "
+                       f"Content type: {declared or 'unknown'}, expected: {expected_mimetype(filename) or extension}")
+
+    family = EXTENSION_FAMILIES.get(extension)
+    if family is not None and not matches_family(head, family):
+        if declared == "text/html" and OFFICE_HTML_MARKER.search(head) is None:
+            return False, (f"Received an error page instead of file data (declared content type: text/html, "
+                           f"expected: {expected_mimetype(filename) or extension})")
+        return True, (f"Content does not match the expected {extension} format ({detect_family(head) or 'text'} "
+                      f"data, declared content type: {declared or 'unknown'})")
+
+    return True, None
@@ -0,0 +1,116 @@
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+# Archives that extract_zip_files unpacks next to themselves
+EXPANDED_EXTENSIONS = {".zip"}
+
+
+class DiskSpaceGuard:
+    """
+    Admission control for downloads and extractions based on free disk space.
+
+    Before a transfer starts, the bytes it will need (Content-Length, plus the
+    expected unpacked size of archives) are checked against the free space of
+    the target volume minus a reserve left for other services on the machine.
+    Transfers that don't fit wait, re-checking periodically, so the queue
+    pauses while the disk is full and resumes once space is freed; after
+    wait_seconds the transfer is deferred instead.
+
+    Admitted bytes stay reserved until the transfer finishes, so concurrent
+    downloads can't all claim the same free space. One instance is shared by
+    every downloader in the process.
+    """
+
+    def __init__(self, reserve_bytes=512 * 1024 ** 2, zip_expansion=3.0, wait_seconds=600, poll_seconds=15):
+        """
+        Args:
+            reserve_bytes: Free space always left on the volume
+            zip_expansion: Expected unpacked size of a zip file as a multiple of its size
+            wait_seconds: How long a transfer waits for space before it is deferred (None waits forever)
+            poll_seconds: Interval between free space checks while waiting
+        """
+        self.reserve_bytes = reserve_bytes
+        self.zip_expansion = zip_expansion
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.reserved = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def free_bytes(path):
+        """Free space of the volume holding path (or its nearest existing parent)"""
+        path = Path(path).resolve()
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        return shutil.disk_usage(path).free
+
+    def expected_bytes(self, content_length, filename):
+        """
+        Estimate the disk space a download will use
+
+        Args:
+            content_length: Size announced by the server (None if unknown)
+            filename: Name the file is saved as
+
+        Returns:
+            Number of bytes, including the unpacked contents of archives
+        """
+        size = int(content_length or 0)
+        if os.path.splitext(filename)[1].lower() in EXPANDED_EXTENSIONS:
+            size += int(size * self.zip_expansion)
+        return size
+
+    def _try_reserve(self, nbytes, path):
+        with self._lock:
+            available = self.free_bytes(path) - self.reserved - self.reserve_bytes
+            if nbytes <= available:
+                self.reserved += nbytes
+                return True, available
+        return False, available
+
+    def admit(self, nbytes, path, description="", wait=True):
+        """
+        Reserve space for a transfer, waiting while the volume is too full
+
+        Args:
+            nbytes: Bytes the transfer needs
+            path: Directory the data is written to
+            description: Name shown while waiting (optional)
+            wait: Wait for space to be freed; if False, fail at once (e.g. in the
+                middle of a stream the server would time out)
+
+        Returns:
+            True if the space was reserved (release it afterwards), False if
+            it didn't become available within wait_seconds
+        """
+        deadline = None if self.wait_seconds is None else time.monotonic() + self.wait_seconds
+        admitted, available = self._try_reserve(nbytes, path)
+        if admitted or not wait:
+            return admitted
+
+        from support.logging_service import Logger
+        logger = Logger.get_instance()
+        message = (f"Pausing {description or 'transfer'}: needs {nbytes / 1024 ** 2:.1f} MB, "
+                   f"{max(available, 0) / 1024 ** 2:.1f} MB available on {path} "
+                   f"(keeping {self.reserve_bytes / 1024 ** 2:.0f} MB free)")
+        logger.warning(message)
+        print(f"⏸️ {message}")
+
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(self.poll_seconds if deadline is None else
+                       max(0.0, min(self.poll_seconds, deadline - time.monotonic())))
+            admitted, available = self._try_reserve(nbytes, path)
+            if admitted:
+                logger.info(f"Resuming {description or 'transfer'}: disk space available")
+                print(f"▶️ Resuming {description or 'transfer'}")
+                return True
+        return False
+
+    def release(self, nbytes):
+        """Return space reserved by admit() once the transfer has finished"""
+        with self._lock:
+            self.reserved = max(0, self.reserved - nbytes)
+
@@ -1,10 +1,344 @@
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+from support.supplement_results import SupplementResults
+
+
+def _format_bytes(nbytes):
+    """Format a byte count as B/KB/MB/GB"""
+    for unit in ("B", "KB", "MB"):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GB"
+
+
+def _format_duration(seconds):
+    """Format seconds as H:MM:SS or M:SS"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class StageCounter:
+    """
+    Thread-safe progress counters of one pipeline stage.
+
+    Workers only bump integers under a lock; rates, queue depth and ETA are
+    computed by the progress board when it renders, so counting costs next to
+    nothing in the hot loops.
+    """
+
+    def __init__(self, name, unit="items"):
+        self.name = name
+        self.unit = unit
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.active = 0
+        self.nbytes = 0
+        self.started = time.monotonic()
+        self._samples = deque()  # (time, done, bytes) taken at each render, for recent rates
+        self._lock = threading.Lock()
+
+    def add_total(self, count):
+        """Announce count more items of work (concurrent runs add up)"""
+        with self._lock:
+            self.total += count
+
+    def begin(self):
+        """Mark an item as in flight"""
+        with self._lock:
+            self.active += 1
+
+    def end(self, nbytes=0):
+        """Mark an item as no longer in flight after transferring nbytes"""
+        with self._lock:
+            self.active = max(0, self.active - 1)
+            self.nbytes += nbytes
+
+    def add(self, count=1, nbytes=0):
+        """Count completed items and transferred bytes (count=0 reports bytes of a running transfer)"""
+        with self._lock:
+            self.done += count
+            self.nbytes += nbytes
+
+    def fail(self, count=1):
+        """Count failed items"""
+        with self._lock:
+            self.failed += count
+
+    def finish(self, nbytes=0, failed=False):
+        """Mark an in-flight item as done (or failed) after transferring nbytes"""
+        with self._lock:
+            self.active = max(0, self.active - 1)
+            self.nbytes += nbytes
+            if failed:
+                self.failed += 1
+            else:
+                self.done += 1
+
+    def snapshot(self, rate_window=10.0):
+        """
+        Return the counters with rates over the last rate_window seconds
+
+        Returns:
+            Dictionary with name, unit, total, done, failed, active, queued,
+            bytes, rate (items/s), byte_rate (bytes/s), eta (seconds or None)
+        """
+        now = time.monotonic()
+        with self._lock:
+            done, failed, active, nbytes, total = self.done, self.failed, self.active, self.nbytes, self.total
+            self._samples.append((now, done, nbytes))
+            while len(self._samples) > 2 and now - self._samples[0][0] > rate_window:
+                self._samples.popleft()
+            first_time, first_done, first_bytes = self._samples[0]
+        if now - first_time < 1e-3:
+            first_time, first_done, first_bytes = self.started, 0, 0
+        elapsed = max(now - first_time, 1e-3)
+        rate = (done - first_done) / elapsed
+        remaining = max(0, total - done - failed)
+        return {
+            "name": self.name,
+            "unit": self.unit,
+            "total": total,
+            "done": done,
+            "failed": failed,
+            "active": active,
+            "queued": max(0, remaining - active),
+            "bytes": nbytes,
+            "rate": rate,
+            "byte_rate": (nbytes - first_bytes) / elapsed,
+            "eta": remaining / rate if rate > 0 and remaining else None,
+        }
+
+
+class _LiveStream:
+    """Console stream that lifts the live progress block before other output is written"""
+
+    def __init__(self, stream, board):
+        self._stream = stream
+        self._board = board
+
+    def write(self, text):
+        with self._board._render_lock:
+            self._board._clear_block()
+            written = self._stream.write(text)
+            if text:
+                self._board._at_line_start = text.endswith("\n")
+            return written
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class ProgressBoard:
+    """
+    Live per-stage progress view of a run.
+
+    Stages register StageCounter objects through stage(); while the board is
+    live a daemon thread renders every stage at a fixed, low frequency. On a
+    terminal the block of stage lines is redrawn in place (other console
+    output is printed above it); otherwise one plain line per stage is
+    written every line_interval seconds so log files stay readable. Code
+    with per-item console output checks ``live`` and stays quiet while the
+    board reports progress instead.
+    """
+
+    _instance = None  # Singleton instance shared by all stages
+
+    @classmethod
+    def get_instance(cls):
+        """Get or create the singleton ProgressBoard"""
+        if cls._instance is None:
+            cls._instance = ProgressBoard()
+        return cls._instance
+
+    def __init__(self):
+        self.live = False
+        self.interval = 0.5
+        self.line_interval = 15.0
+        self._stages = {}
+        self._stages_lock = threading.Lock()
+        self._render_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._tty = False
+        self._stream = None
+        self._saved_streams = None
+        self._block_lines = 0
+        self._at_line_start = True
+        self._started = time.monotonic()
+
+    def stage(self, name, unit="items"):
+        """Return the counters of a stage, creating them on first use"""
+        with self._stages_lock:
+            if name not in self._stages:
+                self._stages[name] = StageCounter(name, unit)
+            return self._stages[name]
+
+    def snapshots(self):
+        """Return a snapshot of every stage in registration order"""
+        with self._stages_lock:
+            stages = list(self._stages.values())
+        return [stage.snapshot() for stage in stages]
+
+    def start(self, interval=0.5, line_interval=15.0, stream=None):
+        """
+        Start rendering the stages from a background thread
+
+        Args:
+            interval: Seconds between redraws on a terminal
+            line_interval: Seconds between progress lines when the output is
+                not a terminal
+            stream: Output stream (optional, defaults to sys.stdout)
+        """
+        if self.live:
+            return
+
+        with self._stages_lock:
+            self._stages = {}
+        self.interval = interval
+        self.line_interval = line_interval
+        self._stream = stream or sys.stdout
+        self._tty = hasattr(self._stream, "isatty") and self._stream.isatty()
+        self._started = time.monotonic()
+        self._block_lines = 0
+        self._at_line_start = True
+
+        # Per-item INFO messages would scroll the block away: keep them in
+        # the log file, and let everything else on the console pass above it
+        handlers = self._console_handlers()
+        self._saved_streams = (sys.stdout, sys.stderr, [(handler, handler.level, handler.stream) for handler in handlers])
+        for handler in handlers:
+            handler.setLevel(max(handler.level, logging.WARNING))
+            if self._tty:
+                handler.setStream(_LiveStream(handler.stream, self))
+        if self._tty:
+            sys.stdout = _LiveStream(sys.stdout, self)
+            sys.stderr = _LiveStream(sys.stderr, self)
+
+        self.live = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="progress-board", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the render thread, leaving the final state on the console"""
+        if not self.live:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._render()
+        self.live = False
+        stdout, stderr, handlers = self._saved_streams
+        if self._tty:
+            sys.stdout, sys.stderr = stdout, stderr
+        for handler, level, stream in handlers:
+            handler.setLevel(level)
+            handler.setStream(stream)
+        self._saved_streams = None
+
+    @staticmethod
+    def _console_handlers():
+        """Return the logging handlers writing to the console (the application's and the root logger's)"""
+        from support.logging_service import Logger
+
+        handlers = Logger.get_instance().logger.handlers + logging.getLogger().handlers
+        return [handler for handler in handlers
+                if type(handler) is logging.StreamHandler and handler.stream in (sys.stdout, sys.stderr)]
+
+    def _run(self):
+        """Render until stopped"""
+        wait = self.interval if self._tty else self.line_interval
+        while not self._stop.wait(wait):
+            try:
+                self._render()
+            except Exception:
+                # The view must never take the run down with it
+                pass
+
+    def lines(self):
+        """Render the stages as display lines"""
+        lines = []
+        for snap in self.snapshots():
+            progress = f"{snap['done']}/{snap['total']}" if snap["total"] else f"{snap['done']}"
+            percent = f" {100 * (snap['done'] + snap['failed']) / snap['total']:3.0f}%" if snap["total"] else ""
+            eta = _format_duration(snap["eta"]) if snap["eta"] is not None else "--"
+            lines.append(f"{snap['name']:<10} {progress} {snap['unit']}{percent} | {snap['rate']:.1f}/s"
+                         f" | {_format_bytes(snap['byte_rate'])}/s | {snap['active']} active, {snap['queued']} queued"
+                         f" | {snap['failed']} errors | ETA {eta}")
+        return lines
+
+    def _clear_block(self):
+        """Erase the block drawn last (terminal mode, called with the render lock held)"""
+        if self._block_lines:
+            self._stream.write(f"\x1b[{self._block_lines}F\x1b[J")
+            self._stream.flush()
+            self._block_lines = 0
+
+    def _render(self):
+        """Draw the current state of every stage"""
+        lines = self.lines()
+        if not lines:
+            return
+        elapsed = _format_duration(time.monotonic() - self._started)
+        with self._render_lock:
+            if self._tty:
+                # Don't draw into the middle of a line something else is writing
+                if not self._at_line_start:
+                    return
+                self._clear_block()
+                self._stream.write("\n".join([f"⏱️  Live progress ({elapsed})"] + lines) + "\n")
+                self._block_lines = len(lines) + 1
+            else:
+                stamp = time.strftime("%H:%M:%S")
+                self._stream.write("".join(f"[{stamp} +{elapsed}] {line}\n" for line in lines))
+            self._stream.flush()
+
+    def __enter__(self):
+        self.start(self.interval, self.line_interval, self._stream)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
 class DisplayService:
+    def live_progress(self, interval=0.5, line_interval=15.0, stream=None):
+        """
+        Return the live progress board, to be used as a context manager
+        
+        Args:
+            interval: Seconds between redraws on a terminal
+            line_interval: Seconds between progress lines in non-terminal output
+            stream: Output stream (optional, defaults to sys.stdout)
+        
+        Returns:
+            The shared ProgressBoard, configured but not started
+        """
+        board = ProgressBoard.get_instance()
+        if not board.live:
+            board.interval = interval
+            board.line_interval = line_interval
+            board._stream = stream
+        return board
+    
     def display_results(self, results):
         """
         Display the results of the supplementary materials search
         
         Args:
-            results: Dictionary with PMC IDs as keys and lists of links as values
+            results: Dictionary (or SupplementResults) with PMC IDs as keys and lists of links as values
         """
         if not results:
             print("No results to display.")
@@ -13,13 +347,16 @@ class DisplayService:
         print("\n🔍 Search Results Summary:")
         print(f"📚 Articles with supplementary materials: {len(results)}")
         
-        total_links = sum(len(links) for links in results.values() if links)
+        if isinstance(results, SupplementResults):
+            total_links = results.link_count()
+        else:
+            total_links = sum(len(links) for links in results.values() if links)
         print(f"📎 Total supplementary materials found: {total_links}")
         
         # Display some samples if there are many results
         if len(results) > 5:
             print("\n📋 Sample of articles with supplementary materials:")
-            for pmc_id, links in list(results.items())[:5]:
+            for pmc_id, links in islice(results.items(), 5):
                 if links:
                     print(f"  • PMC{pmc_id}: {len(links)} supplementary files")
             print(f"  • ... and {len(results) - 5} more articles")
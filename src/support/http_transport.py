@@ -0,0 +1,158 @@
+import http.client
+from types import SimpleNamespace
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import httpx
+    import h2  # noqa: F401 (httpx needs it for HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTP2_AVAILABLE = False
+
+# Connection-specific headers are not allowed in HTTP/2 requests
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade", "te"}
+
+
+class _ResponseStream:
+    """
+    File-like body of an httpx response, standing in for urllib3's raw response
+
+    requests reads it through read(), closes it through close() and
+    release_conn(), and takes Set-Cookie headers from ``_original_response``.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self._chunks = response.iter_bytes()
+        self._buffer = bytearray()
+        self._done = False
+        message = http.client.HTTPMessage()
+        for name, value in response.headers.multi_items():
+            message[name] = value
+        self._original_response = SimpleNamespace(msg=message)
+
+    def read(self, amt=None, **_kwargs):
+        try:
+            while not self._done and (amt is None or len(self._buffer) < amt):
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    self._done = True
+                    self._response.close()
+                else:
+                    self._buffer += chunk
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(e)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        size = len(self._buffer) if amt is None else min(amt, len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        self._response.close()
+
+    def release_conn(self):
+        self.close()
+
+
+class HTTP2Adapter(BaseAdapter):
+    """
+    requests transport adapter sending requests over HTTP/2 with httpx.
+
+    Mounted on a requests.Session, it lets every handler and the downloader
+    keep using the requests API while concurrent requests to a host are
+    multiplexed as streams over a few shared connections instead of one
+    connection (and TCP+TLS handshake) each. The protocol is negotiated per
+    connection with ALPN, so hosts without HTTP/2 are served over HTTP/1.1.
+
+    httpx errors are raised as the matching requests exceptions, so callers'
+    error handling and the autotuner's error classification are unchanged.
+    Per-request ``verify``, ``cert`` and ``proxies`` arguments are not
+    supported; the client's defaults (certificate verification on) apply.
+    """
+
+    def __init__(self, max_connections=10, http1=True):
+        """
+        Args:
+            max_connections: Connections kept open across all hosts; each
+                carries many concurrent streams
+            http1: Allow falling back to HTTP/1.1; False sends HTTP/2 even
+                over plain http:// ("prior knowledge", for h2c servers)
+        """
+        if not HTTP2_AVAILABLE:
+            raise ImportError("HTTP/2 needs the httpx and h2 packages (pip install 'httpx[http2]')")
+        super().__init__()
+        self._client = httpx.Client(
+            http1=http1,
+            http2=True,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            follow_redirects=False  # The requests session follows them
+        )
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        """Send a PreparedRequest and return a requests.Response"""
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        headers = [(name, value) for name, value in request.headers.items()
+                   if name.lower() not in HOP_BY_HOP_HEADERS]
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else request.body
+        httpx_request = self._client.build_request(
+            request.method, request.url, headers=headers, content=body,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+        try:
+            response = self._client.send(httpx_request, stream=True)
+        except httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(e, request=request)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+        result = requests.Response()
+        result.status_code = response.status_code
+        result.headers = CaseInsensitiveDict(response.headers)
+        result.encoding = get_encoding_from_headers(result.headers)
+        result.raw = _ResponseStream(response)
+        result.reason = response.reason_phrase
+        result.url = request.url
+        result.request = request
+        result.connection = self
+        result.http_version = response.http_version
+        if not stream:
+            result.content  # Read the body now, like HTTPAdapter does
+        return result
+
+    def close(self):
+        self._client.close()
+
+
+def create_session(http2=False, pool_connections=10, pool_maxsize=20, http2_max_connections=10):
+    """
+    Create the HTTP session shared by the handlers and the downloader
+
+    Args:
+        http2: Send https:// requests over HTTP/2 (falls back to the pooled
+            HTTP/1.1 adapter if httpx or h2 isn't installed)
+        pool_connections: Hosts whose HTTP/1.1 connection pools are kept
+        pool_maxsize: HTTP/1.1 connections kept per host
+        http2_max_connections: HTTP/2 connections kept across all hosts
+
+    Returns:
+        requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if http2:
+        if HTTP2_AVAILABLE:
+            session.mount("https://", HTTP2Adapter(max_connections=http2_max_connections))
+        else:
+            print("⚠️ HTTP/2 needs the httpx and h2 packages (pip install 'httpx[http2]'); using HTTP/1.1")
+    return session
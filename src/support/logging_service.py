@@ -1,5 +1,4 @@
 import logging
-import os
 import sys
 from datetime import datetime
 from pathlib import Path
@@ -85,14 +84,15 @@ class Logger:
             console_handler.setLevel(logging.INFO)
             console_handler.setFormatter(console_formatter)
             
-            # Create and configure file handlers
+            # Create and configure file handlers; the files are only opened on
+            # the first record, so short runs that log nothing don't touch them
             # All logs go to app.log
-            app_file_handler = logging.FileHandler(self.app_log_path, encoding='utf-8')
+            app_file_handler = logging.FileHandler(self.app_log_path, encoding='utf-8', delay=True)
             app_file_handler.setLevel(logging.DEBUG)
             app_file_handler.setFormatter(file_formatter)
             
             # Only errors and critical logs go to errors.log
-            error_file_handler = logging.FileHandler(self.error_log_path, encoding='utf-8')
+            error_file_handler = logging.FileHandler(self.error_log_path, encoding='utf-8', delay=True)
             error_file_handler.setLevel(logging.ERROR)
             error_file_handler.setFormatter(file_formatter)
             
@@ -101,18 +101,6 @@ class Logger:
             self.logger.addHandler(app_file_handler)
             self.logger.addHandler(error_file_handler)
             
-            # Test logging to verify it works
-            self.info(f"Logging initialized. Logs directory: {logs_dir.absolute()}")
-            self.info(f"Error log: {self.error_log_path.absolute()}")
-            self.info(f"App log: {self.app_log_path.absolute()}")
-            self.debug("This is a test DEBUG message")
-            
-            # Verify that files exist and are writable
-            if not os.access(self.error_log_path, os.W_OK):
-                print(f"⚠️ Warning: Error log file is not writable: {self.error_log_path}")
-            if not os.access(self.app_log_path, os.W_OK):
-                print(f"⚠️ Warning: App log file is not writable: {self.app_log_path}")
-                
         except Exception as e:
             print(f"❌ Error setting up logger: {str(e)}")
             raise
@@ -1 +1,199 @@
+import sqlite3
+import threading
+import time
 
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting how many requests are sent per second.
+
+    A single instance can be shared by every handler and worker thread in the
+    process so that the combined request rate stays within the API's limits
+    (NCBI E-utilities allows 3 requests/second without an API key).
+    """
+
+    def __init__(self, requests_per_second=3.0, burst=1):
+        """
+        Args:
+            requests_per_second: Sustained request rate
+            burst: Number of requests that may be sent back to back
+        """
+        self.rate = float(requests_per_second)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedRateLimiter:
+    """
+    Token bucket stored in an SQLite database, so that several processes or
+    hosts (sharing the database file) stay within one global request budget.
+    Drop-in replacement for RateLimiter.
+
+    Like the work queue, the database uses the rollback journal by default;
+    WAL is only safe when every participant runs on the same machine.
+    """
+
+    def __init__(self, db_path, requests_per_second=3.0, burst=1, name="default", journal_mode="DELETE"):
+        """
+        Args:
+            db_path: Path of the database holding the bucket (e.g. the work queue database)
+            requests_per_second: Sustained request rate shared by all participants
+            burst: Number of requests that may be sent back to back
+            name: Bucket name, allowing separate budgets in one database
+            journal_mode: SQLite journal mode, "DELETE" (shared storage) or
+                "WAL" (local disk only); use the work queue's when sharing its database
+
+        Raises:
+            ValueError: Unsupported journal mode
+        """
+        journal_mode = journal_mode.upper()
+        if journal_mode not in ("DELETE", "TRUNCATE", "PERSIST", "WAL"):
+            raise ValueError(f"Unsupported journal mode: {journal_mode}")
+        self.rate = float(requests_per_second)
+        self.capacity = max(1, int(burst))
+        self.name = name
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, tokens REAL, last_refill REAL)"
+        )
+
+    def _try_take(self):
+        """Take a token if one is available; otherwise return the seconds to wait"""
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = cursor.execute(
+                    "SELECT tokens, last_refill FROM rate_buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                tokens, last_refill = row if row else (float(self.capacity), now)
+                tokens = min(self.capacity, tokens + max(0.0, now - last_refill) * self.rate)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / self.rate
+                cursor.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (name, tokens, last_refill) VALUES (?, ?, ?)",
+                    (self.name, tokens, now)
+                )
+                cursor.execute("COMMIT")
+                return wait
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            wait = self._try_take()
+            if wait == 0.0:
+                return
+            time.sleep(wait)
+
+
+class ByteRateLimiter:
+    """
+    Thread-safe token bucket limiting how many bytes are transferred per second,
+    overall and per host.
+
+    Transfers consume tokens as chunks arrive; a chunk larger than the
+    remaining budget puts the bucket into debt and the caller sleeps until it
+    is paid off, so concurrent downloads share the configured bandwidth
+    instead of each getting the full rate.
+    """
+
+    def __init__(self, bytes_per_second=None, host_rates=None, default_host_rate=None, burst_seconds=1.0):
+        """
+        Args:
+            bytes_per_second: Combined rate of all transfers (optional, unlimited if omitted)
+            host_rates: Dictionary of host -> bytes per second (optional)
+            default_host_rate: Rate of each host not in host_rates (optional, unlimited if omitted)
+            burst_seconds: Seconds of transfer that may be sent at full speed after an idle period
+        """
+        self.burst_seconds = burst_seconds
+        self.host_rates = dict(host_rates or {})
+        self.default_host_rate = default_host_rate
+        self._overall = self._bucket(bytes_per_second)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, rate):
+        if not rate:
+            return None
+        rate = float(rate)
+        capacity = max(rate * self.burst_seconds, 1.0)
+        return {"rate": rate, "capacity": capacity, "tokens": capacity, "last_refill": time.monotonic()}
+
+    def _host_bucket(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = self._bucket(self.host_rates.get(host, self.default_host_rate))
+        return self._hosts[host]
+
+    def consume(self, host, nbytes):
+        """
+        Account for nbytes transferred from a host, blocking while over the limits
+
+        Args:
+            host: Host name the bytes came from
+            nbytes: Number of bytes transferred
+        """
+        wait = 0.0
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self._host_bucket(host), self._overall):
+                if bucket is None:
+                    continue
+                bucket["tokens"] = min(bucket["capacity"],
+                                       bucket["tokens"] + (now - bucket["last_refill"]) * bucket["rate"])
+                bucket["last_refill"] = now
+                bucket["tokens"] -= nbytes
+                if bucket["tokens"] < 0:
+                    wait = max(wait, -bucket["tokens"] / bucket["rate"])
+        if wait > 0:
+            time.sleep(wait)
+
+    def throttle(self, host, chunks):
+        """Yield the chunks of a transfer, pacing them to the limits"""
+        for chunk in chunks:
+            self.consume(host, len(chunk))
+            yield chunk
+
+    def wrap(self, host, fileobj):
+        """Wrap a readable file object (e.g. a streamed response body) so reads are paced"""
+        return _ThrottledReader(self, host, fileobj)
+
+
+class _ThrottledReader:
+    """Readable file object consuming ByteRateLimiter tokens for every read"""
+
+    def __init__(self, limiter, host, fileobj):
+        self._limiter = limiter
+        self._host = host
+        self._fileobj = fileobj
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._limiter.consume(self._host, len(data))
+        return data
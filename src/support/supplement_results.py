@@ -0,0 +1,258 @@
+import os
+import re
+from array import array
+from collections.abc import MutableMapping
+
+# URL prefixes stored once instead of per link; "{pmc_id}" is filled in when a
+# link is rebuilt. Index 0 (no prefix) holds links that match none of them.
+DEFAULT_PREFIXES = (
+    "",
+    "https://pmc.ncbi.nlm.nih.gov/articles/instance/{pmc_id}/bin/",
+    "https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{pmc_id}/bin/",
+)
+
+# Substrings common in supplement file names (publisher naming schemes and
+# extensions); each is stored as a single byte 0x80 + index. At most 128.
+SUFFIX_TOKENS = (
+    "_MOESM", "_ESM.pdf", "_ESM.docx", "_ESM.xlsx", "_ESM.doc", "_ESM.xls", "_ESM.zip", "_ESM.mp4",
+    "_ESM.txt", "_ESM.csv", "_ESM.", "_ESM",
+    ".pdf", ".docx", ".xlsx", ".doc", ".xls", ".csv", ".tsv", ".txt", ".zip", ".gz", ".tar", ".xml",
+    ".jpeg", ".jpg", ".png", ".gif", ".tif", ".tiff", ".eps", ".mp4", ".avi", ".mov", ".wmv", ".pptx", ".ppt",
+    "media-", "mmc", "DataSheet", "Data_Sheet_", "Table", "Image", "Video", "Figure", "Presentation",
+    "supplement", "Supplementary", "supplementary", "Supp", "NIHMS", "Appendix", "_app", "_s0", "_S",
+    "jmir_v", "_2019_", "_2020_", "_2021_", "_2022_", "_2023_", "_2024_", "_2025_", "_2026_",
+)
+_TOKEN_PATTERN = re.compile("|".join(re.escape(token) for token in sorted(SUFFIX_TOKENS, key=len, reverse=True)))
+_TOKEN_CODES = {token: chr(0x80 + i) for i, token in enumerate(SUFFIX_TOKENS)}
+_CODE_PATTERN = re.compile("[\x80-\xff]")
+
+_UTF8_FLAG = 0x80        # set on a link's prefix index when its suffix is stored as plain UTF-8
+_DELETED = 0xFFFFFFFF    # tombstone in the lookup table
+
+
+def _encode_token(match):
+    return _TOKEN_CODES[match.group()]
+
+
+def _decode_token(match):
+    return SUFFIX_TOKENS[ord(match.group()) - 0x80]
+
+
+class SupplementResults(MutableMapping):
+    """
+    Compact, dict-like container of supplementary material links per article.
+
+    Behaves like the ``{pmc_id: [url, ...]}`` dictionaries the pipeline passes
+    around (string keys, list-of-URL values), but stores everything in flat
+    arrays instead of one string object per link:
+
+    - PMC IDs as 32-bit integers, found through an open-addressing table
+    - the URL prefix as one byte per link (the "/bin/" path is shared)
+    - the rest of each link in one byte buffer, with common file name parts
+      coded as single bytes and each link front-coded against the previous
+      link of its article (an article's files usually share a name stem)
+
+    URL strings are only built when a value is read. Unlike a dict, replacing
+    an article's links moves it to the end of the iteration order.
+    """
+
+    __slots__ = ("_prefixes", "_row_ids", "_row_starts", "_row_counts", "_link_prefixes", "_link_shared",
+                 "_link_ends", "_suffixes", "_table", "_table_used", "_dead")
+
+    def __init__(self, data=None, prefixes=DEFAULT_PREFIXES):
+        """
+        Args:
+            data: Mapping or iterable of (pmc_id, links) pairs to add (optional)
+            prefixes: URL prefixes shared by many links (optional, at most 128)
+        """
+        self._prefixes = list(prefixes)
+        self._row_ids = array("I")         # PMC ID of each row
+        self._row_starts = array("I")      # index of the row's first link
+        self._row_counts = array("I")      # number of links of the row
+        self._link_prefixes = array("B")   # prefix of each link (| _UTF8_FLAG)
+        self._link_shared = array("B")     # characters shared with the previous link of the row
+        self._link_ends = array("I")       # end offset of each link in _suffixes
+        self._suffixes = bytearray()
+        self._table = array("I", bytes(4 * 8))  # row + 1 per slot, 0 = empty
+        self._table_used = 0               # occupied slots, tombstones included
+        self._dead = set()                 # rows replaced or deleted
+        if data is not None:
+            self.update(data)
+
+    @staticmethod
+    def _key(pmc_id):
+        """Normalize a PMC ID ("PMC123", "123" or 123) to an integer; KeyError if it doesn't fit 32 bits"""
+        if isinstance(pmc_id, int):
+            key = pmc_id
+        else:
+            key = str(pmc_id)
+            if key[:3].upper() == "PMC":
+                key = key[3:]
+            if not key.isdigit():
+                raise KeyError(pmc_id)
+            key = int(key)
+        if not 0 <= key <= 0xFFFFFFFF:
+            raise KeyError(pmc_id)
+        return key
+
+    def _slot(self, key):
+        """Return (slot holding the key, or the free slot it would go in, found)"""
+        table = self._table
+        mask = len(table) - 1
+        i = (key * 0x9E3779B1) & mask
+        free = None
+        while True:
+            entry = table[i]
+            if entry == 0:
+                return (i if free is None else free), False
+            if entry == _DELETED:
+                if free is None:
+                    free = i
+            elif self._row_ids[entry - 1] == key:
+                return i, True
+            i = (i + 1) & mask
+
+    def _resize(self):
+        """Rebuild the lookup table, dropping tombstones"""
+        capacity = 8
+        while capacity < 4 * len(self):
+            capacity *= 2
+        self._table = array("I", bytes(4 * capacity))
+        self._table_used = 0
+        for row in self._live_rows():
+            slot, _ = self._slot(self._row_ids[row])
+            self._table[slot] = row + 1
+            self._table_used += 1
+
+    def _find(self, pmc_id):
+        """Return the row of an article, or None"""
+        try:
+            key = self._key(pmc_id)
+        except KeyError:
+            return None
+        slot, found = self._slot(key)
+        return self._table[slot] - 1 if found else None
+
+    def __setitem__(self, pmc_id, links):
+        key = self._key(pmc_id)
+        links = list(links)  # Iterators have no length and can only be read once
+        if 2 * (self._table_used + 1) > len(self._table):
+            self._resize()
+        row = len(self._row_ids)
+        self._row_ids.append(key)
+        try:
+            self._row_starts.append(len(self._link_ends))
+            self._row_counts.append(len(links))
+            row_prefixes = [(i, prefix.replace("{pmc_id}", str(key)))
+                            for i, prefix in enumerate(self._prefixes) if prefix]
+            previous = ""
+            for link in links:
+                prefix_index = 0
+                for i, prefix in row_prefixes:
+                    if link.startswith(prefix):
+                        prefix_index = i
+                        link = link[len(prefix):]
+                        break
+                if link.isascii():
+                    link = _TOKEN_PATTERN.sub(_encode_token, link)
+                    shared = min(len(os.path.commonprefix((previous, link))), 255)
+                    self._suffixes += link[shared:].encode("latin-1")
+                    previous = link
+                else:
+                    # Non-ASCII names would collide with the token codes; keep them as UTF-8
+                    prefix_index |= _UTF8_FLAG
+                    shared = 0
+                    self._suffixes += link.encode("utf-8")
+                    previous = ""
+                self._link_prefixes.append(prefix_index)
+                self._link_shared.append(shared)
+                self._link_ends.append(len(self._suffixes))
+        except BaseException:
+            # A link that can't be stored leaves the article's previous links in place
+            self._dead.add(row)
+            raise
+
+        # Only point the table at the row once it is complete
+        slot, found = self._slot(key)
+        if found:
+            self._dead.add(self._table[slot] - 1)
+        elif self._table[slot] == 0:
+            self._table_used += 1
+        self._table[slot] = row + 1
+
+    def _links(self, row):
+        """Build the URLs of a row"""
+        key = str(self._row_ids[row])
+        start = self._row_starts[row]
+        links = []
+        previous = ""
+        for position in range(start, start + self._row_counts[row]):
+            data = self._suffixes[self._link_ends[position - 1] if position else 0:self._link_ends[position]]
+            prefix_index = self._link_prefixes[position]
+            if prefix_index & _UTF8_FLAG:
+                suffix = data.decode("utf-8")
+                previous = ""
+            else:
+                previous = previous[:self._link_shared[position]] + data.decode("latin-1")
+                suffix = _CODE_PATTERN.sub(_decode_token, previous)
+            prefix = self._prefixes[prefix_index & ~_UTF8_FLAG]
+            links.append(prefix.replace("{pmc_id}", key) + suffix if prefix else suffix)
+        return links
+
+    def __getitem__(self, pmc_id):
+        row = self._find(pmc_id)
+        if row is None:
+            raise KeyError(pmc_id)
+        return self._links(row)
+
+    def __delitem__(self, pmc_id):
+        try:
+            slot, found = self._slot(self._key(pmc_id))
+        except KeyError:
+            found = False
+        if not found:
+            raise KeyError(pmc_id)
+        self._dead.add(self._table[slot] - 1)
+        self._table[slot] = _DELETED
+
+    def __contains__(self, pmc_id):
+        return self._find(pmc_id) is not None
+
+    def _live_rows(self):
+        if not self._dead:
+            return iter(range(len(self._row_ids)))
+        return (row for row in range(len(self._row_ids)) if row not in self._dead)
+
+    def __iter__(self):
+        return (str(self._row_ids[row]) for row in self._live_rows())
+
+    def items(self):
+        return ((str(self._row_ids[row]), self._links(row)) for row in self._live_rows())
+
+    def __len__(self):
+        return len(self._row_ids) - len(self._dead)
+
+    def __repr__(self):
+        return f"SupplementResults({len(self)} articles, {self.link_count()} links)"
+
+    def count(self, pmc_id):
+        """Number of links of an article, without building the URLs"""
+        row = self._find(pmc_id)
+        if row is None:
+            raise KeyError(pmc_id)
+        return self._row_counts[row]
+
+    def link_count(self):
+        """Total number of links, without building the URLs"""
+        return sum(self._row_counts) - sum(self._row_counts[row] for row in self._dead)
+
+    def to_dict(self):
+        """Return a plain dictionary (e.g. for JSON serialization)"""
+        return dict(self.items())
+
+    def __getstate__(self):
+        return self.to_dict(), self._prefixes
+
+    def __setstate__(self, state):
+        data, prefixes = state
+        self.__init__(data, prefixes)
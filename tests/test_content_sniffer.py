@@ -0,0 +1,54 @@
+"""
+Accepting supplements by their first bytes.
+
+Run with: python -m unittest discover tests
+"""
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from support.content_sniffer import sniff_content  # noqa: E402
+
+EXCEL_HTML = (b'<html xmlns:o="urn:schemas-microsoft-com:office:office" '
+              b'xmlns:x="urn:schemas-microsoft-com:office:excel"><body><table><tr><td>1</td></tr></table>')
+
+
+class SniffContentTest(unittest.TestCase):
+    def test_matching_content_is_accepted(self):
+        self.assertEqual(sniff_content(b"%PDF-1.7\n", "media-1.pdf", "application/pdf"), (True, None))
+
+    def test_other_formats_under_an_extension_are_kept_with_a_warning(self):
+        cases = [
+            (b"{\\rtf1\\ansi", "Table S1.doc", "application/msword"),
+            (EXCEL_HTML, "Table S2.xls", "application/vnd.ms-excel"),
+            (EXCEL_HTML, "Table S3.xls", "text/html"),
+            (b'<?xml version="1.0"?>\n<?mso-application progid="Excel.Sheet"?>\n<Workbook>', "S4.xls", ""),
+            (b"gene\tfold change\nTP53\t2.1\n", "S5.xls", "application/octet-stream"),
+            # Sent with Content-Encoding: gzip and decoded on the way
+            (b"gene,count\nTP53,12\n", "counts.csv.gz", "application/gzip"),
+        ]
+        for head, filename, content_type in cases:
+            with self.subTest(filename=filename):
+                accepted, reason = sniff_content(head, filename, content_type)
+                self.assertTrue(accepted)
+                self.assertIn("does not match", reason)
+
+    def test_pages_are_rejected(self):
+        cases = [
+            (b"<!DOCTYPE html>\n<html><head><title>Sign in</title>", "media-1.pdf", "text/html"),
+            (b"<html><body>Checking your browser", "data.xlsx", "application/octet-stream"),
+            (b"<h1>403 Forbidden</h1>", "media-2.pdf", "text/html; charset=utf-8"),
+            (b"", "media-3.pdf", "application/pdf"),
+        ]
+        for head, filename, content_type in cases:
+            with self.subTest(head=head):
+                self.assertFalse(sniff_content(head, filename, content_type)[0])
+
+    def test_text_formats_mentioning_html_are_accepted(self):
+        self.assertEqual(sniff_content(b"<html> tags per page\n12\n", "counts.txt", "text/plain"), (True, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
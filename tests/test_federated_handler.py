@@ -0,0 +1,262 @@
+"""
+Federated search and Europe PMC fetching against local stand-in servers.
+
+Run with: python -m unittest discover tests
+"""
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from core.source_handlers.base_handler import IncompleteFetchError  # noqa: E402
+from core.source_handlers.europepmc_handler import EuropePMCHandler  # noqa: E402
+from core.source_handlers.federated_handler import FederatedHandler  # noqa: E402
+from core.source_handlers.ncbi_handler import NCBIHandler  # noqa: E402
+from infrastructure.xml_archive import XmlArchive  # noqa: E402
+from support.cache_manager import CacheManager  # noqa: E402
+from support.rate_limiter import RateLimiter  # noqa: E402
+
+ARTICLE_XML = ('<article>{properties}<front><article-meta><article-id pub-id-type="{id_type}">{pmc_id}</article-id>'
+               '</article-meta></front><body><supplementary-material><media xmlns:xlink="http://www.w3.org/1999/xlink" '
+               'xlink:href="media-{n}.pdf"/></supplementary-material></body></article>')
+
+
+class StandInServer:
+    """
+    Local server answering NCBI esearch/efetch and Europe PMC search/fullTextXML
+
+    Europe PMC has no full text for the IDs in ``no_full_text`` (HTTP 404)
+    and fails with HTTP 500 for the IDs in ``broken``; efetch marks the IDs
+    in ``open_access`` as Open Access.
+    """
+
+    def __init__(self, ncbi_ids, europepmc_ids, no_full_text=(), broken=(), open_access=()):
+        self.requests = []
+        lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, body, content_type="text/xml"):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self.answer(urlparse(self.path), parse_qs(self.rfile.read(length).decode()))
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                self.answer(url, parse_qs(url.query))
+
+            def answer(self, url, query):
+                params = {key: values[0] for key, values in query.items()}
+                endpoint = url.path.rsplit("/", 1)[-1].replace(".fcgi", "")
+                with lock:
+                    server.requests.append((endpoint, url.path, params))
+
+                if endpoint == "esearch":
+                    start, count = int(params.get("retstart", 0)), int(params["retmax"])
+                    result = {"count": str(len(ncbi_ids)), "idlist": [str(i) for i in ncbi_ids[start:start + count]]}
+                    self.reply(json.dumps({"esearchresult": result}).encode(), "application/json")
+                elif endpoint == "efetch":
+                    ids = params["id"].replace("%2C", ",").split(",")
+                    articles = "".join(ARTICLE_XML.format(id_type="pmc", pmc_id=i, n=i, properties=(
+                        "<?properties open_access?>" if int(i) in open_access else "")) for i in ids)
+                    self.reply(f"<pmc-articleset>{articles}</pmc-articleset>".encode())
+                elif endpoint == "search":
+                    start = 0 if params["cursorMark"] == "*" else int(params["cursorMark"])
+                    page = europepmc_ids[start:start + int(params["pageSize"])]
+                    results = [{"pmcid": f"PMC{i}", "doi": f"10.1000/{i}", "title": f"Article {i}"} for i in page]
+                    body = {"hitCount": len(europepmc_ids), "nextCursorMark": str(start + len(page)),
+                            "resultList": {"result": results}}
+                    self.reply(json.dumps(body).encode(), "application/json")
+                elif endpoint == "fullTextXML":
+                    pmc_id = url.path.split("/")[-2][3:]
+                    if int(pmc_id) in broken:
+                        self.send_error(500)
+                    elif int(pmc_id) in no_full_text:
+                        self.send_error(404)
+                    else:
+                        body = '<?xml version="1.0"?>\n' + ARTICLE_XML.format(id_type="pmcid", pmc_id=f"PMC{pmc_id}",
+                                                                             n=pmc_id, properties="")
+                        self.reply(body.encode())
+                else:
+                    self.send_error(404)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def full_text_ids(self):
+        return [path.split("/")[-2][3:] for endpoint, path, _ in self.requests if endpoint == "fullTextXML"]
+
+    def efetch_ids(self):
+        return [i for endpoint, _, params in self.requests if endpoint == "efetch"
+                for i in params["id"].replace("%2C", ",").split(",")]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class RecordingCheckpoint:
+    """JobCheckpoint stand-in remembering the completed batches"""
+
+    def __init__(self):
+        self.completed = []
+
+    def get_results(self):
+        return {}
+
+    def is_batch_done(self, batch_ids):
+        return list(batch_ids) in self.completed
+
+    def complete_batch(self, batch_ids, materials):
+        self.completed.append(list(batch_ids))
+
+
+def make_handlers(base_url):
+    ncbi = NCBIHandler(rate_limiter=RateLimiter(requests_per_second=1000, burst=10))
+    ncbi.base_url = f"{base_url}/eutils"
+    europepmc = EuropePMCHandler(rate_limiter=RateLimiter(requests_per_second=1000, burst=10),
+                                 base_url=f"{base_url}/europepmc")
+    return {"NCBI": ncbi, "EuropePMC": europepmc}
+
+
+class FederatedHandlerTest(unittest.TestCase):
+    def start(self, ncbi_ids, europepmc_ids, **kwargs):
+        server = StandInServer(ncbi_ids, europepmc_ids, **kwargs)
+        self.addCleanup(server.close)
+        handlers = make_handlers(server.base_url)
+        federated = FederatedHandler(handlers)
+        self.addCleanup(federated.close)
+        return server, handlers, federated
+
+    def run_quietly(self, function, *args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function(*args, **kwargs)
+
+    def test_search_merges_sources_without_duplicates(self):
+        _, _, federated = self.start(list(range(1, 6)), list(range(3, 9)))
+        article_ids = self.run_quietly(federated.search_articles, "query", 100)
+        self.assertEqual(sorted(article_ids, key=int), [str(i) for i in range(1, 9)])
+        self.assertEqual(federated.search_stats["NCBI"]["unique"] + federated.search_stats["EuropePMC"]["unique"], 8)
+
+    def test_search_stops_at_max_results(self):
+        _, _, federated = self.start(list(range(1, 21)), list(range(11, 31)))
+        article_ids = self.run_quietly(federated.search_articles, "query", 5)
+        self.assertEqual(len(article_ids), 5)
+        self.assertEqual(len(set(article_ids)), 5)
+
+    def test_each_article_is_fetched_once(self):
+        server, _, federated = self.start(list(range(1, 6)), list(range(3, 9)))
+        article_ids = self.run_quietly(federated.search_articles, "query", 100)
+        materials = self.run_quietly(federated.get_supplementary_materials, article_ids)
+        self.assertEqual(sorted(materials, key=int), [str(i) for i in range(1, 9)])
+        fetched = server.full_text_ids() + server.efetch_ids()
+        self.assertEqual(sorted(fetched, key=int), [str(i) for i in range(1, 9)])
+
+    def test_articles_without_full_text_are_fetched_from_ncbi(self):
+        server, handlers, federated = self.start([], [101, 102, 103], no_full_text={102})
+        article_ids = self.run_quietly(federated.search_articles, "query", 100)
+        materials = self.run_quietly(federated.get_supplementary_materials, article_ids)
+        self.assertEqual(sorted(materials), ["101", "102", "103"])
+        self.assertEqual(materials["102"], ["https://pmc.ncbi.nlm.nih.gov/articles/instance/102/bin/media-102.pdf"])
+        self.assertEqual(server.efetch_ids(), ["102"])
+        self.assertEqual(handlers["EuropePMC"].missing_full_text, {"102"})
+
+
+class NCBIHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer([], [], open_access={301})
+        self.addCleanup(self.server.close)
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cache_path = Path(temp_dir.name) / "cache.sqlite3"
+
+    def fetch(self, article_ids, **cache_options):
+        self.handler = make_handlers(self.server.base_url)["NCBI"]
+        self.handler.cache = CacheManager(db_path=self.cache_path, **cache_options)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.handler.get_supplementary_materials(article_ids)
+
+    def test_open_access_status_is_recorded(self):
+        self.fetch(["301", "302"])
+        records = self.handler.metadata.store.get_many(["301", "302", "303"])
+        self.assertEqual({pmc_id: record["open_access"] for pmc_id, record in records.items()},
+                         {"301": True, "302": False})
+
+    def test_parsed_links_are_reused(self):
+        first = self.fetch(["301", "302"])
+        second = self.fetch(["302", "303", "301"])
+        self.assertEqual(second["301"], first["301"])
+        self.assertEqual(sorted(second), ["301", "302", "303"])
+        self.assertEqual(self.server.efetch_ids(), ["301", "302", "303"])
+
+    def test_efetch_bodies_are_only_stored_when_asked(self):
+        self.fetch(["401"])
+        cache = CacheManager(db_path=self.cache_path)
+        self.assertEqual(list(cache.iter_stored()), [])
+        self.assertEqual(list(cache.get_links(["401"])), ["401"])
+
+        self.fetch(["402"], store_full_text=True)
+        [(_, body, _)] = cache.iter_stored()
+        self.assertIn(b'<article-id pub-id-type="pmc">402<', body)
+
+
+class EuropePMCHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer([], [201, 202, 203], no_full_text={202}, broken={203})
+        self.addCleanup(self.server.close)
+        self.handler = EuropePMCHandler(rate_limiter=RateLimiter(requests_per_second=1000, burst=10),
+                                        base_url=f"{self.server.base_url}/europepmc")
+
+    def fetch(self, article_ids, checkpoint=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.handler.get_supplementary_materials(article_ids, checkpoint=checkpoint)
+
+    def test_missing_full_text_is_reported(self):
+        materials = self.fetch(["201", "202"])
+        self.assertEqual(list(materials), ["201"])
+        self.assertEqual(self.handler.missing_full_text, {"202"})
+
+    def test_failed_request_raises_incomplete_fetch(self):
+        checkpoint = RecordingCheckpoint()
+        with self.assertRaises(IncompleteFetchError) as raised:
+            self.fetch(["201", "203"], checkpoint=checkpoint)
+        self.assertEqual(list(raised.exception.results), ["201"])
+        self.assertEqual(checkpoint.completed, [])
+        self.assertNotIn("203", self.handler.missing_full_text)
+
+    def test_full_text_is_archived(self):
+        with tempfile.TemporaryDirectory() as archive_dir:
+            self.handler.xml_archive = XmlArchive(archive_dir)
+            self.fetch(["201"])
+            self.assertIn("201", self.handler.xml_archive)
+            self.assertIn(b'pub-id-type="pmcid">PMC201<', self.handler.xml_archive.read("201"))
+
+    def test_complete_batches_are_checkpointed(self):
+        checkpoint = RecordingCheckpoint()
+        self.fetch(["201"], checkpoint=checkpoint)
+        self.assertEqual(checkpoint.completed, [["201"]])
+        # A batch with an article Europe PMC can't serve is left for the next source
+        self.fetch(["201", "202"], checkpoint=checkpoint)
+        self.assertEqual(checkpoint.completed, [["201"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Round trips through the compact SupplementResults container.
+
+Run with: python -m unittest discover tests
+"""
+import pickle
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from support.supplement_results import SupplementResults  # noqa: E402
+
+INSTANCE = "https://pmc.ncbi.nlm.nih.gov/articles/instance/{pmc_id}/bin/{name}"
+LEGACY = "https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{pmc_id}/bin/{name}"
+
+
+class SupplementResultsTest(unittest.TestCase):
+    def assertRoundTrip(self, data):
+        results = SupplementResults(data)
+        self.assertEqual(results.to_dict(), data)
+        self.assertEqual(len(results), len(data))
+        self.assertEqual(results.link_count(), sum(len(links) for links in data.values()))
+        for pmc_id, links in data.items():
+            self.assertEqual(results[pmc_id], links)
+            self.assertEqual(results.count(pmc_id), len(links))
+        return results
+
+    def test_prefixes(self):
+        self.assertRoundTrip({
+            "101": [INSTANCE.format(pmc_id=101, name="media-1.pdf"), LEGACY.format(pmc_id=101, name="data.xlsx")],
+            # A prefix of another article's ID is kept as part of the link
+            "102": [INSTANCE.format(pmc_id=101, name="media-2.pdf")],
+            "103": ["https://example.org/files/supplement.zip", "relative/path.txt", ""],
+        })
+
+    def test_tokens_and_front_coding(self):
+        names = ["12888_2024_5123_MOESM1_ESM.pdf", "12888_2024_5123_MOESM2_ESM.docx",
+                 "12888_2024_5123_MOESM10_ESM.xlsx", "Data_Sheet_1.pdf", "Table1.DOCX", "mmc1.csv"]
+        self.assertRoundTrip({"7654321": [INSTANCE.format(pmc_id=7654321, name=name) for name in names]})
+
+    def test_non_ascii_names(self):
+        self.assertRoundTrip({
+            "55": [INSTANCE.format(pmc_id=55, name="Übersicht_ESM.pdf"), INSTANCE.format(pmc_id=55, name="表1.xlsx"),
+                   INSTANCE.format(pmc_id=55, name="Table_ESM.pdf")],
+        })
+
+    def test_key_forms(self):
+        results = SupplementResults({"PMC42": ["a.pdf"]})
+        self.assertEqual(results["42"], ["a.pdf"])
+        self.assertEqual(results[42], ["a.pdf"])
+        self.assertEqual(results["pmc42"], ["a.pdf"])
+        self.assertEqual(list(results), ["42"])
+        self.assertNotIn("43", results)
+        self.assertNotIn("not-an-id", results)
+
+    def test_replacement(self):
+        results = SupplementResults({"1": ["a.pdf"], "2": ["b.pdf"]})
+        results["1"] = ["c.pdf", "d.pdf"]
+        self.assertEqual(results.to_dict(), {"2": ["b.pdf"], "1": ["c.pdf", "d.pdf"]})
+        self.assertEqual(results.link_count(), 3)
+
+    def test_deletion(self):
+        results = SupplementResults({str(i): [f"{i}.pdf"] for i in range(1, 50)})
+        for i in range(1, 50, 2):
+            del results[str(i)]
+        with self.assertRaises(KeyError):
+            del results["1"]
+        results["1"] = ["again.pdf"]
+        expected = {str(i): [f"{i}.pdf"] for i in range(2, 50, 2)}
+        expected["1"] = ["again.pdf"]
+        self.assertEqual(results.to_dict(), expected)
+        self.assertEqual(results.link_count(), 25)
+
+    def test_iterator_values(self):
+        results = SupplementResults()
+        results["5"] = (link for link in ["a.pdf", "b.pdf"])
+        results["6"] = ["c.pdf"]
+        self.assertEqual(results.to_dict(), {"5": ["a.pdf", "b.pdf"], "6": ["c.pdf"]})
+        self.assertEqual(results.link_count(), 3)
+
+    def test_invalid_keys_leave_the_container_unchanged(self):
+        results = SupplementResults({"1": ["a.pdf"]})
+        for key in (2 ** 33, -1, "PMC99999999999", "abc"):
+            with self.assertRaises(KeyError):
+                results[key] = ["x.pdf"]
+        with self.assertRaises(AttributeError):
+            results["1"] = ["b.pdf", None]
+        results["2"] = ["c.pdf"]
+        self.assertEqual(results.to_dict(), {"1": ["a.pdf"], "2": ["c.pdf"]})
+        self.assertEqual(results.link_count(), 2)
+
+    def test_pickle(self):
+        data = {"9": [INSTANCE.format(pmc_id=9, name="media-1.pdf")], "10": ["x.txt"]}
+        self.assertEqual(pickle.loads(pickle.dumps(SupplementResults(data))).to_dict(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()